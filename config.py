@@ -14,9 +14,56 @@ class Config:
     DB_PASSWORD = os.getenv('DB_PASSWORD', '')
     DB_PORT = os.getenv('DB_PORT', '5432')
 
+    # Database pool
+    DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))  # секунды ожидания свободного соединения
+    DB_POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', '30'))  # SELECT 1 после простоя, сек
+
+    # Пул потоков для блокирующих вызовов репозиториев (по умолчанию = размеру пула БД)
+    DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', str(DB_POOL_MAX)))
+    DB_EXECUTOR_QUEUE_WARN = int(os.getenv('DB_EXECUTOR_QUEUE_WARN', '50'))  # предупреждение в лог при такой очереди
+
+    # Снимок состава тайм-групп в памяти (сек); мутаторы бота сбрасывают его сразу
+    ROSTER_CACHE_TTL = float(os.getenv('ROSTER_CACHE_TTL', '300'))
+
+    # Кэш готового группового обзора (/today, /tomorrow, /ondate)
+    OVERVIEW_CACHE_TTL = float(os.getenv('OVERVIEW_CACHE_TTL', '120'))
+    OVERVIEW_CACHE_SIZE = int(os.getenv('OVERVIEW_CACHE_SIZE', '64'))
+
+    # Кэш прав (role, is_approved) по user_id; смена прав из бота сбрасывает запись сразу
+    ACCESS_CACHE_TTL = float(os.getenv('ACCESS_CACHE_TTL', '300'))
+    ACCESS_CACHE_SIZE = int(os.getenv('ACCESS_CACHE_SIZE', '1024'))
+
+    # Окно (дней) взвешенной справедливости для /assign_duties_fair
+    DUTY_FAIR_WINDOW_DAYS = int(os.getenv('DUTY_FAIR_WINDOW_DAYS', '30'))
+
+    # Выгрузка /export: строк за один FETCH серверного курсора и сколько держать в памяти до сброса на диск
+    EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '5000'))
+    EXPORT_SPOOL_MAX_BYTES = int(os.getenv('EXPORT_SPOOL_MAX_BYTES', str(8 * 1024 * 1024)))
+
+    # Несколько реплик бота на одной БД: сброс кэшей рассылается через LISTEN/NOTIFY
+    CACHE_BUS = os.getenv('CACHE_BUS', '0').strip().lower() in ('1', 'true', 'yes')
+    CACHE_BUS_CHANNEL = os.getenv('CACHE_BUS_CHANNEL', 'bot_cache')
+    # Триггеры БД шлют события изменений таблиц — кэши видят и правки мимо бота (ручной SQL, другие процессы)
+    CACHE_DB_EVENTS = os.getenv('CACHE_DB_EVENTS', '0').strip().lower() in ('1', 'true', 'yes')
+    CACHE_EVENTS_CHANNEL = os.getenv('CACHE_EVENTS_CHANNEL', 'bot_changes')
+
     # Bot
     BOT_TOKEN = os.getenv('BOT_TOKEN', '')
 
+    # Режим получения обновлений: polling (по умолчанию) или webhook за локальным reverse proxy
+    BOT_MODE = os.getenv('BOT_MODE', 'polling').strip().lower()
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')          # публичный адрес прокси, без пути
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')                 # X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+    # Сколько обновлений обрабатывать одновременно (1 — строго по очереди);
+    # обновления одного чата всё равно идут по порядку
+    CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '8'))
+
     # Default settings
     DEFAULT_EPOCH_DATE = os.getenv('DEFAULT_EPOCH_DATE', '2025-08-28')
     DEFAULT_SCHEDULE = os.getenv('DEFAULT_SCHEDULE', 'стандартный')
@@ -19,17 +19,16 @@ def _row_to_dict(row) -> Dict[str, Any]:
 def create_absence(user_id: int, absence_type: str, date_from: date, date_to: date,
                    comment: Optional[str], author_id: int) -> Optional[int]:
     try:
-        with db_connection.get_connection().cursor() as cur:
+        with db_connection.acquire() as conn, conn.cursor() as cur:
             cur.execute("""
                 INSERT INTO user_absences (user_id, absence_type, date_from, date_to, comment, created_by)
                 VALUES (%s, %s, %s, %s, %s, %s)
                 RETURNING id
             """, (user_id, absence_type, date_from, date_to, comment, author_id))
             new_id = cur.fetchone()[0]
-            db_connection.get_connection().commit()
+            conn.commit()
             return new_id
     except Exception as e:
-        db_connection.get_connection().rollback()
         logger.error(f"create_absence error: {e}")
         return None
 
@@ -37,7 +36,7 @@ def update_absence(absence_id: int, user_id: int, date_from: Optional[date] = No
                    date_to: Optional[date] = None, comment: Optional[str] = None,
                    editor_id: Optional[int] = None, is_admin: bool = False) -> bool:
     try:
-        with db_connection.get_connection().cursor() as cur:
+        with db_connection.acquire() as conn, conn.cursor() as cur:
             # Проверка прав
             if not is_admin:
                 cur.execute("SELECT 1 FROM user_absences WHERE id=%s AND user_id=%s AND is_deleted=FALSE",
@@ -57,16 +56,15 @@ def update_absence(absence_id: int, user_id: int, date_from: Optional[date] = No
             if not fields: return True
             params.append(absence_id)
             cur.execute(f"UPDATE user_absences SET {', '.join(fields)} WHERE id=%s AND is_deleted=FALSE", params)
-            db_connection.get_connection().commit()
+            conn.commit()
             return cur.rowcount > 0
     except Exception as e:
-        db_connection.get_connection().rollback()
         logger.error(f"update_absence error: {e}")
         return False
 
 def soft_delete_absence(absence_id: int, user_id: int, is_admin: bool = False) -> bool:
     try:
-        with db_connection.get_connection().cursor() as cur:
+        with db_connection.acquire() as conn, conn.cursor() as cur:
             if not is_admin:
                 cur.execute("""
                     UPDATE user_absences SET is_deleted=TRUE, updated_at=NOW()
@@ -77,10 +75,9 @@ def soft_delete_absence(absence_id: int, user_id: int, is_admin: bool = False) -
                     UPDATE user_absences SET is_deleted=TRUE, updated_at=NOW()
                     WHERE id=%s AND is_deleted=FALSE
                 """, (absence_id,))
-            db_connection.get_connection().commit()
+            conn.commit()
             return cur.rowcount > 0
     except Exception as e:
-        db_connection.get_connection().rollback()
         logger.error(f"soft_delete_absence error: {e}")
         return False
 
@@ -100,7 +97,7 @@ def list_absences(user_id: Optional[int] = None, absence_type: Optional[str] = N
         ORDER BY date_from DESC, id DESC
         LIMIT 200
     """
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(sql, params)
         rows = cur.fetchall()
         return [_row_to_dict(r) for r in rows]
@@ -132,7 +129,7 @@ def list_absences_with_users(absence_type: Optional[str] = None,
         ORDER BY ua.date_from DESC, ua.id DESC
         LIMIT 300
     """
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(sql, params)
         rows = cur.fetchall()
         out = []
@@ -159,11 +156,36 @@ def get_absence_on_date(user_id: int, target_date) -> Optional[Dict[str, Any]]:
         ORDER BY date_from DESC, id DESC
         LIMIT 1
     """
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(sql, (user_id, target_date, target_date))
         row = cur.fetchone()
         return _row_to_dict(row) if row else None
 
+def list_absence_intervals(from_date: date, to_date: date,
+                           user_ids: Optional[List[int]] = None) -> Dict[int, List[tuple]]:
+    """
+    Активные отсутствия, пересекающие [from_date, to_date], без LIMIT:
+    {user_id: [(date_from, date_to), ...]} по возрастанию date_from.
+    Нужна поиску ближайшей смены (logic.duty) — одним запросом на всех.
+    """
+    where, params = ["is_deleted=FALSE", "date_to >= %s", "date_from <= %s"], [from_date, to_date]
+    if user_ids is not None:
+        if not user_ids:
+            return {}
+        where.append("user_id = ANY(%s)"); params.append(list(user_ids))
+    sql = f"""
+        SELECT user_id, date_from, date_to
+        FROM user_absences
+        WHERE {' AND '.join(where)}
+        ORDER BY user_id, date_from
+    """
+    out: Dict[int, List[tuple]] = {}
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        for uid, d_from, d_to in cur.fetchall():
+            out.setdefault(int(uid), []).append((d_from, d_to))
+    return out
+
 # --- compatibility alias for old handlers imports ---
 def list_absences_period(*args, **kwargs):
     # просто прокидываем параметры в уже существующую функцию
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш прав доступа: user_id → (role, is_approved), LRU + TTL.
+
+Читается одним запросом (user_settings → user_roles, плюс users.role и
+users.is_approved, если такие колонки есть). get_access() — одобрение по
+user_settings (AuthManager), command_access() — по users, как проверяют
+декораторы require_* (через Principal). Мутаторы прав сбрасывают запись синхронно, сразу после
+коммита: AuthManager.promote_to_admin/demote_from_admin,
+UserRepository.approve_user/remove_user/create_user. TTL страхует от правок
+в обход бота. Попадания/промахи видны в /admin_perf (кэш "access").
+"""
+import logging
+from typing import NamedTuple, Optional, Tuple
+
+from config import config
+from utils.cache import TTLCache
+from . import cache_bus
+from .connection import db_connection
+from .schema import schema_caps
+
+logger = logging.getLogger(__name__)
+
+ROLE_USER = "user"
+ROLE_ADMIN = "admin"
+
+_cache = TTLCache(
+    "access",
+    maxsize=int(config.ACCESS_CACHE_SIZE),
+    ttl=float(config.ACCESS_CACHE_TTL),
+)
+
+
+class _Access(NamedTuple):
+    role: str
+    is_approved: bool           # user_settings.is_approved
+    command_approved: bool      # users.is_approved (нет колонки — True); нет строки users — как is_approved
+
+
+def _load(user_id: int) -> _Access:
+    users_role = schema_caps.users_role
+    users_approved = schema_caps.users_is_approved
+    sql = f"""
+        SELECT ur.name, us.is_approved, u.user_id IS NOT NULL,
+               {"u.role" if users_role else "NULL"}, {"u.is_approved" if users_approved else "TRUE"}
+        FROM (SELECT %s::bigint AS user_id) x
+        LEFT JOIN user_settings us ON us.user_id = x.user_id
+        LEFT JOIN user_roles ur    ON ur.id = us.role_id
+        LEFT JOIN users u          ON u.user_id = x.user_id
+    """
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute(sql, (int(user_id),))
+        role_name, settings_approved, registered, users_role_name, users_ok = cur.fetchone()
+    roles = {str(r).strip().lower() for r in (role_name, users_role_name) if r}
+    role = ROLE_ADMIN if ROLE_ADMIN in roles else ROLE_USER
+    settings_approved = bool(settings_approved)
+    return _Access(role, settings_approved, bool(users_ok) if registered else settings_approved)
+
+
+def _get(user_id: int) -> _Access:
+    return _cache.get_or_compute(int(user_id), lambda: _load(user_id))
+
+
+def get_access(user_id: int) -> Tuple[str, bool]:
+    """(role, is_approved) пользователя; неизвестный — ("user", False)."""
+    a = _get(user_id)
+    return a.role, a.is_approved
+
+
+def command_access(user_id: int) -> Tuple[str, bool]:
+    """(role, одобрен) для декораторов require_*; при промахе — запрос в БД (через run_blocking)."""
+    a = _get(user_id)
+    return a.role, a.command_approved
+
+
+def peek_command_access(user_id: int) -> Optional[Tuple[str, bool]]:
+    """То же из кэша без обращения к БД (для цикла событий); None — записи нет."""
+    a = _cache.peek(int(user_id))
+    return None if a is None else (a.role, a.command_approved)
+
+
+def invalidate_access(user_id: Optional[int] = None) -> None:
+    """Сбросить запись пользователя (или весь кэш без аргумента)."""
+    if user_id is None:
+        _cache.invalidate()
+    else:
+        _cache.invalidate(int(user_id))
+    cache_bus.publish("access", user_id)
+
+
+def access_stats() -> dict:
+    return _cache.stats()
+
+
+cache_bus.register("access", lambda key: invalidate_access(int(key) if key else None))
@@ -0,0 +1,192 @@
+# database/cache_bus.py
+# -*- coding: utf-8 -*-
+"""
+Рассылка сброса кэшей между репликами бота через PostgreSQL LISTEN/NOTIFY.
+
+Кэши (состав групп, права, username, календарь, версия локаций, схема)
+живут в памяти процесса. Когда реплик несколько, сброс в одной должен
+дойти до остальных:
+
+    publish("roster")            # после invalidate_roster() здесь
+    register("roster", lambda key: invalidate_roster())   # в модуле кэша
+
+publish() шлёт pg_notify(CACHE_BUS_CHANNEL, {"o": реплика, "t": тема, "k": ключ}).
+Слушатель (start() из post_init) держит отдельное соединение с LISTEN и
+разбирает уведомления в цикле asyncio; свои уведомления пропускаются.
+Тот же слушатель принимает события триггеров БД (database.change_events).
+Пока обработчик применяет чужой сброс, publish() в этом потоке молчит —
+иначе реплики пересылали бы сброс друг другу по кругу.
+
+Выключено по умолчанию (CACHE_BUS=0): одной реплике рассылка не нужна.
+"""
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from config import config
+from .connection import db_connection
+
+logger = logging.getLogger(__name__)
+
+ORIGIN = uuid.uuid4().hex[:12]
+RECONNECT_DELAY = 5.0
+
+_handlers: Dict[str, Callable[[Optional[str]], None]] = {}
+_applying = threading.local()
+
+
+def register(topic: str, handler: Callable[[Optional[str]], None]) -> None:
+    """handler(key) вызывается, когда другая реплика сбросила кэш темы topic."""
+    _handlers[topic] = handler
+
+
+def publish(topic: str, key=None, cur=None) -> None:
+    """
+    Сообщить другим репликам о сбросе. cur — курсор открытой транзакции:
+    тогда уведомление уйдёт только после её commit (и пропадёт при rollback).
+    """
+    if not config.CACHE_BUS or getattr(_applying, "active", False):
+        return
+    payload = json.dumps({"o": ORIGIN, "t": topic, "k": None if key is None else str(key)})
+    try:
+        if cur is not None:
+            cur.execute("SELECT pg_notify(%s, %s)", (config.CACHE_BUS_CHANNEL, payload))
+            return
+        with db_connection.acquire() as conn, conn.cursor() as c:
+            c.execute("SELECT pg_notify(%s, %s)", (config.CACHE_BUS_CHANNEL, payload))
+    except Exception as e:
+        # сброс у себя уже сделан; остальные реплики доживут до TTL
+        logger.warning("cache bus: не удалось отправить %s: %s", topic, e)
+
+
+@contextmanager
+def applying():
+    """Внутри — применяется чужой сброс: publish() не пересылает его дальше."""
+    prev = getattr(_applying, "active", False)
+    _applying.active = True
+    try:
+        yield
+    finally:
+        _applying.active = prev
+
+
+def dispatch(payload: str) -> None:
+    """Применить уведомление (из слушателя)."""
+    try:
+        msg = json.loads(payload)
+    except ValueError:
+        logger.warning("cache bus: непонятное уведомление %r", payload[:100])
+        return
+    if msg.get("o") == ORIGIN:
+        return
+    handler = _handlers.get(msg.get("t"))
+    if handler is None:
+        return
+    with applying():
+        try:
+            handler(msg.get("k"))
+        except Exception:
+            logger.exception("cache bus: ошибка обработки %s", msg.get("t"))
+
+
+def reset_all() -> None:
+    """Сбросить у себя всё, о чём могли не узнать (после разрыва LISTEN)."""
+    for topic in list(_handlers):
+        dispatch(json.dumps({"o": "", "t": topic, "k": None}))
+
+
+class CacheBusListener:
+    """
+    LISTEN на отдельном соединении; уведомления читаются через loop.add_reader.
+    Каналы подключаются через listen(channel, callback, on_gap) до start().
+    on_gap() вызывается после переподключения: уведомления за время разрыва потеряны.
+    """
+
+    def __init__(self):
+        self._conn = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reconnect: Optional[asyncio.Task] = None
+        self._stopped = False
+        self._channels: Dict[str, Tuple[Callable[[str], None], Optional[Callable[[], None]]]] = {}
+
+    def listen(self, channel: str, callback: Callable[[str], None],
+               on_gap: Optional[Callable[[], None]] = None) -> None:
+        self._channels[channel] = (callback, on_gap)
+
+    @property
+    def channels(self):
+        return list(self._channels)
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._stopped = False
+        self._connect()
+
+    def _connect(self) -> None:
+        conn = db_connection.connect_dedicated()
+        with conn.cursor() as cur:
+            for channel in self._channels:
+                cur.execute('LISTEN "%s"' % channel.replace('"', '""'))
+        self._conn = conn
+        self._loop.add_reader(conn.fileno(), self._on_readable)
+        logger.info("cache bus: слушаем %s (реплика %s)", ", ".join(self._channels), ORIGIN)
+
+    def _on_readable(self) -> None:
+        try:
+            self._conn.poll()
+        except Exception as e:
+            logger.error("cache bus: соединение потеряно: %s", e)
+            self._drop()
+            self._schedule_reconnect()
+            return
+        while self._conn.notifies:
+            n = self._conn.notifies.pop(0)
+            entry = self._channels.get(n.channel)
+            if entry is not None:
+                entry[0](n.payload)
+
+    def _drop(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            self._loop.remove_reader(conn.fileno())
+        except Exception:
+            pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _schedule_reconnect(self) -> None:
+        if self._stopped or (self._reconnect and not self._reconnect.done()):
+            return
+        self._reconnect = self._loop.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self) -> None:
+        while not self._stopped:
+            await asyncio.sleep(RECONNECT_DELAY)
+            try:
+                self._connect()
+            except Exception as e:
+                logger.warning("cache bus: переподключение не удалось: %s", e)
+                continue
+            # за время разрыва могли пропустить сбросы — сбрасываем всё у себя
+            for _, on_gap in self._channels.values():
+                if on_gap is not None:
+                    on_gap()
+            return
+
+    def stop(self) -> None:
+        self._stopped = True
+        if self._reconnect and not self._reconnect.done():
+            self._reconnect.cancel()
+        if self._loop is not None:
+            self._drop()
+
+
+cache_bus_listener = CacheBusListener()
@@ -0,0 +1,180 @@
+# database/change_events.py
+# -*- coding: utf-8 -*-
+"""
+События изменений из самой БД: триггеры → pg_notify → кэши процесса.
+
+Кэши бота сбрасываются кодом, который пишет данные, но правка вручную SQL
+или из другого процесса мимо них проходила. Триггер bot_notify_change()
+на таблицах CHANGE_TABLES после каждой строки шлёт в канал
+CACHE_EVENTS_CHANNEL компактное событие:
+
+    {"t": "time_group_members", "k": "grp_a", "v": 123456}
+
+  t — таблица, k — ключ (колонка из CHANGE_TABLES; NULL — «всё», например
+  TRUNCATE), v — txid транзакции. Одинаковые уведомления внутри транзакции
+  PostgreSQL склеивает, поэтому массовая запись даёт одно событие на ключ.
+
+Для таблиц из UPDATE_COLUMNS UPDATE шлёт событие, только если изменилась
+одна из перечисленных колонок: create_user на каждом /start переписывает
+users.updated_at, и без фильтра каждая реплика сбрасывала бы состав групп.
+
+Слушатель (database.cache_bus.cache_bus_listener) читает канал в цикле
+asyncio и вызывает обработчики, зарегистрированные on_change(table, handler).
+Стандартные обработчики — install_default_handlers(): состав групп и профили, права,
+username-индекс, версия локаций, кэш обзора. С событиями TTL кэшей можно
+держать длинными — изменения видны за миллисекунды.
+
+Включается CACHE_DB_EVENTS=1 (триггеры ставятся при старте, нужны права владельца таблиц).
+"""
+import json
+import logging
+from typing import Callable, Dict, List, Optional
+
+from config import config
+from . import cache_bus
+from .connection import db_connection
+from .schema import schema_caps
+
+logger = logging.getLogger(__name__)
+
+TRIGGER = "bot_notify_change"
+UPDATE_TRIGGER = "bot_notify_update"
+TRUNCATE_TRIGGER = "bot_notify_truncate"
+
+# таблица → колонка-ключ события
+CHANGE_TABLES: Dict[str, str] = {
+    "time_groups": "key",
+    "time_group_members": "group_key",
+    "location_assignments": "group_key",
+    "duty_assignments": "group_key",
+    "user_settings": "user_id",
+    "users": "user_id",
+    "time_profiles": "key",
+    "time_profile_slots": "profile_id",
+}
+
+# таблица → колонки, изменение которых важно кэшам (остальные UPDATE не шлют событий)
+UPDATE_COLUMNS: Dict[str, tuple] = {
+    "users": ("username", "first_name", "last_name", "role", "is_approved"),
+}
+
+_handlers: Dict[str, List[Callable[[Optional[str], int], None]]] = {}
+_last_version: Dict[str, int] = {}
+
+
+def on_change(table: str, handler: Callable[[Optional[str], int], None]) -> None:
+    """handler(key, version) на каждое событие таблицы (key None — изменилось всё)."""
+    _handlers.setdefault(table, []).append(handler)
+
+
+def install_triggers() -> List[str]:
+    """Функция и триггеры (идемпотентно). Возвращает таблицы, на которых они стоят."""
+    channel = config.CACHE_EVENTS_CHANNEL
+    tables = [t for t in CHANGE_TABLES if schema_caps.has_table(t)]
+    with db_connection.transaction() as conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION bot_notify_change() RETURNS trigger AS $$
+            DECLARE
+                k TEXT;
+            BEGIN
+                IF TG_OP = 'TRUNCATE' THEN
+                    k := NULL;
+                ELSIF TG_OP = 'DELETE' THEN
+                    k := to_jsonb(OLD) ->> TG_ARGV[1];
+                ELSE
+                    k := to_jsonb(NEW) ->> TG_ARGV[1];
+                    IF TG_OP = 'UPDATE' AND (to_jsonb(OLD) ->> TG_ARGV[1]) IS DISTINCT FROM k THEN
+                        PERFORM pg_notify(TG_ARGV[0], json_build_object(
+                            't', TG_TABLE_NAME, 'k', to_jsonb(OLD) ->> TG_ARGV[1],
+                            'v', txid_current())::text);
+                    END IF;
+                END IF;
+                PERFORM pg_notify(TG_ARGV[0], json_build_object(
+                    't', TG_TABLE_NAME, 'k', k, 'v', txid_current())::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        for table in tables:
+            args = "'%s', '%s'" % (channel.replace("'", "''"), CHANGE_TABLES[table])
+            filtered = table in UPDATE_COLUMNS
+            cur.execute(f"DROP TRIGGER IF EXISTS {TRIGGER} ON {table}")
+            cur.execute(f"""
+                CREATE TRIGGER {TRIGGER}
+                AFTER INSERT OR {"" if filtered else "UPDATE OR "}DELETE ON {table}
+                FOR EACH ROW EXECUTE PROCEDURE bot_notify_change({args})
+            """)
+            cur.execute(f"DROP TRIGGER IF EXISTS {UPDATE_TRIGGER} ON {table}")
+            watched = [c for c in UPDATE_COLUMNS.get(table, ()) if schema_caps.has_column(table, c)]
+            if watched:
+                changed = " OR ".join(f"OLD.{c} IS DISTINCT FROM NEW.{c}" for c in watched)
+                cur.execute(f"""
+                    CREATE TRIGGER {UPDATE_TRIGGER}
+                    AFTER UPDATE OF {", ".join(watched)} ON {table}
+                    FOR EACH ROW WHEN ({changed})
+                    EXECUTE PROCEDURE bot_notify_change({args})
+                """)
+            cur.execute(f"DROP TRIGGER IF EXISTS {TRUNCATE_TRIGGER} ON {table}")
+            cur.execute(f"""
+                CREATE TRIGGER {TRUNCATE_TRIGGER}
+                AFTER TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE PROCEDURE bot_notify_change({args})
+            """)
+    logger.info("Триггеры событий изменений: %s", ", ".join(tables))
+    return tables
+
+
+def dispatch_change(payload: str) -> None:
+    """Событие триггера → обработчики таблицы (из слушателя, в цикле asyncio)."""
+    try:
+        msg = json.loads(payload)
+        table, key, version = msg["t"], msg.get("k"), int(msg.get("v") or 0)
+    except (ValueError, KeyError, TypeError):
+        logger.warning("change events: непонятное событие %r", payload[:100])
+        return
+    _last_version[table] = max(version, _last_version.get(table, 0))
+    # сброс из события уже виден всем репликам — рассылать его через cache_bus не нужно
+    with cache_bus.applying():
+        for handler in _handlers.get(table, ()):
+            try:
+                handler(key, version)
+            except Exception:
+                logger.exception("change events: ошибка обработчика %s", table)
+
+
+def reset_all() -> None:
+    """После разрыва LISTEN: события могли потеряться — «изменилось всё» по каждой таблице."""
+    for table in list(_handlers):
+        dispatch_change(json.dumps({"t": table, "k": None, "v": 0}))
+
+
+def stats() -> Dict[str, int]:
+    """Последний txid события по таблицам."""
+    return dict(_last_version)
+
+
+def install_default_handlers() -> None:
+    from utils.cache import find_cache
+    from .roster_cache import invalidate_roster
+    from .access_cache import invalidate_access
+    from .username_index import invalidate_username_index
+    from .location_repository import bump_locations_version
+
+    def user_key(key):
+        return int(key) if key else None
+
+    def drop_cache(name):
+        def handler(key, version):
+            cache = find_cache(name)
+            if cache is not None:
+                cache.invalidate()
+        return handler
+
+    for table in ("time_groups", "time_group_members", "time_profiles", "time_profile_slots"):
+        on_change(table, lambda key, v: invalidate_roster())
+    on_change("users", lambda key, v: invalidate_roster())
+    on_change("users", lambda key, v: invalidate_username_index())
+    on_change("users", lambda key, v: invalidate_access(user_key(key)))
+    on_change("user_settings", lambda key, v: invalidate_access(user_key(key)))
+    on_change("location_assignments", lambda key, v: bump_locations_version())
+    on_change("duty_assignments", drop_cache("overview"))
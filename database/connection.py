@@ -1,11 +1,47 @@
 # database/connection.py
+import threading
+import time
+import weakref
 import psycopg2
 import logging
+from contextlib import contextmanager
+from psycopg2 import pool as pg_pool
 from config import config
 
 logger = logging.getLogger(__name__)
 
+
+class PoolTimeoutError(RuntimeError):
+    """Не удалось получить соединение из пула за отведённое время."""
+
+
+class _TrackedPool(pg_pool.ThreadedConnectionPool):
+    """Пул, который отмечает время открытия каждого нового соединения в on_connect."""
+
+    def __init__(self, minconn, maxconn, on_connect, *args, **kwargs):
+        self._on_connect = on_connect
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self._on_connect(conn)
+        return conn
+
+
 class DatabaseConnection:
+    """
+    Потокобезопасный пул соединений PostgreSQL.
+
+    Использование:
+        with db_connection.acquire() as conn, conn.cursor() as cur:
+            cur.execute(...)
+
+        with db_connection.transaction() as conn:   # несколько запросов одной транзакцией
+            ...
+
+    Соединения выдаются в режиме autocommit (как раньше у единственного соединения).
+    transaction() временно выключает autocommit и делает commit/rollback сам.
+    """
     _instance = None
 
     def __new__(cls):
@@ -15,59 +51,189 @@ class DatabaseConnection:
         return cls._instance
 
     def _initialize(self):
-        # ленивое подключение
-        self.connection = None
-
-    def connect(self):
-        """
-        Создаёт и/или возвращает текущее соединение с БД.
-        ДОЛЖНО возвращать объект psycopg2 connection (НЕ None).
-        """
-        # если соединение уже открыто и живо — вернуть
-        if self.connection and getattr(self.connection, "closed", 1) == 0:
-            return self.connection
-
-        # иначе открыть новое
+        # пул создаём лениво — при первом acquire()
+        self._pool = None
+        self._lock = threading.Lock()
+        self._min = max(0, int(config.DB_POOL_MIN))
+        self._max = max(1, int(config.DB_POOL_MAX), self._min)
+        self._timeout = float(config.DB_POOL_TIMEOUT)
+        self._ping_interval = float(config.DB_POOL_PING_INTERVAL)
+        # семафор ограничивает число выданных соединений и даёт таймаут ожидания
+        self._slots = threading.BoundedSemaphore(self._max)
+        # conn -> monotonic() открытия или последнего возврата в пул (ключ — сам объект:
+        # id() после закрытия переиспользуется, а weakref-запись уходит вместе с соединением)
+        self._last_used = weakref.WeakKeyDictionary()
+
+        # метрики
+        self._stats_lock = threading.Lock()
+        self._acquired = 0
+        self._timeouts = 0
+        self._replaced = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # --- пул ---
+    def _ensure_pool(self):
+        if self._pool is not None:
+            return self._pool
+        with self._lock:
+            if self._pool is None:
+                try:
+                    self._pool = _TrackedPool(
+                        self._min,
+                        self._max,
+                        self._touch,
+                        host=config.DB_HOST,
+                        database=config.DB_NAME,
+                        user=config.DB_USER,
+                        password=config.DB_PASSWORD,
+                        port=config.DB_PORT,
+                    )
+                    logger.info("✅ Пул соединений с БД создан (min=%s, max=%s)", self._min, self._max)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка подключения к БД: {e}")
+                    raise
+        return self._pool
+
+    def _touch(self, conn) -> None:
+        self._last_used[conn] = time.monotonic()
+
+    def _is_alive(self, conn) -> bool:
+        """Закрытое соединение — мёртвое; давно простаивавшее — проверяем SELECT 1."""
+        if getattr(conn, "closed", 1) != 0:
+            return False
+        idle = time.monotonic() - self._last_used.get(conn, 0.0)
+        if idle < self._ping_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def _checkout(self):
+        pool = self._ensure_pool()
+        conn = pool.getconn()
+        if not self._is_alive(conn):
+            self._last_used.pop(conn, None)
+            pool.putconn(conn, close=True)
+            with self._stats_lock:
+                self._replaced += 1
+            conn = pool.getconn()
+        conn.autocommit = True
+        return conn
+
+    def _checkin(self, conn):
+        broken = getattr(conn, "closed", 1) != 0
+        if not broken:
+            try:
+                # не оставляем в пуле незавершённых транзакций
+                if not conn.autocommit:
+                    conn.rollback()
+                    conn.autocommit = True
+            except Exception:
+                broken = True
+        if broken:
+            self._last_used.pop(conn, None)
+        else:
+            self._touch(conn)
         try:
-            self.connection = psycopg2.connect(
-                host=config.DB_HOST,
-                database=config.DB_NAME,
-                user=config.DB_USER,
-                password=config.DB_PASSWORD,
-                port=config.DB_PORT,
-            )
-            self.connection.autocommit = True
-            logger.info("✅ Подключение к БД установлено")
-            return self.connection  # <-- ВАЖНО: явно вернуть conn
+            self._pool.putconn(conn, close=broken)
         except Exception as e:
-            logger.error(f"❌ Ошибка подключения к БД: {e}")
-            self.connection = None
+            logger.error("Не удалось вернуть соединение в пул: %s", e)
+
+    @contextmanager
+    def acquire(self, timeout: float | None = None):
+        """Выдаёт соединение из пула на время блока with и возвращает его обратно."""
+        timeout = self._timeout if timeout is None else timeout
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=timeout):
+            with self._stats_lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(f"Пул БД исчерпан: нет свободного соединения за {timeout:.1f} c")
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
             raise
 
-    def get_connection(self):
-        """Синоним для connect(), оставлен для читаемости."""
-        return self.connect()
+        waited = time.monotonic() - started
+        with self._stats_lock:
+            self._acquired += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
 
-    def reconnect(self):
         try:
-            if self.connection and getattr(self.connection, "closed", 1) == 0:
-                self.connection.close()
-            self.connection = None
-            return self.connect()
-        except Exception as e:
-            logger.error(f"❌ Не удалось восстановить соединение: {e}")
+            yield conn
+        except Exception:
+            safe_rollback(conn)
             raise
+        finally:
+            self._checkin(conn)
+            with self._stats_lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def transaction(self, timeout: float | None = None):
+        """Соединение с открытой транзакцией: commit при успехе, rollback при исключении."""
+        with self.acquire(timeout) as conn:
+            conn.autocommit = False
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.autocommit = True
+
+    def stats(self) -> dict:
+        """Снимок метрик пула (для логов и /admin_* диагностики)."""
+        with self._stats_lock:
+            acquired = self._acquired
+            return {
+                "min": self._min,
+                "max": self._max,
+                "in_use": self._in_use,
+                "peak_in_use": self._peak_in_use,
+                "acquired": acquired,
+                "timeouts": self._timeouts,
+                "replaced": self._replaced,
+                "wait_avg_ms": (self._wait_total / acquired * 1000.0) if acquired else 0.0,
+                "wait_max_ms": self._wait_max * 1000.0,
+            }
+
+    def connect_dedicated(self):
+        """Отдельное autocommit-соединение вне пула (LISTEN и другие долгоживущие сессии)."""
+        conn = psycopg2.connect(
+            host=config.DB_HOST,
+            database=config.DB_NAME,
+            user=config.DB_USER,
+            password=config.DB_PASSWORD,
+            port=config.DB_PORT,
+        )
+        conn.autocommit = True
+        return conn
 
     def close(self):
-        if self.connection and getattr(self.connection, "closed", 1) == 0:
-            self.connection.close()
-            logger.info("🔌 Соединение с БД закрыто")
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+                logger.info("🔌 Пул соединений с БД закрыт")
 
 db_connection = DatabaseConnection()
 
 # Хелперы для безопасного восстановления после ошибок
 def safe_rollback(conn):
-    """На случай, если где-то отключат autocommit и словят ошибку."""
+    """Откатывает транзакцию, если autocommit выключен (например, внутри transaction())."""
     try:
         if conn and not conn.autocommit:
             conn.rollback()
@@ -0,0 +1,83 @@
+# database/coordination.py
+# -*- coding: utf-8 -*-
+"""
+Согласование записей между репликами бота на одной БД.
+
+  lock_groups(cur, LOCK_DUTY, keys) — pg_advisory_xact_lock на каждую группу
+      (в порядке ключей, чтобы две реплики не взаимоблокировались); снимается
+      при commit/rollback транзакции cur.
+  swap_cursors(cur, ...) — сдвиг RR-курсоров «сравнить и записать» одним
+      UPDATE … RETURNING: курсор меняется, только если он всё ещё тот, от
+      которого считали план. Иначе — PlanConflict: другая реплика успела
+      раздать те же группы, план надо пересчитать от свежего состояния.
+
+Планировщики читают состояние без блокировок, считают план в памяти и
+пишут его под lock_groups + swap_cursors; при PlanConflict — до
+PLAN_RETRIES попыток заново.
+"""
+from typing import Iterable, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+
+# classid для pg_advisory_xact_lock(classid, objid): у каждого вида записей свой
+LOCK_DUTY = 0x0D07
+LOCK_LOCATION = 0x10CA
+
+PLAN_RETRIES = 3
+
+
+class PlanConflict(RuntimeError):
+    """Курсор изменён другой репликой после чтения состояния."""
+
+
+def lock_groups(cur, scope: int, group_keys: Iterable[str]) -> None:
+    for key in sorted({str(k) for k in group_keys}):
+        cur.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))", (scope, key))
+
+
+def swap_cursors(cur, table: str, key_cols: Sequence[str],
+                 rows: Iterable[Tuple], touch: bool = False) -> None:
+    """
+    rows — [(*ключ, ожидаемый last_user_id или None, новый last_user_id)].
+    Все курсоры меняются атомарно; хоть один не совпал — PlanConflict
+    (вызывающий откатывает транзакцию).
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    keys = ", ".join(key_cols)
+    match = " AND ".join(f"c.{k} = v.{k}" for k in key_cols)
+    stamp = ", updated_at = NOW()" if touch else ""
+
+    existing = [r for r in rows if r[-2] is not None]
+    if existing:
+        done = execute_values(cur, f"""
+            UPDATE {table} c SET last_user_id = v.new_user_id{stamp}
+            FROM (VALUES %s) AS v({keys}, old_user_id, new_user_id)
+            WHERE {match} AND c.last_user_id = v.old_user_id
+            RETURNING 1
+        """, existing, fetch=True)
+        if len(done) != len(existing):
+            raise PlanConflict(f"{table}: курсор сдвинут другой репликой")
+
+    fresh = [r[:-2] + (r[-1],) for r in rows if r[-2] is None]
+    if fresh:
+        done = execute_values(cur, f"""
+            INSERT INTO {table} ({keys}, last_user_id)
+            VALUES %s
+            ON CONFLICT ({keys}) DO UPDATE SET last_user_id = EXCLUDED.last_user_id{stamp}
+            WHERE {table}.last_user_id IS NULL
+            RETURNING 1
+        """, fresh, fetch=True)
+        if len(done) != len(fresh):
+            raise PlanConflict(f"{table}: курсор создан другой репликой")
+
+
+def cursor_swaps(start: dict, changed: Iterable[Tuple]) -> list:
+    """[(*ключ, новый)] + исходные курсоры {ключ: last} → строки для swap_cursors."""
+    out = []
+    for row in changed:
+        key, new = tuple(row[:-1]), row[-1]
+        k = key[0] if len(key) == 1 else key
+        out.append(key + (start.get(k), new))
+    return out
@@ -5,23 +5,33 @@ from .connection import db_connection
 
 # ---- RANKS ----
 def set_member_rank(group_key: str, user_id: int, rank: int, admin_id: Optional[int]) -> bool:
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("""
             INSERT INTO member_ranks (group_key, user_id, rank, updated_by)
             VALUES (%s, %s, %s, %s)
             ON CONFLICT (group_key, user_id) DO UPDATE SET rank=EXCLUDED.rank, updated_by=EXCLUDED.updated_by, updated_at=NOW()
         """, (group_key, user_id, rank, admin_id))
-        db_connection.get_connection().commit()
+        conn.commit()
         return True
 
 def get_member_rank(group_key: str, user_id: int) -> Optional[int]:
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("SELECT rank FROM member_ranks WHERE group_key=%s AND user_id=%s", (group_key, user_id))
         row = cur.fetchone()
         return int(row[0]) if row else None
 
+def get_member_ranks(group_keys: Optional[List[str]] = None) -> Dict[tuple, int]:
+    """Все ранги одним запросом: {(group_key, user_id): rank}."""
+    sql = "SELECT group_key, user_id, rank FROM member_ranks"
+    params: list = []
+    if group_keys is not None:
+        sql += " WHERE group_key = ANY(%s)"; params.append(list(group_keys))
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        return {(str(g), int(uid)): int(r) for g, uid, r in cur.fetchall() if r is not None}
+
 def list_member_ranks(group_key: str) -> List[Dict[str, Any]]:
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("""
             SELECT user_id, rank, updated_by, updated_at
             FROM member_ranks
@@ -32,19 +42,19 @@ def list_member_ranks(group_key: str) -> List[Dict[str, Any]]:
 
 # ---- EXCLUSIONS ----
 def add_exclusion(user_id: int, date_from: date, date_to: date, group_key: Optional[str], reason: Optional[str], admin_id: Optional[int]) -> int:
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("""
             INSERT INTO duty_exclusions (user_id, group_key, date_from, date_to, reason, created_by)
             VALUES (%s, %s, %s, %s, %s, %s) RETURNING id
         """, (user_id, group_key, date_from, date_to, reason, admin_id))
         new_id = cur.fetchone()[0]
-        db_connection.get_connection().commit()
+        conn.commit()
         return new_id
 
 def remove_exclusion(excl_id: int) -> bool:
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("DELETE FROM duty_exclusions WHERE id=%s", (excl_id,))
-        db_connection.get_connection().commit()
+        conn.commit()
         return cur.rowcount > 0
 
 def list_exclusions(on_date: Optional[date] = None, group_key: Optional[str] = None, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
@@ -61,13 +71,13 @@ def list_exclusions(on_date: Optional[date] = None, group_key: Optional[str] = N
         WHERE {' AND '.join(where)}
         ORDER BY date_from DESC, id DESC
     """
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(sql, params)
         rows = cur.fetchall()
     return [{"id": r[0], "user_id": r[1], "group_key": r[2], "date_from": r[3], "date_to": r[4], "reason": r[5], "created_by": r[6], "created_at": r[7]} for r in rows]
 
 def is_user_excluded_on(group_key: str, user_id: int, on_date: date) -> bool:
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("""
             SELECT 1 FROM duty_exclusions
             WHERE user_id=%s
@@ -77,18 +87,41 @@ def is_user_excluded_on(group_key: str, user_id: int, on_date: date) -> bool:
         """, (user_id, group_key, on_date, on_date))
         return cur.fetchone() is not None
 
+def list_exclusion_ranges(date_from: date, date_to: date) -> Dict[int, List[tuple]]:
+    """Исключения, пересекающие [date_from, date_to]: {user_id: [(group_key|None, from, to)]}."""
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT user_id, group_key, date_from, date_to
+            FROM duty_exclusions
+            WHERE date_from <= %s AND date_to >= %s
+        """, (date_to, date_from))
+        res: Dict[int, List[tuple]] = {}
+        for uid, g, d_from, d_to in cur.fetchall():
+            res.setdefault(int(uid), []).append((g, d_from, d_to))
+        return res
+
 # ---- RR CURSOR ----
 def get_rr_last(group_key: str, duty_id: int) -> Optional[int]:
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("SELECT last_user_id FROM duty_rr_cursor WHERE group_key=%s AND duty_id=%s", (group_key, duty_id))
         row = cur.fetchone()
         return int(row[0]) if row and row[0] is not None else None
 
 def set_rr_last(group_key: str, duty_id: int, user_id: int) -> None:
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("""
             INSERT INTO duty_rr_cursor (group_key, duty_id, last_user_id)
             VALUES (%s, %s, %s)
             ON CONFLICT (group_key, duty_id) DO UPDATE SET last_user_id=EXCLUDED.last_user_id, updated_at=NOW()
         """, (group_key, duty_id, user_id))
-        db_connection.get_connection().commit()
+        conn.commit()
+
+def get_rr_cursors(group_keys: Optional[List[str]] = None) -> Dict[tuple, int]:
+    """Все курсоры одним запросом: {(group_key, duty_id): last_user_id}."""
+    sql = "SELECT group_key, duty_id, last_user_id FROM duty_rr_cursor WHERE last_user_id IS NOT NULL"
+    params: list = []
+    if group_keys is not None:
+        sql += " AND group_key = ANY(%s)"; params.append(list(group_keys))
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        return {(str(g), int(d)): int(u) for g, d, u in cur.fetchall()}
@@ -19,8 +19,7 @@ def _row_to_dict(row) -> Dict[str, Any]:
     }
 
 def fetch_catalog(search: Optional[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
-    conn = db_connection.get_connection()
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+    with db_connection.acquire() as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
         if search:
             cur.execute(
                 """
@@ -47,8 +46,7 @@ def fetch_catalog(search: Optional[str] = None, limit: int = 500) -> List[Dict[s
         return [_row_to_dict(r) for r in cur.fetchall()]
 
 def get_by_key(key: str) -> Optional[Dict[str, Any]]:
-    conn = db_connection.get_connection()
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+    with db_connection.acquire() as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
         cur.execute(
             """
             SELECT key, title, weight, office_required, target_rank, min_rank, description, is_active, created_at
@@ -59,8 +57,7 @@ def get_by_key(key: str) -> Optional[Dict[str, Any]]:
         return _row_to_dict(row) if row else None
 
 def set_active(key: str, is_active: bool) -> bool:
-    conn = db_connection.get_connection()
-    with conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("UPDATE duty SET is_active=%s WHERE key=%s", (is_active, key))
         conn.commit()
         return cur.rowcount > 0
@@ -78,8 +75,7 @@ def upsert_duty(data: Dict[str, Any]) -> str:
     target_rank = data.get("target_rank")
     min_rank = data.get("min_rank")
     description = (data.get("description") or "").strip()
-    conn = db_connection.get_connection()
-    with conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(
             """
             INSERT INTO duty (key, title, description, weight, office_required, target_rank, min_rank, is_active)
@@ -99,8 +95,7 @@ def upsert_duty(data: Dict[str, Any]) -> str:
     return key
 
 def delete_by_key(key: str) -> bool:
-    conn = db_connection.get_connection()
-    with conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("DELETE FROM duty WHERE key=%s", (key,))
         conn.commit()
         return cur.rowcount > 0
@@ -1,131 +1,29 @@
 #cat > /home/telegrambot/shift_tracker_bot/database/duty_repository.py
 # -*- coding: utf-8 -*-
-from typing import List, Optional, Dict, Any
-from datetime import date
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+from datetime import date, timedelta
 import logging
 
+from psycopg2.extras import execute_values
+
 from .connection import db_connection
-from database import time_repository as time_repo  # уже есть у вас
+from .roster_cache import get_roster
+from .absence_repository import list_absence_intervals
+from .location_repository import get_location_maps
+from .duty_catalog_repository import fetch_catalog
+from .schema import schema_caps
+from .load_counters import apply_duty_changes
+from .coordination import LOCK_DUTY, PLAN_RETRIES, PlanConflict, cursor_swaps, lock_groups, swap_cursors
+from config import config
+from logic.roster_engine import build_roster
+from logic.duty_planner import PlannerState, Assignment, plan_day, plan_totals, display_name
 
 from .duty_admin_repository import (
-    get_member_rank, is_user_excluded_on, get_rr_last, set_rr_last
+    get_member_ranks, list_exclusion_ranges, get_rr_cursors
 )
 
 logger = logging.getLogger(__name__)
 
-# заменить _member_rank на версию с БД:
-def _member_rank(m: Dict[str, Any], group_key: Optional[str]) -> int:
-    # сначала смотрим БД
-    try:
-        if group_key:
-            r = get_member_rank(group_key, int(m.get("user_id")))
-            if r in (1,2,3):
-                return r
-    except Exception:
-        pass
-    # затем fallback из профиля группы
-    try:
-        return int(m.get("rank") or 2)
-    except Exception:
-        return 2
-
-# скорректировать _on_duty_members — фильтр исключений:
-def _on_duty_members(info: Dict[str, Any], on_date: date) -> list[Dict[str, Any]]:
-    from logic.duty import resolve_slot_ddnn_alternating as resolve4
-    from logic.duty import resolve_slot_ddnn_alt_8 as resolve8
-
-    members = info.get("members", [])
-    res = []
-    epoch = info.get("epoch")
-    period = int(info.get("period") or info.get("rotation_period_days") or 4)
-    slots = info.get("slots", [])
-    group_key = info.get("key") or info.get("name")  # ваш ключ группы
-
-    for m in members:
-        base_pos = int(m.get("base_pos") or 0)
-        if period == 8 and resolve8 is not None:
-            slot_idx = resolve8(epoch, 8, base_pos, on_date)
-        else:
-            slot_idx = resolve4(epoch, 4, base_pos, on_date)
-        if slot_idx is None:
-            continue
-
-        uid = int(m.get("user_id"))
-        # Исключения (включая глобальные group_key=NULL)
-        if is_user_excluded_on(str(group_key), uid, on_date):
-            continue
-
-        mm = dict(m)
-        mm["_slot_idx"] = slot_idx
-        mm["_slot"] = next((s for s in slots if s["pos"] == slot_idx), None)
-        res.append(mm)
-    return res
-
-# новый RR-алгоритм (добавить НИЖЕ существующего auto_assign_for_date, либо заменить его):
-def auto_assign_for_date_rr(on_date: date, author_id: Optional[int] = None, group_key: Optional[str] = None) -> int:
-    """
-    Round-robin распределение: по каждой (группа,duty) берём eligible-пул
-    (в смене, не исключён, проходит по min_rank) и назначаем следующего
-    после last_user_id в duty_rr_cursor.
-    """
-    duties = list_duties(only_active=True)
-    if not duties:
-        return 0
-
-    groups = time_repo.list_groups() or []
-    if group_key:
-        groups = [g for g in groups if str(g.get("key")) == str(group_key)]
-    total = 0
-
-    for g in groups:
-        key = str(g["key"])
-        info = time_repo.get_group_info(key)
-        if not info:
-            continue
-
-        on_duty = _on_duty_members(info, on_date)
-        if not on_duty:
-            continue
-
-        for d in duties:
-            if not d["is_active"]:
-                continue
-
-            # eligible pool по рангу
-            eligible = []
-            for m in on_duty:
-                r = _member_rank(m, key)
-                if d["kind"] == "leader":
-                    ok = (r <= 1)
-                else:
-                    ok = (r <= int(d.get("min_rank") or 2))
-                if ok:
-                    eligible.append(int(m["user_id"]))
-
-            if not eligible:
-                continue
-
-            eligible = sorted(set(eligible))  # стабильный порядок
-            last = get_rr_last(key, d["id"])
-            nxt = None
-            if last is None:
-                nxt = eligible[0]
-            else:
-                # следующий после last в кольце
-                try:
-                    i = eligible.index(last)
-                    nxt = eligible[(i + 1) % len(eligible)]
-                except ValueError:
-                    # если last больше не в пуле — начнём с первого
-                    nxt = eligible[0]
-
-            if set_assignment(d["id"], key, on_date, nxt, author_id):
-                set_rr_last(key, d["id"], nxt)
-                total += 1
-
-    return total
-
-
 def list_duties(kind: Optional[str] = None, only_active: bool = True) -> List[Dict[str, Any]]:
     where, params = ["1=1"], []
     if kind:
@@ -138,7 +36,7 @@ def list_duties(kind: Optional[str] = None, only_active: bool = True) -> List[Di
         WHERE {' AND '.join(where)}
         ORDER BY kind, id
     """
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(sql, params)
         rows = cur.fetchall()
     return [
@@ -148,19 +46,39 @@ def list_duties(kind: Optional[str] = None, only_active: bool = True) -> List[Di
         } for r in rows
     ]
 
+def list_planning_duties() -> List[Dict[str, Any]]:
+    """
+    Активные обязанности с полями каталога duty (связь duties.code = duty.key):
+    weight, office_required, target_rank; min_rank каталога, если задан,
+    важнее min_rank из duties. Без записи в каталоге — вес по умолчанию.
+    """
+    duties = list_duties(only_active=True)
+    if not duties or not schema_caps.has_table("duty"):
+        return duties
+    catalog = {c["key"]: c for c in fetch_catalog(limit=100000)}
+    for d in duties:
+        c = catalog.get(d.get("code"))
+        if not c:
+            continue
+        d["weight"] = c["weight"]
+        d["office_required"] = c["office_required"]
+        d["target_rank"] = c["target_rank"]
+        if c["min_rank"] is not None:
+            d["min_rank"] = c["min_rank"]
+    return duties
+
 def create_duty(title: str, kind: str, description: Optional[str] = None,
                 code: Optional[str] = None, min_rank: int = 2) -> Optional[int]:
     try:
-        with db_connection.get_connection().cursor() as cur:
+        with db_connection.acquire() as conn, conn.cursor() as cur:
             cur.execute("""
                 INSERT INTO duties (code, title, description, kind, min_rank)
                 VALUES (%s, %s, %s, %s, %s) RETURNING id
             """, (code, title, description, kind, min_rank))
             new_id = cur.fetchone()[0]
-            db_connection.get_connection().commit()
+            conn.commit()
             return new_id
     except Exception as e:
-        db_connection.get_connection().rollback()
         logger.exception(e)
         return None
 
@@ -173,39 +91,43 @@ def update_duty(duty_id: int, **fields) -> bool:
             sets.append(f"{k}=%s"); params.append(v)
     if not sets: return True
     try:
-        with db_connection.get_connection().cursor() as cur:
+        with db_connection.acquire() as conn, conn.cursor() as cur:
             cur.execute(f"UPDATE duties SET {', '.join(sets)}, updated_at=NOW() WHERE id=%s", params+[duty_id])
-            db_connection.get_connection().commit()
+            conn.commit()
             return cur.rowcount > 0
     except Exception as e:
-        db_connection.get_connection().rollback()
         logger.exception(e)
         return False
 
 def delete_duty(duty_id: int) -> bool:
     try:
-        with db_connection.get_connection().cursor() as cur:
+        with db_connection.acquire() as conn, conn.cursor() as cur:
             cur.execute("DELETE FROM duties WHERE id=%s", (duty_id,))
-            db_connection.get_connection().commit()
+            conn.commit()
             return cur.rowcount > 0
     except Exception as e:
-        db_connection.get_connection().rollback()
         logger.exception(e)
         return False
 
 def set_assignment(duty_id: int, group_key: str, on_date: date, user_id: int, author_id: Optional[int]) -> bool:
-    """UPSERT по (duty_id, group_key, on_date)."""
+    """UPSERT по (duty_id, group_key, on_date); счётчик нагрузки — в той же транзакции."""
     try:
-        with db_connection.get_connection().cursor() as cur:
+        with db_connection.transaction() as conn, conn.cursor() as cur:
+            lock_groups(cur, LOCK_DUTY, [group_key])
+            cur.execute("""
+                SELECT user_id FROM duty_assignments
+                WHERE duty_id=%s AND group_key=%s AND on_date=%s
+                FOR UPDATE
+            """, (duty_id, group_key, on_date))
+            old = [(group_key, duty_id, on_date, int(r[0])) for r in cur.fetchall()]
             cur.execute("""
                 INSERT INTO duty_assignments (duty_id, group_key, on_date, user_id, created_by)
                 VALUES (%s, %s, %s, %s, %s)
                 ON CONFLICT (duty_id, group_key, on_date) DO UPDATE SET user_id=EXCLUDED.user_id
             """, (duty_id, group_key, on_date, user_id, author_id))
-            db_connection.get_connection().commit()
-            return True
+            apply_duty_changes(cur, old, [(group_key, duty_id, on_date, int(user_id))])
+        return True
     except Exception as e:
-        db_connection.get_connection().rollback()
         logger.exception(e)
         return False
 
@@ -221,7 +143,7 @@ def get_assignments(on_date: date, group_key: Optional[str] = None) -> List[Dict
         WHERE {' AND '.join(where)}
         ORDER BY da.group_key, d.kind, d.id
     """
-    with db_connection.get_connection().cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(sql, params)
         rows = cur.fetchall()
     return [
@@ -232,122 +154,217 @@ def get_assignments(on_date: date, group_key: Optional[str] = None) -> List[Dict
         } for r in rows
     ]
 
-def _member_rank(m: Dict[str, Any]) -> int:
-    try:
-        return int(m.get("rank") or 2)
-    except Exception:
-        return 2
+# ===========================
+# ПАКЕТНОЕ РАСПРЕДЕЛЕНИЕ
+# ===========================
+# Всё нужное для расчёта читается заранее несколькими запросами
+# (load_planner_state), считается в памяти (logic.duty_planner.plan_day)
+# и пишется одной транзакцией (save_plan) — число обращений к БД не зависит
+# от количества групп, участников и обязанностей.
+
+def select_groups(group_key: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Полные карточки групп из снимка состава (все или одна)."""
+    groups = get_roster().groups()
+    if group_key:
+        groups = [g for g in groups if str(g.get("key")) == str(group_key)]
+    return groups
+
+
+def _load_history(group_keys: List[str], date_from: date, date_to: date) -> Dict[Tuple[str, int, int], List[date]]:
+    """Назначения за [date_from, date_to): {(group_key, duty_id, user_id): [даты по возрастанию]}."""
+    res: Dict[Tuple[str, int, int], List[date]] = {}
+    if not group_keys:
+        return res
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT group_key, duty_id, user_id, on_date
+            FROM duty_assignments
+            WHERE group_key = ANY(%s) AND on_date >= %s AND on_date < %s
+            ORDER BY on_date
+        """, (group_keys, date_from, date_to))
+        for g, duty_id, uid, d in cur.fetchall():
+            res.setdefault((str(g), int(duty_id), int(uid)), []).append(d)
+    return res
+
 
-def _username(m: Dict[str, Any]) -> str:
-    u = (m.get("username") or "").strip()
-    return f"@{u}" if u else ""
+def _load_locations(group_keys: List[str], date_from: date, date_to: date) -> Dict[date, Dict[str, Dict[int, str]]]:
+    """Офис/дом за период: {дата: {group_key: {user_id: location}}}."""
+    keys = set(group_keys)
+    res: Dict[date, Dict[str, Dict[int, str]]] = {}
+    for d, by_member in get_location_maps(date_from, date_to).items():
+        for (g, uid), loc in by_member.items():
+            if g in keys:
+                res.setdefault(d, {}).setdefault(g, {})[uid] = loc
+    return res
 
-def _display_name(m: Dict[str, Any]) -> str:
-    fn = (m.get("first_name") or "").strip()
-    ln = (m.get("last_name") or "").strip()
-    return (f"{fn} {ln}".strip() or _username(m) or str(m.get("user_id")))
 
-def _on_duty_members(info: Dict[str, Any], on_date: date) -> list[Dict[str, Any]]:
+def load_planner_state(group_keys: List[str], date_from: date, date_to: date,
+                       *, load_days: int = 30, with_history: bool = True,
+                       with_locations: bool = False,
+                       user_ids: Optional[List[int]] = None) -> PlannerState:
     """
-    Возвращает участников группы, которые реально работают в on_date согласно слотам/циклам.
-    Для простоты: берём всех members и отфильтровываем тех, у кого resolve даёт слот.
+    Ранги, исключения и отсутствия на [date_from, date_to], RR-курсоры,
+    (with_history) назначения за load_days дней до date_from и (with_locations)
+    офис/дом на период — по одному запросу на каждое.
     """
-    from logic.duty import resolve_slot_ddnn_alternating as resolve4
-    from logic.duty import resolve_slot_ddnn_alt_8 as resolve8
-
-    members = info.get("members", [])
-    res = []
-    epoch = info.get("epoch")
-    period = int(info.get("period") or info.get("rotation_period_days") or 4)
-    slots = info.get("slots", [])
-
-    for m in members:
-        base_pos = int(m.get("base_pos") or 0)
-        if period == 8 and resolve8 is not None:
-            slot_idx = resolve8(epoch, 8, base_pos, on_date)
-        else:
-            slot_idx = resolve4(epoch, 4, base_pos, on_date)
-        if slot_idx is None:
-            continue
-        # найдём слот (не обязателен для решения, но пригодится)
-        slot = next((s for s in slots if s["pos"] == slot_idx), None)
-        mm = dict(m)
-        mm["_slot_idx"] = slot_idx
-        mm["_slot"] = slot
-        res.append(mm)
+    keys = [str(k) for k in group_keys]
+    return PlannerState(
+        ranks=get_member_ranks(keys),
+        exclusions=list_exclusion_ranges(date_from, date_to),
+        cursors=get_rr_cursors(keys),
+        history=_load_history(keys, date_from - timedelta(days=load_days), date_from) if with_history else {},
+        absences=list_absence_intervals(date_from, date_to, user_ids),
+        locations=_load_locations(keys, date_from, date_to) if with_locations else {},
+    )
+
+
+def on_duty_by_date(groups: List[Dict[str, Any]], date_from: date, date_to: date) -> Dict[date, List[Tuple[str, List[Dict[str, Any]]]]]:
+    """Кто в смене по дням: {дата: [(group_key, [участники])]} — одна матрица на диапазон."""
+    roster = build_roster(groups, date_from, date_to)
+    res: Dict[date, List[Tuple[str, List[Dict[str, Any]]]]] = {}
+    for d in roster.dates:
+        by_group: Dict[str, List[Dict[str, Any]]] = {}
+        for info, m, _slot in roster.on_duty(d):
+            by_group.setdefault(str(info["key"]), []).append(m)
+        res[d] = [(str(g["key"]), by_group[str(g["key"])]) for g in groups if str(g["key"]) in by_group]
     return res
 
-def _last_load_for_users(group_key: str, duty_id: int, since_days: int = 30) -> Dict[int, int]:
+
+def save_plan(assignments: Iterable[Assignment], cursors: Iterable[Tuple[str, int, int]],
+              author_id: Optional[int], cursor_start: Optional[Dict[Tuple[str, int], int]] = None) -> int:
     """
-    Возвращает {user_id: кол-во назначений за N дней} для грубой справедливости (меньше — приоритетнее).
+    UPSERT назначений, RR-курсоров и счётчиков нагрузки одной транзакцией
+    под advisory-блокировкой групп. cursor_start — курсоры, от которых считали
+    план: тогда курсоры сдвигаются «сравнить и записать», и если другая
+    реплика успела их сдвинуть — PlanConflict (ничего не записано).
+    Возвращает число назначений.
+    """
+    assignments = list(assignments)
+    rows = [(duty_id, key, d, uid, author_id) for duty_id, key, d, uid in assignments]
+    cursor_rows = list(cursors)
+    if not rows and not cursor_rows:
+        return 0
+    with db_connection.transaction() as conn, conn.cursor() as cur:
+        lock_groups(cur, LOCK_DUTY, {a[1] for a in assignments} | {c[0] for c in cursor_rows})
+        if cursor_rows and cursor_start is not None:
+            swap_cursors(cur, "duty_rr_cursor", ("group_key", "duty_id"),
+                         cursor_swaps(cursor_start, cursor_rows), touch=True)
+        if rows:
+            # прежние исполнители тех же (duty, группа, дата) — для разности счётчиков
+            keys = {(duty_id, key, d) for duty_id, key, d, _ in assignments}
+            cur.execute("""
+                SELECT duty_id, group_key, on_date, user_id
+                FROM duty_assignments
+                WHERE group_key = ANY(%s) AND duty_id = ANY(%s) AND on_date BETWEEN %s AND %s
+                FOR UPDATE
+            """, (
+                sorted({k[1] for k in keys}), sorted({k[0] for k in keys}),
+                min(k[2] for k in keys), max(k[2] for k in keys),
+            ))
+            old = [(g, duty_id, d, int(uid)) for duty_id, g, d, uid in cur.fetchall() if (duty_id, g, d) in keys]
+            execute_values(cur, """
+                INSERT INTO duty_assignments (duty_id, group_key, on_date, user_id, created_by)
+                VALUES %s
+                ON CONFLICT (duty_id, group_key, on_date) DO UPDATE SET user_id=EXCLUDED.user_id
+            """, rows, page_size=1000)
+            apply_duty_changes(cur, old, [(key, duty_id, d, uid) for duty_id, key, d, uid in assignments])
+        if cursor_rows and cursor_start is None:
+            execute_values(cur, """
+                INSERT INTO duty_rr_cursor (group_key, duty_id, last_user_id)
+                VALUES %s
+                ON CONFLICT (group_key, duty_id) DO UPDATE SET last_user_id=EXCLUDED.last_user_id, updated_at=NOW()
+            """, cursor_rows, page_size=1000)
+    return len(rows)
+
+
+MAX_PLAN_DAYS = 366
+
+
+def auto_assign_range(date_from: date, date_to: date, author_id: Optional[int] = None,
+                      group_key: Optional[str] = None, mode: str = "rr") -> Dict[str, Any]:
     """
-    sql = """
-        SELECT user_id, COUNT(*) AS cnt
-        FROM duty_assignments
-        WHERE group_key=%s AND duty_id=%s AND on_date >= CURRENT_DATE - %s::INTERVAL
-        GROUP BY user_id
+    Распределение на каждый день [date_from, date_to] включительно.
+    mode — "rr", "load" или "weighted" (см. logic.duty_planner).
+    RR-курсоры и история назначений переносятся между днями в памяти,
+    в БД всё пишется одной транзакцией в конце.
+    Возвращает {"assigned", "days", "totals": [{"user_id", "name", "count"}] по убыванию}.
     """
-    res = {}
+    result: Dict[str, Any] = {"assigned": 0, "days": 0, "totals": []}
+    if date_to < date_from:
+        date_from, date_to = date_to, date_from
+    days = (date_to - date_from).days + 1
+    if days > MAX_PLAN_DAYS:
+        raise ValueError(f"слишком длинный период: {days} дн. (максимум {MAX_PLAN_DAYS})")
+    result["days"] = days
+
+    weighted = mode == "weighted"
+    duties = list_planning_duties() if weighted else list_duties(only_active=True)
+    groups = select_groups(group_key)
+    if not duties or not groups:
+        return result
+
+    load_days = int(config.DUTY_FAIR_WINDOW_DAYS) if weighted else 30
+    names = {int(m["user_id"]): display_name(m) for g in groups for m in g["members"]}
+    on_duty = sorted(on_duty_by_date(groups, date_from, date_to).items())
+    for attempt in range(1, PLAN_RETRIES + 1):
+        state = load_planner_state(
+            [g["key"] for g in groups], date_from, date_to,
+            load_days=load_days,
+            with_history=(mode != "rr"),
+            with_locations=weighted and any(d.get("office_required") for d in duties),
+            user_ids=list(names),
+        )
+        cursor_start = dict(state.cursors)
+        assignments: List[Assignment] = []
+        for d, day_on_duty in on_duty:
+            assignments += plan_day(state, day_on_duty, duties, d, mode=mode, load_days=load_days)
+        try:
+            result["assigned"] = save_plan(assignments, state.cursor_rows(), author_id, cursor_start)
+            break
+        except PlanConflict as e:
+            # другая реплика раздала те же группы — считаем заново от её результата
+            if attempt == PLAN_RETRIES:
+                raise
+            logger.info("auto_assign_range: %s, попытка %s", e, attempt + 1)
+
+    result["totals"] = [
+        {"user_id": uid, "name": names.get(uid, str(uid)), "count": cnt}
+        for uid, cnt in sorted(plan_totals(assignments).items(), key=lambda kv: (-kv[1], names.get(kv[0], "")))
+    ]
+    return result
+
+
+def _auto_assign(on_date: date, author_id: Optional[int], group_key: Optional[str], mode: str) -> int:
     try:
-        with db_connection.get_connection().cursor() as cur:
-            cur.execute(sql, (group_key, duty_id, f"{since_days} days"))
-            for uid, cnt in cur.fetchall():
-                res[int(uid)] = int(cnt)
-    except Exception:
-        pass
-    return res
+        return auto_assign_range(on_date, on_date, author_id, group_key, mode)["assigned"]
+    except Exception as e:
+        logger.exception(e)
+        return 0
+
 
 def auto_assign_for_date(on_date: date, author_id: Optional[int] = None, group_key: Optional[str] = None) -> int:
     """
     Распределяет все активные обязанности на дату по всем группам (или одной группе),
-    среди тех, кто реально в смене, учитывая kind/min_rank и простейшую справедливость по истории.
+    среди тех, кто реально в смене и не исключён, учитывая kind/min_rank и простейшую
+    справедливость по истории (меньше назначений за 30 дней — приоритетнее).
     Возвращает количество назначений.
     """
-    duties = list_duties(only_active=True)
-    if not duties:
-        return 0
+    return _auto_assign(on_date, author_id, group_key, "load")
 
-    groups = time_repo.list_groups() or []
-    if group_key:
-        groups = [g for g in groups if str(g.get("key")) == str(group_key)]
-    total = 0
 
-    for g in groups:
-        key = g["key"]
-        info = time_repo.get_group_info(key)
-        if not info:
-            continue
+def auto_assign_for_date_rr(on_date: date, author_id: Optional[int] = None, group_key: Optional[str] = None) -> int:
+    """
+    Round-robin распределение: по каждой (группа,duty) берём eligible-пул
+    (в смене, не исключён, проходит по min_rank) и назначаем следующего
+    после last_user_id в duty_rr_cursor.
+    """
+    return _auto_assign(on_date, author_id, group_key, "rr")
 
-        on_duty = _on_duty_members(info, on_date)
-        if not on_duty:
-            continue
 
-        # кандидаты по ролям
-        leaders     = [m for m in on_duty if _member_rank(m) <= 1]
-        specialists = [m for m in on_duty if _member_rank(m) <= 2]
-        juniors     = [m for m in on_duty if _member_rank(m) <= 3]  # запас
-
-        for d in duties:
-            if not d["is_active"]:
-                continue
-            if d["kind"] == "leader":
-                pool = leaders
-            else:
-                # specialist duty — берём всех с rank <= min_rank (обычно 2)
-                pool = [m for m in on_duty if _member_rank(m) <= int(d.get("min_rank") or 2)]
-
-            if not pool:
-                continue
-
-            # сгрубая справедливость: реже назначавшийся — приоритет
-            last_load = _last_load_for_users(key, d["id"], since_days=30)
-            pool_sorted = sorted(
-                pool,
-                key=lambda m: (last_load.get(int(m.get("user_id")), 0), _display_name(m).lower())
-            )
-            target_uid = int(pool_sorted[0]["user_id"])
-
-            if set_assignment(d["id"], key, on_date, target_uid, author_id):
-                total += 1
-
-    return total
+def auto_assign_for_date_weighted(on_date: date, author_id: Optional[int] = None, group_key: Optional[str] = None) -> int:
+    """
+    Взвешенная справедливость: вес обязанностей из каталога duty, баланс
+    суммарной нагрузки за DUTY_FAIR_WINDOW_DAYS дней, учёт target_rank/min_rank
+    и office_required.
+    """
+    return _auto_assign(on_date, author_id, group_key, "weighted")
@@ -30,6 +30,8 @@ import logging
 from typing import List, Dict, Optional, Any
 
 from database.connection import db_connection
+from database.roster_cache import invalidates_roster
+from database.schema import schema_caps
 
 logger = logging.getLogger(__name__)
 
@@ -42,38 +44,33 @@ TABLE = "time_groups"  # если у вас иное имя — измените
 
 def _conn():
     """
-    Возвращает живое соединение psycopg2 от нашего синглтона.
-    Соединение не закрываем здесь — им управляет DatabaseConnection.
+    Выдаёт соединение psycopg2 из общего пула на время блока with.
+    Соединение не закрываем здесь — его возвращает в пул DatabaseConnection.
     """
-    return db_connection.get_connection()
+    return db_connection.acquire()
 
 
 def _ensure_name_column() -> None:
     """
     Гарантируем наличие колонки name в time_groups (PostgreSQL).
-    Безопасно вызывать многократно.
+    Безопасно вызывать многократно: если колонка уже есть, DDL не выполняется.
     """
+    if schema_caps.has_column(TABLE, "name"):
+        return
     try:
-        conn = _conn()
-        cur = conn.cursor()
-        cur.execute(f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS name TEXT")
-        conn.commit()
-        cur.close()
+        with _conn() as conn:
+            cur = conn.cursor()
+            cur.execute(f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS name TEXT")
+            conn.commit()
+            cur.close()
+        schema_caps.invalidate()
     except Exception as e:
         logger.error("Не удалось обеспечить наличие колонки name в %s: %s", TABLE, e)
 
 
 def _table_exists(cur, table_name: str) -> bool:
-    cur.execute(
-        """
-        SELECT 1
-        FROM information_schema.tables
-        WHERE table_schema = 'public' AND table_name = %s
-        LIMIT 1
-        """,
-        (table_name,),
-    )
-    return cur.fetchone() is not None
+    """Есть ли таблица в схеме (по снимку SchemaCapabilities, без запроса)."""
+    return schema_caps.has_table(table_name)
 
 
 # ===========================
@@ -89,11 +86,11 @@ def list_groups() -> List[Dict[str, Any]]:
         FROM {TABLE}
         ORDER BY key
     """
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute(sql)
-    rows = cur.fetchall()
-    cur.close()
+    with _conn() as conn:
+        cur = conn.cursor()
+        cur.execute(sql)
+        rows = cur.fetchall()
+        cur.close()
 
     out: List[Dict[str, Any]] = []
     for r in rows:
@@ -121,11 +118,11 @@ def get_by_key(key: str) -> Optional[Dict[str, Any]]:
         WHERE key = %s
         LIMIT 1
     """
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute(sql, (key,))
-    row = cur.fetchone()
-    cur.close()
+    with _conn() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, (key,))
+        row = cur.fetchone()
+        cur.close()
     if not row:
         return None
     return {
@@ -139,6 +136,7 @@ def get_by_key(key: str) -> Optional[Dict[str, Any]]:
     }
 
 
+@invalidates_roster
 def update_name(key: str, new_name: str) -> bool:
     """
     Обновляет человекочитаемое имя группы (колонка name) в time_groups.
@@ -150,13 +148,13 @@ def update_name(key: str, new_name: str) -> bool:
     _ensure_name_column()
 
     sql = f"UPDATE {TABLE} SET name = %s WHERE key = %s"
-    conn = _conn()
-    cur = conn.cursor()
-    cur.execute(sql, (new_name.strip(), key.strip()))
-    conn.commit()
-    updated = cur.rowcount > 0
-    cur.close()
-    return updated
+    with _conn() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, (new_name.strip(), key.strip()))
+        conn.commit()
+        updated = cur.rowcount > 0
+        cur.close()
+        return updated
 
 
 # ===========================
@@ -175,99 +173,99 @@ def list_users_in_group(group_key: str) -> List[Dict[str, Any]]:
 
     Функция возвращает [] если ничего не найдено.
     """
-    conn = _conn()
-    cur = conn.cursor()
+    with _conn() as conn:
+        cur = conn.cursor()
 
-    # (1) time_group_members (актуально для time_groups)
-    try:
-        if _table_exists(cur, "time_group_members"):
-            cur.execute(
-                """
-                SELECT u.user_id, u.username, u.first_name, u.last_name
-                FROM time_group_members tgm
-                LEFT JOIN users u ON u.user_id = tgm.user_id
-                WHERE tgm.group_key = %s
-                ORDER BY COALESCE(u.first_name,'') || ' ' || COALESCE(u.last_name,''),
-                         COALESCE(u.username,''), u.user_id::text
-                """,
-                (group_key,),
-            )
-            rows = cur.fetchall()
-            if rows:
-                cur.close()
-                return [
-                    {
-                        "user_id": r[0],
-                        "username": r[1],
-                        "first_name": r[2],
-                        "last_name": r[3],
-                    }
-                    for r in rows
-                ]
-    except Exception:
-        pass
-
-    # (2) duty_group_members + duty_groups (исторически/альтернативно)
-    try:
-        if _table_exists(cur, "duty_group_members") and _table_exists(cur, "duty_groups"):
-            cur.execute(
-                """
-                SELECT u.user_id, u.username, u.first_name, u.last_name
-                FROM duty_group_members gm
-                JOIN duty_groups dg ON dg.id = gm.group_id
-                LEFT JOIN users u ON u.user_id = gm.user_id
-                WHERE dg.key = %s
-                ORDER BY COALESCE(u.first_name,'') || ' ' || COALESCE(u.last_name,''),
-                         COALESCE(u.username,''), u.user_id::text
-                """,
-                (group_key,),
-            )
-            rows = cur.fetchall()
-            if rows:
-                cur.close()
-                return [
-                    {
-                        "user_id": r[0],
-                        "username": r[1],
-                        "first_name": r[2],
-                        "last_name": r[3],
-                    }
-                    for r in rows
-                ]
-    except Exception:
-        pass
-
-    # (3) group_users (старое имя таблицы связей)
-    try:
-        if _table_exists(cur, "group_users"):
-            cur.execute(
-                """
-                SELECT u.user_id, u.username, u.first_name, u.last_name
-                FROM group_users gu
-                LEFT JOIN users u ON u.user_id = gu.user_id
-                WHERE gu.group_key = %s
-                ORDER BY COALESCE(u.first_name,'') || ' ' || COALESCE(u.last_name,''),
-                         COALESCE(u.username,''), u.user_id::text
-                """,
-                (group_key,),
-            )
-            rows = cur.fetchall()
-            if rows:
-                cur.close()
-                return [
-                    {
-                        "user_id": r[0],
-                        "username": r[1],
-                        "first_name": r[2],
-                        "last_name": r[3],
-                    }
-                    for r in rows
-                ]
-    except Exception:
-        pass
-
-    cur.close()
-    return []
+        # (1) time_group_members (актуально для time_groups)
+        try:
+            if _table_exists(cur, "time_group_members"):
+                cur.execute(
+                    """
+                    SELECT u.user_id, u.username, u.first_name, u.last_name
+                    FROM time_group_members tgm
+                    LEFT JOIN users u ON u.user_id = tgm.user_id
+                    WHERE tgm.group_key = %s
+                    ORDER BY COALESCE(u.first_name,'') || ' ' || COALESCE(u.last_name,''),
+                             COALESCE(u.username,''), u.user_id::text
+                    """,
+                    (group_key,),
+                )
+                rows = cur.fetchall()
+                if rows:
+                    cur.close()
+                    return [
+                        {
+                            "user_id": r[0],
+                            "username": r[1],
+                            "first_name": r[2],
+                            "last_name": r[3],
+                        }
+                        for r in rows
+                    ]
+        except Exception:
+            pass
+
+        # (2) duty_group_members + duty_groups (исторически/альтернативно)
+        try:
+            if _table_exists(cur, "duty_group_members") and _table_exists(cur, "duty_groups"):
+                cur.execute(
+                    """
+                    SELECT u.user_id, u.username, u.first_name, u.last_name
+                    FROM duty_group_members gm
+                    JOIN duty_groups dg ON dg.id = gm.group_id
+                    LEFT JOIN users u ON u.user_id = gm.user_id
+                    WHERE dg.key = %s
+                    ORDER BY COALESCE(u.first_name,'') || ' ' || COALESCE(u.last_name,''),
+                             COALESCE(u.username,''), u.user_id::text
+                    """,
+                    (group_key,),
+                )
+                rows = cur.fetchall()
+                if rows:
+                    cur.close()
+                    return [
+                        {
+                            "user_id": r[0],
+                            "username": r[1],
+                            "first_name": r[2],
+                            "last_name": r[3],
+                        }
+                        for r in rows
+                    ]
+        except Exception:
+            pass
+
+        # (3) group_users (старое имя таблицы связей)
+        try:
+            if _table_exists(cur, "group_users"):
+                cur.execute(
+                    """
+                    SELECT u.user_id, u.username, u.first_name, u.last_name
+                    FROM group_users gu
+                    LEFT JOIN users u ON u.user_id = gu.user_id
+                    WHERE gu.group_key = %s
+                    ORDER BY COALESCE(u.first_name,'') || ' ' || COALESCE(u.last_name,''),
+                             COALESCE(u.username,''), u.user_id::text
+                    """,
+                    (group_key,),
+                )
+                rows = cur.fetchall()
+                if rows:
+                    cur.close()
+                    return [
+                        {
+                            "user_id": r[0],
+                            "username": r[1],
+                            "first_name": r[2],
+                            "last_name": r[3],
+                        }
+                        for r in rows
+                    ]
+        except Exception:
+            pass
+
+        cur.close()
+        return []
 
 
 def  get_user_group(user_id: int) -> Optional[Dict[str, Any]]:
@@ -281,72 +279,73 @@ def  get_user_group(user_id: int) -> Optional[Dict[str, Any]]:
       2) duty_group_members(user_id, group_id) + duty_groups(id,key,name)
       3) group_users(user_id, group_key) + time_groups(key,name)
     """
-    conn = _conn()
-    cur = conn.cursor()
+    with _conn() as conn:
+        cur = conn.cursor()
 
-    # (1) time_group_members → time_groups
-    try:
-        if _table_exists(cur, "time_group_members"):
-            cur.execute(
-                f"""
-                SELECT tg.key, COALESCE(NULLIF(tg.name, ''), tg.key) AS name
-                FROM time_group_members tgm
-                JOIN {TABLE} tg ON tg.key = tgm.group_key
-                WHERE tgm.user_id = %s
-                LIMIT 1
-                """,
-                (user_id,),
-            )
-            row = cur.fetchone()
-            if row:
-                cur.close()
-                return {"key": row[0], "name": row[1]}
-    except Exception:
-        pass
-
-    # (2) duty_group_members → duty_groups (исторический вариант)
-    try:
-        if _table_exists(cur, "duty_group_members") and _table_exists(cur, "duty_groups"):
-            cur.execute(
-                """
-                SELECT dg.key, COALESCE(NULLIF(dg.name, ''), dg.key) AS name
-                FROM duty_group_members gm
-                JOIN duty_groups dg ON dg.id = gm.group_id
-                WHERE gm.user_id = %s
-                LIMIT 1
-                """,
-                (user_id,),
-            )
-            row = cur.fetchone()
-            if row:
-                cur.close()
-                return {"key": row[0], "name": row[1]}
-    except Exception:
-        pass
-
-    # (3) group_users → time_groups
-    try:
-        if _table_exists(cur, "group_users"):
-            cur.execute(
-                f"""
-                SELECT tg.key, COALESCE(NULLIF(tg.name, ''), tg.key) AS name
-                FROM group_users gu
-                JOIN {TABLE} tg ON tg.key = gu.group_key
-                WHERE gu.user_id = %s
-                LIMIT 1
-                """,
-                (user_id,),
-            )
-            row = cur.fetchone()
-            if row:
-                cur.close()
-                return {"key": row[0], "name": row[1]}
-    except Exception:
-        pass
-
-    cur.close()
-    return None
+        # (1) time_group_members → time_groups
+        try:
+            if _table_exists(cur, "time_group_members"):
+                cur.execute(
+                    f"""
+                    SELECT tg.key, COALESCE(NULLIF(tg.name, ''), tg.key) AS name
+                    FROM time_group_members tgm
+                    JOIN {TABLE} tg ON tg.key = tgm.group_key
+                    WHERE tgm.user_id = %s
+                    LIMIT 1
+                    """,
+                    (user_id,),
+                )
+                row = cur.fetchone()
+                if row:
+                    cur.close()
+                    return {"key": row[0], "name": row[1]}
+        except Exception:
+            pass
+
+        # (2) duty_group_members → duty_groups (исторический вариант)
+        try:
+            if _table_exists(cur, "duty_group_members") and _table_exists(cur, "duty_groups"):
+                cur.execute(
+                    """
+                    SELECT dg.key, COALESCE(NULLIF(dg.name, ''), dg.key) AS name
+                    FROM duty_group_members gm
+                    JOIN duty_groups dg ON dg.id = gm.group_id
+                    WHERE gm.user_id = %s
+                    LIMIT 1
+                    """,
+                    (user_id,),
+                )
+                row = cur.fetchone()
+                if row:
+                    cur.close()
+                    return {"key": row[0], "name": row[1]}
+        except Exception:
+            pass
+
+        # (3) group_users → time_groups
+        try:
+            if _table_exists(cur, "group_users"):
+                cur.execute(
+                    f"""
+                    SELECT tg.key, COALESCE(NULLIF(tg.name, ''), tg.key) AS name
+                    FROM group_users gu
+                    JOIN {TABLE} tg ON tg.key = gu.group_key
+                    WHERE gu.user_id = %s
+                    LIMIT 1
+                    """,
+                    (user_id,),
+                )
+                row = cur.fetchone()
+                if row:
+                    cur.close()
+                    return {"key": row[0], "name": row[1]}
+        except Exception:
+            pass
 
+        cur.close()
+        return None
+
+@invalidates_roster
 def add_user_to_time_group(group_key: str, user_id: int, base_pos: int) -> bool:
     """
     Добавляет/обновляет участника группы в time_group_members.
@@ -358,25 +357,26 @@ def add_user_to_time_group(group_key: str, user_id: int, base_pos: int) -> bool:
         PRIMARY KEY (user_id, group_key)
       );
     """
-    conn = _conn()
-    with conn.cursor() as cur:
-        # убеждаемся, что группа существует
-        cur.execute(f"SELECT 1 FROM {TABLE} WHERE key=%s LIMIT 1", (group_key,))
-        if cur.fetchone() is None:
-            return False
-        # апсертом пишем участника
-        cur.execute("""
-            INSERT INTO time_group_members (user_id, group_key, base_pos)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (user_id, group_key) DO UPDATE SET base_pos=EXCLUDED.base_pos
-        """, (int(user_id), group_key, int(base_pos)))
-        conn.commit()
-        return True
-
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            # убеждаемся, что группа существует
+            cur.execute(f"SELECT 1 FROM {TABLE} WHERE key=%s LIMIT 1", (group_key,))
+            if cur.fetchone() is None:
+                return False
+            # апсертом пишем участника
+            cur.execute("""
+                INSERT INTO time_group_members (user_id, group_key, base_pos)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (user_id, group_key) DO UPDATE SET base_pos=EXCLUDED.base_pos
+            """, (int(user_id), group_key, int(base_pos)))
+            conn.commit()
+            return True
+
+@invalidates_roster
 def remove_user_from_time_group(group_key: str, user_id: int) -> bool:
-    conn = _conn()
-    with conn.cursor() as cur:
-        cur.execute("DELETE FROM time_group_members WHERE user_id=%s AND group_key=%s", (int(user_id), group_key))
-        conn.commit()
-        return cur.rowcount > 0
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM time_group_members WHERE user_id=%s AND group_key=%s", (int(user_id), group_key))
+            conn.commit()
+            return cur.rowcount > 0
 
@@ -9,29 +9,13 @@ logger = logging.getLogger(__name__)
 
 @contextmanager
 def _cursor():
-    if hasattr(db_connection, "get_connection"):
-        conn = db_connection.get_connection()
-    elif hasattr(db_connection, "connect"):
-        conn = db_connection.connect()
-    elif hasattr(db_connection, "connection"):
-        conn = db_connection.connection()
-    else:
-        raise RuntimeError("db_connection: нет метода get_connection/connect/connection")
-    cur = None
-    try:
+    with db_connection.acquire() as conn:
         cur = conn.cursor()
-        yield conn, cur
-        try: conn.commit()
-        except Exception: pass
-    except Exception:
-        try: conn.rollback()
-        except Exception: pass
-        raise
-    finally:
-        try: cur.close()
-        except Exception: pass
-        try: conn.close()
-        except Exception: pass
+        try:
+            yield conn, cur
+        finally:
+            try: cur.close()
+            except Exception: pass
 
 def set_link(group_key: str, time_group_key: str) -> None:
     sql = """
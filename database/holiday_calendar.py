@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Производственный календарь (ru_is_holiday) в памяти.
+
+Год загружается целиком при первом обращении к любой его дате и хранится
+битовой маской NumPy (bool на каждый день года): True — выходной/праздник.
+Дни, которых нет в ru_is_holiday, считаются по дню недели (сб/вс), как раньше
+в is_holiday_or_weekend. Диапазонные операции платят один запрос на год,
+а не на день:
+
+    flags = holiday_calendar.is_holiday(dates)        # np.ndarray[bool]
+    holiday_calendar.is_holiday_one(date(2025, 5, 1)) # True
+
+Импорт производственного календаря — import_production_calendar(data):
+  - формат открытых данных (data.gov.ru / consultant): строка на год,
+    колонки «Год/Месяц, Январь, …, Декабрь, …», в месяце — список нерабочих
+    дней через запятую; «*» — сокращённый рабочий день, «+» — перенесённый выходной;
+  - простой список: «YYYY-MM-DD[,0|1]» в строке (без флага — праздник).
+Импортированные годы заменяются целиком в одной транзакции.
+"""
+import csv
+import io
+import logging
+import re
+import threading
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from . import cache_bus
+from .connection import db_connection
+
+logger = logging.getLogger(__name__)
+
+_table_ensured = False
+
+MONTHS = ("январь", "февраль", "март", "апрель", "май", "июнь",
+          "июль", "август", "сентябрь", "октябрь", "ноябрь", "декабрь")
+
+_ISO_LINE = re.compile(r"^\s*(\d{4}-\d{2}-\d{2})\s*(?:[,;]\s*(\S+))?\s*$")
+_TRUE = ("1", "true", "t", "yes", "y", "да")
+_FALSE = ("0", "false", "f", "no", "n", "нет")
+
+
+def _ensure_table() -> None:
+    global _table_ensured
+    if _table_ensured:
+        return
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS ru_is_holiday (
+                dt         DATE    PRIMARY KEY,
+                is_holiday BOOLEAN NOT NULL
+            )
+        """)
+    _table_ensured = True
+
+
+def _year_start(year: int) -> np.datetime64:
+    return np.datetime64(f"{year:04d}-01-01", "D")
+
+
+def _weekend_mask(year: int) -> np.ndarray:
+    days = np.arange(_year_start(year), _year_start(year + 1), dtype="datetime64[D]")
+    # 1970-01-01 — четверг: (дни от эпохи + 3) % 7 == 0 → понедельник
+    return (days.astype(np.int64) + 3) % 7 >= 5
+
+
+class HolidayCalendar:
+    """Маски выходных/праздников по годам: {год: np.ndarray[bool] длиной 365/366}."""
+
+    def __init__(self):
+        self._years: Dict[int, np.ndarray] = {}
+        self._lock = threading.Lock()   # только на обмен словаря — запрос в БД идёт без него
+        self._generation = 0            # растёт при invalidate(): загрузку «до сброса» не сохраняем
+
+    @staticmethod
+    def _load(years: List[int]) -> Dict[int, np.ndarray]:
+        _ensure_table()
+        with db_connection.acquire() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT dt, is_holiday FROM ru_is_holiday WHERE dt >= %s AND dt < %s",
+                (date(years[0], 1, 1), date(years[-1] + 1, 1, 1)),
+            )
+            rows = cur.fetchall()
+        masks = {y: _weekend_mask(y) for y in years}
+        for dt, flag in rows:
+            mask = masks.get(dt.year)
+            if mask is not None:
+                mask[dt.timetuple().tm_yday - 1] = bool(flag)
+        logger.debug("Календарь загружен: %s (%s строк)", years, len(rows))
+        return masks
+
+    def _ensure_years(self, years: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Маски запрошенных лет; недостающие — одним запросом вне блокировки."""
+        want = set(int(y) for y in years)
+        with self._lock:
+            masks = {y: self._years[y] for y in want if y in self._years}
+            generation = self._generation
+        missing = sorted(want - masks.keys())
+        if missing:
+            loaded = self._load(missing)
+            with self._lock:
+                if self._generation == generation:
+                    for y, mask in loaded.items():
+                        self._years.setdefault(y, mask)
+            masks.update(loaded)
+        return masks
+
+    def preload(self, date_from: date, date_to: date) -> None:
+        """Загрузить все годы периода (одним запросом)."""
+        lo, hi = sorted((date_from.year, date_to.year))
+        self._ensure_years(range(lo, hi + 1))
+
+    def is_holiday(self, dates) -> np.ndarray:
+        """Векторно: даты (date/ISO-строки/datetime64) → np.ndarray[bool] той же формы."""
+        arr = np.asarray(dates, dtype="datetime64[D]")
+        out = np.zeros(arr.shape, dtype=bool)
+        if arr.size == 0:
+            return out
+        years = arr.astype("datetime64[Y]").astype(np.int64) + 1970
+        uniq = np.unique(years)
+        masks = self._ensure_years(uniq.tolist())
+        for y in uniq:
+            sel = years == y
+            out[sel] = masks[int(y)][(arr[sel] - _year_start(int(y))).astype(np.int64)]
+        return out
+
+    def is_holiday_one(self, d: date) -> bool:
+        mask = self._ensure_years((d.year,))[d.year]
+        return bool(mask[d.timetuple().tm_yday - 1])
+
+    def flags(self, date_from: date, date_to: date) -> Dict[date, bool]:
+        """{дата: выходной/праздник} за период."""
+        if date_to < date_from:
+            return {}
+        days = np.arange(np.datetime64(date_from, "D"), np.datetime64(date_to, "D") + 1)
+        values = self.is_holiday(days)
+        return {date_from + timedelta(days=i): bool(v) for i, v in enumerate(values)}
+
+    def invalidate(self, year: int = None) -> None:
+        with self._lock:
+            self._generation += 1
+            if year is None:
+                self._years.clear()
+            else:
+                self._years.pop(int(year), None)
+        cache_bus.publish("holidays", year)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"years": sorted(self._years)}
+
+
+holiday_calendar = HolidayCalendar()
+cache_bus.register("holidays", lambda key: holiday_calendar.invalidate(int(key) if key else None))
+
+
+# ===========================
+# ИМПОРТ
+# ===========================
+
+def _parse_month_cell(year: int, month: int, cell: str) -> List[date]:
+    """«1,2,3*,8+» → нерабочие дни месяца («*» — сокращённый рабочий день)."""
+    out = []
+    for token in (cell or "").split(","):
+        token = token.strip()
+        if not token or token.endswith("*"):
+            continue
+        out.append(date(year, month, int(token.rstrip("+"))))
+    return out
+
+
+def parse_production_calendar(data: bytes) -> Tuple[Dict[int, Set[date]], Dict[date, bool], List[str]]:
+    """
+    → ({год: нерабочие дни} для годовых строк, {дата: флаг} для построчного формата, ошибки).
+    Ошибочная строка пропускается, номер и причина попадают в список ошибок.
+    """
+    text = data.decode("utf-8-sig")
+    years: Dict[int, Set[date]] = {}
+    single: Dict[date, bool] = {}
+    errors: List[str] = []
+
+    month_cols: List[int] = []
+    for lineno, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not row or not any(c.strip() for c in row):
+            continue
+        head = row[0].strip()
+        if not month_cols and head.lower().startswith("год"):
+            names = [c.strip().lower() for c in row]
+            month_cols = [names.index(m) for m in MONTHS if m in names]
+            if len(month_cols) != 12:
+                errors.append(f"{lineno}: в заголовке нет всех 12 месяцев")
+                month_cols = []
+            continue
+        if month_cols and re.fullmatch(r"\d{4}", head):
+            year = int(head)
+            try:
+                days: Set[date] = set()
+                for month, col in enumerate(month_cols, start=1):
+                    days.update(_parse_month_cell(year, month, row[col] if col < len(row) else ""))
+                years[year] = days
+            except (ValueError, IndexError) as e:
+                errors.append(f"{lineno}: {year}: {e}")
+            continue
+        m = _ISO_LINE.match(",".join(row))
+        if not m:
+            if lineno == 1:
+                continue  # заголовок простого списка (dt,is_holiday)
+            errors.append(f"{lineno}: не распознана строка «{','.join(row)[:40]}»")
+            continue
+        flag = (m.group(2) or "1").strip().lower()
+        if flag not in _TRUE + _FALSE:
+            errors.append(f"{lineno}: флаг «{flag}» — ожидалось 1/0")
+            continue
+        try:
+            single[date.fromisoformat(m.group(1))] = flag in _TRUE
+        except ValueError as e:
+            errors.append(f"{lineno}: {e}")
+    return years, single, errors
+
+
+def import_production_calendar(data: bytes) -> Dict[str, object]:
+    """
+    Загрузить производственный календарь в ru_is_holiday.
+    Годовые строки заменяют год целиком (все дни года, рабочие — False),
+    построчные даты — заменяют только себя. Одна транзакция.
+    Возвращает {"years", "days", "holidays", "errors"}.
+    """
+    years, single, errors = parse_production_calendar(data)
+    rows: Dict[date, bool] = {}
+    for year, off_days in years.items():
+        d, end = date(year, 1, 1), date(year + 1, 1, 1)
+        while d < end:
+            rows[d] = d in off_days
+            d += timedelta(days=1)
+    rows.update(single)
+    if not rows:
+        return {"years": [], "days": 0, "holidays": 0, "errors": errors}
+
+    _ensure_table()
+    with db_connection.transaction() as conn, conn.cursor() as cur:
+        for year in years:
+            cur.execute("DELETE FROM ru_is_holiday WHERE dt >= %s AND dt < %s",
+                        (date(year, 1, 1), date(year + 1, 1, 1)))
+        if single:
+            cur.execute("DELETE FROM ru_is_holiday WHERE dt = ANY(%s)", (sorted(single),))
+        execute_values(cur, "INSERT INTO ru_is_holiday (dt, is_holiday) VALUES %s",
+                       sorted(rows.items()), page_size=1000)
+
+    touched = sorted({d.year for d in rows})
+    for year in touched:
+        holiday_calendar.invalidate(year)
+    logger.info("Производственный календарь: %s дн. за %s, ошибок %s", len(rows), touched, len(errors))
+    return {
+        "years": touched,
+        "days": len(rows),
+        "holidays": sum(1 for v in rows.values() if v),
+        "errors": errors,
+    }
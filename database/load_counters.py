@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Счётчики нагрузки, которые ведутся вместе с назначениями.
+
+  duty_load_counters  (group_key, duty_id, user_id, bucket) → cnt
+      bucket — первое число месяца on_date; сколько раз человек получал
+      обязанность в группе за месяц.
+  office_day_counters (group_key, user_id) → cnt
+      сколько всего офис-дней у человека в группе.
+
+Счётчики меняются в той же транзакции, что и запись назначений
+(duty_repository.set_assignment/save_plan, location_repository): писатель
+передаёт старые и новые строки, сюда приходят только разности. Таблицы
+создаёт ensure_counter_tables() при старте бота (main.on_startup), поэтому
+путь записи DDL не делает и лишних соединений из пула не берёт. Если данные
+правили в обход бота — /admin_counters_rebuild пересчитывает всё заново.
+
+Офис-дни «до даты» = итог счётчика минус строки на эту дату и позже. Это
+только будущие и текущие назначения, их немного, поэтому проверка стоит
+O(1) и не зависит от длины истории.
+"""
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from .connection import db_connection
+from .schema import schema_caps
+
+logger = logging.getLogger(__name__)
+
+_tables_ensured = False
+
+# (group_key, duty_id, on_date, user_id)
+DutyRow = Tuple[str, int, date, int]
+
+
+def month_bucket(d: date) -> date:
+    return d.replace(day=1)
+
+
+def ensure_counter_tables() -> None:
+    """Таблицы счётчиков (PostgreSQL). Безопасно вызывать многократно; не из транзакции писателя."""
+    global _tables_ensured
+    if _tables_ensured:
+        return
+    if schema_caps.has_table("duty_load_counters") and schema_caps.has_table("office_day_counters"):
+        _tables_ensured = True
+        return
+    with db_connection.transaction() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('duty_load_counters') IS NULL")
+        created = bool(cur.fetchone()[0])
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS duty_load_counters (
+                group_key TEXT    NOT NULL,
+                duty_id   INTEGER NOT NULL,
+                user_id   BIGINT  NOT NULL,
+                bucket    DATE    NOT NULL,
+                cnt       INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (group_key, duty_id, user_id, bucket)
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS office_day_counters (
+                group_key TEXT   NOT NULL,
+                user_id   BIGINT NOT NULL,
+                cnt       INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (group_key, user_id)
+            )
+        """)
+        if created:
+            # первый запуск: наполняем по существующей истории
+            _fill(cur)
+    schema_caps.invalidate()
+    _tables_ensured = True
+
+
+# ===========================
+# ЗАПИСЬ (внутри транзакции писателя)
+# ===========================
+
+def apply_duty_changes(cur, old_rows: Iterable[DutyRow], new_rows: Iterable[DutyRow]) -> None:
+    """Учесть замену old_rows → new_rows (одинаковые строки взаимно сокращаются)."""
+    deltas: Dict[Tuple[str, int, int, date], int] = {}
+    for sign, rows in ((-1, old_rows), (1, new_rows)):
+        for g, duty_id, d, uid in rows:
+            k = (str(g), int(duty_id), int(uid), month_bucket(d))
+            deltas[k] = deltas.get(k, 0) + sign
+    values = [k + (v,) for k, v in deltas.items() if v]
+    if not values:
+        return
+    execute_values(cur, """
+        INSERT INTO duty_load_counters (group_key, duty_id, user_id, bucket, cnt)
+        VALUES %s
+        ON CONFLICT (group_key, duty_id, user_id, bucket)
+        DO UPDATE SET cnt = duty_load_counters.cnt + EXCLUDED.cnt
+    """, values, page_size=1000)
+
+
+def apply_office_changes(cur, deltas: Dict[Tuple[str, int], int]) -> None:
+    """deltas: {(group_key, user_id): +n/-n} офис-дней."""
+    values = [(str(g), int(uid), int(v)) for (g, uid), v in deltas.items() if v]
+    if not values:
+        return
+    execute_values(cur, """
+        INSERT INTO office_day_counters (group_key, user_id, cnt)
+        VALUES %s
+        ON CONFLICT (group_key, user_id)
+        DO UPDATE SET cnt = office_day_counters.cnt + EXCLUDED.cnt
+    """, values, page_size=1000)
+
+
+def office_deltas(old_rows: Iterable[Tuple[str, int, str]],
+                  new_rows: Iterable[Tuple[str, int, str]]) -> Dict[Tuple[str, int], int]:
+    """(group_key, user_id, location) до/после → разности офис-дней."""
+    deltas: Dict[Tuple[str, int], int] = {}
+    for sign, rows in ((-1, old_rows), (1, new_rows)):
+        for g, uid, loc in rows:
+            if loc == "office":
+                k = (str(g), int(uid))
+                deltas[k] = deltas.get(k, 0) + sign
+    return deltas
+
+
+# ===========================
+# ЧТЕНИЕ
+# ===========================
+
+def office_days_before(group_keys: List[str], before: date) -> Dict[Tuple[str, int], int]:
+    """Офис-дни до даты (не включая): {(group_key, user_id): count}."""
+    ensure_counter_tables()
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.group_key, c.user_id, c.cnt - COALESCE(f.cnt, 0)
+            FROM office_day_counters c
+            LEFT JOIN (
+                SELECT group_key, user_id, COUNT(*) AS cnt
+                FROM location_assignments
+                WHERE group_key = ANY(%s) AND location='office' AND on_date >= %s
+                GROUP BY group_key, user_id
+            ) f ON f.group_key = c.group_key AND f.user_id = c.user_id
+            WHERE c.group_key = ANY(%s)
+        """, (list(group_keys), before, list(group_keys)))
+        return {(str(g), int(uid)): int(cnt) for g, uid, cnt in cur.fetchall() if cnt}
+
+
+def get_duty_load(group_key: Optional[str], month_from: date, month_to: date) -> List[Dict]:
+    """
+    Свод по обязанностям за месяцы [month_from, month_to]:
+    [{"group_key","duty_id","user_id","cnt"}] по убыванию cnt.
+    """
+    ensure_counter_tables()
+    where, params = ["bucket BETWEEN %s AND %s", "cnt <> 0"], [month_bucket(month_from), month_bucket(month_to)]
+    if group_key:
+        where.append("group_key = %s"); params.append(group_key)
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT group_key, duty_id, user_id, SUM(cnt)
+            FROM duty_load_counters
+            WHERE {' AND '.join(where)}
+            GROUP BY group_key, duty_id, user_id
+            ORDER BY SUM(cnt) DESC, group_key, duty_id, user_id
+        """, params)
+        return [{"group_key": r[0], "duty_id": r[1], "user_id": r[2], "cnt": int(r[3])} for r in cur.fetchall()]
+
+
+# ===========================
+# ПЕРЕСЧЁТ
+# ===========================
+
+def _fill(cur) -> Dict[str, int]:
+    cur.execute("DELETE FROM duty_load_counters")
+    cur.execute("""
+        INSERT INTO duty_load_counters (group_key, duty_id, user_id, bucket, cnt)
+        SELECT group_key, duty_id, user_id, date_trunc('month', on_date)::date, COUNT(*)
+        FROM duty_assignments
+        GROUP BY 1, 2, 3, 4
+    """)
+    duty_rows = cur.rowcount
+    cur.execute("DELETE FROM office_day_counters")
+    cur.execute("""
+        INSERT INTO office_day_counters (group_key, user_id, cnt)
+        SELECT group_key, user_id, COUNT(*)
+        FROM location_assignments
+        WHERE location='office'
+        GROUP BY 1, 2
+    """)
+    return {"duty": duty_rows, "office": cur.rowcount}
+
+
+def rebuild_counters() -> Dict[str, int]:
+    """Пересчитать оба счётчика из duty_assignments/location_assignments одной транзакцией."""
+    ensure_counter_tables()
+    with db_connection.transaction() as conn, conn.cursor() as cur:
+        cur.execute("LOCK TABLE duty_load_counters, office_day_counters IN EXCLUSIVE MODE")
+        res = _fill(cur)
+    logger.info("Счётчики пересчитаны: duty=%s, office=%s", res["duty"], res["office"])
+    return res
@@ -1,31 +1,58 @@
 # /home/telegrambot/shift_tracker_bot/database/location_repository.py
 # -*- coding: utf-8 -*-
-from datetime import date, time, datetime, timedelta
+import logging
+import threading
+from datetime import date, timedelta
 from typing import List, Dict, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from database import cache_bus
 from database.connection import db_connection
 from database import time_repository as time_repo
+from database.roster_cache import get_roster
+from database.holiday_calendar import holiday_calendar
+from database.coordination import LOCK_LOCATION, PLAN_RETRIES, PlanConflict, cursor_swaps, lock_groups, swap_cursors
+from database.load_counters import apply_office_changes, office_deltas, office_days_before
+from logic.roster_engine import build_roster, on_duty_members
+from logic.location_planner import LocationRow, LocationState, OFFICE, plan_group_day
+
+logger = logging.getLogger(__name__)
+
+# Версия данных location_assignments в этом процессе: растёт после каждой записи.
+# Входит в ключи кэшей, которые показывают 🏢/🏠 (обзор /today и т.п.).
+_locations_version = 0
+_version_lock = threading.Lock()
+
+
+def locations_version() -> int:
+    return _locations_version
+
+
+def bump_locations_version() -> None:
+    global _locations_version
+    with _version_lock:
+        _locations_version += 1
+    cache_bus.publish("locations")
+
+cache_bus.register("locations", lambda key: bump_locations_version())
 
 def is_holiday_or_weekend(d: date) -> bool:
-    conn = db_connection.get_connection()
-    with conn.cursor() as cur:
-        cur.execute("SELECT is_holiday FROM ru_is_holiday WHERE dt = %s", (d,))
-        row = cur.fetchone()
-        if row is not None:
-            return bool(row[0])
-    # fallback: суббота/воскресенье
-    return d.weekday() >= 5
-
-def _parse_hhmm(s: str) -> time:
-    hh, mm = s.split(":")
-    return time(int(hh), int(mm))
-
-def _is_night_slot(start_hhmm: str, end_hhmm: str) -> bool:
-    """
-    Ночь = интервал, который пересекает 00:00 (например, 20:00–08:00 или 20:00–04:00).
-    """
-    s = _parse_hhmm(start_hhmm)
-    e = _parse_hhmm(end_hhmm)
-    return (datetime.combine(date.today(), e) <= datetime.combine(date.today(), s))
+    """Выходной/праздник по ru_is_holiday (нет записи — сб/вс); год читается один раз."""
+    return holiday_calendar.is_holiday_one(d)
+
+def holiday_flags(date_from: date, date_to: date) -> Dict[date, bool]:
+    """{дата: выходной/праздник} за период — из календаря в памяти (запрос на год, не на день)."""
+    return holiday_calendar.flags(date_from, date_to)
+
+def get_location_cursors(group_keys: List[str]) -> Dict[str, int]:
+    """RR-курсоры локаций: {group_key: last_user_id}."""
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT group_key, last_user_id FROM location_rr_cursor
+            WHERE group_key = ANY(%s) AND last_user_id IS NOT NULL
+        """, (list(group_keys),))
+        return {str(g): int(uid) for g, uid in cur.fetchall()}
 
 def get_on_duty_members(group_key: str, on_date: date) -> List[Dict]:
     """
@@ -37,82 +64,118 @@ def get_on_duty_members(group_key: str, on_date: date) -> List[Dict]:
     info = time_repo.get_group_info(group_key)
     if not info:
         return []
-    slots = info.get("slots", [])
-    members = info.get("members", [])
-
-    from logic.duty import resolve_slot_ddnn_alternating as resolve4
-    from logic.duty import resolve_slot_ddnn_alt_8 as resolve8
+    slots = {s["pos"]: s for s in info.get("slots", [])}
 
     results: List[Dict] = []
-    epoch = info.get("epoch")
-    period = int(info.get("period") or info.get("rotation_period_days") or 4)
-
-    for m in members:
-        user_id = int(m.get("user_id"))
-        base_pos = int(m.get("base_pos") or 0)
-        slot_idx = resolve8(epoch, 8, base_pos, on_date) if period == 8 else resolve4(epoch, 4, base_pos, on_date)
-        if slot_idx is None:
-            continue
-        slot = next((s for s in slots if s["pos"] == slot_idx), None)
-        if not slot:
-            continue
-        results.append({"user_id": user_id, "slot_pos": slot_idx, "slot": slot})
+    for m, slot_idx in on_duty_members(info, on_date, require_slot=True):
+        results.append({"user_id": int(m.get("user_id")), "slot_pos": slot_idx, "slot": slots[slot_idx]})
     return results
 
 def get_office_days_count(group_key: str, user_id: int, until_date: Optional[date] = None) -> int:
     """
-    Считает общее число визитов в офис (можно расширить окном за период).
+    Число визитов в офис (до until_date включительно) — по счётчику office_day_counters,
+    без подсчёта всей истории.
     """
-    conn = db_connection.get_connection()
-    with conn.cursor() as cur:
-        if until_date:
-            cur.execute("""
-                SELECT COUNT(*) FROM location_assignments
-                WHERE group_key=%s AND user_id=%s AND location='office' AND on_date <= %s
-            """, (group_key, user_id, until_date))
-        else:
-            cur.execute("""
-                SELECT COUNT(*) FROM location_assignments
-                WHERE group_key=%s AND user_id=%s AND location='office'
-            """, (group_key, user_id))
-        return int(cur.fetchone()[0] or 0)
+    before = date.max if until_date is None else until_date + timedelta(days=1)
+    return office_days_before([group_key], before).get((group_key, int(user_id)), 0)
+
+# Размер пачки строк для одного многострочного UPSERT
+LOC_WRITE_BATCH = 5000
+# Не больше года за один вызов (как MAX_PLAN_DAYS у обязанностей)
+MAX_ASSIGN_DAYS = 366
+
 
-def _pick_one_by_max_office_days(group_key: str, user_ids: List[int], on_date: date, last_user_id: Optional[int]) -> Optional[int]:
+def _write_locations(keys: List[str], planned: List[Tuple[str, date]], rows: List[LocationRow],
+                     cursor_rows: List[Tuple]) -> None:
     """
-    Выбираем одного пользователя среди user_ids:
-      - у кого БОЛЬШЕ всего офис-дней (требование пользователя)
-      - при равенстве — round-robin тай-брейк (после last_user_id)
+    Одна транзакция под advisory-блокировкой групп: курсоры «сравнить и записать»,
+    очистка пересчитанных (группа, дата), UPSERT пачками, счётчики офис-дней.
     """
-    if not user_ids:
-        return None
-    # посчитаем историю
-    stats = [(uid, get_office_days_count(group_key, uid, on_date)) for uid in user_ids]
-    max_cnt = max(cnt for _, cnt in stats)
-    pool = [uid for uid, cnt in stats if cnt == max_cnt]
-    pool_sorted = sorted(pool)  # стабильный порядок
-
-    if last_user_id is None or last_user_id not in pool_sorted:
-        return pool_sorted[0]
-    # RR внутри пула
-    idx = pool_sorted.index(last_user_id)
-    return pool_sorted[(idx + 1) % len(pool_sorted)]
-
-def _cursor_get(group_key: str) -> Optional[int]:
-    conn = db_connection.get_connection()
-    with conn.cursor() as cur:
-        cur.execute("SELECT last_user_id FROM location_rr_cursor WHERE group_key=%s", (group_key,))
-        row = cur.fetchone()
-        return int(row[0]) if row and row[0] is not None else None
-
-def _cursor_set(group_key: str, last_user_id: Optional[int]) -> None:
-    conn = db_connection.get_connection()
-    with conn.cursor() as cur:
-        cur.execute("""
-            INSERT INTO location_rr_cursor (group_key, last_user_id)
-            VALUES (%s, %s)
-            ON CONFLICT (group_key) DO UPDATE SET last_user_id=EXCLUDED.last_user_id
-        """, (group_key, last_user_id))
-        conn.commit()
+    with db_connection.transaction() as conn, conn.cursor() as cur:
+        lock_groups(cur, LOCK_LOCATION, keys)
+        swap_cursors(cur, "location_rr_cursor", ("group_key",), cursor_rows)
+        old_rows = execute_values(cur, """
+            DELETE FROM location_assignments la
+            USING (VALUES %s) AS v(group_key, on_date)
+            WHERE la.group_key = v.group_key AND la.on_date = v.on_date
+            RETURNING la.group_key, la.user_id, la.location
+        """, planned, page_size=1000, fetch=True)
+        for i in range(0, len(rows), LOC_WRITE_BATCH):
+            execute_values(cur, """
+                INSERT INTO location_assignments (group_key, on_date, user_id, location)
+                VALUES %s
+                ON CONFLICT (group_key, on_date, user_id) DO UPDATE SET location=EXCLUDED.location
+            """, rows[i:i + LOC_WRITE_BATCH], page_size=LOC_WRITE_BATCH)
+        apply_office_changes(cur, office_deltas(
+            [(g, uid, loc) for g, uid, loc in old_rows],
+            [(g, uid, loc) for g, _, uid, loc in rows],
+        ))
+
+
+def assign_locations_bulk(date_from: date, date_to: date, groups: Optional[List[str]] = None) -> Dict:
+    """
+    Распределение офис/дом по группам (все или groups) на каждый день [date_from, date_to].
+    Правила — logic.location_planner (как были в assign_locations_for_group).
+    Состав смен считается матрицей по циклу, праздники, офис-дни и курсоры
+    читаются один раз, курсоры двигаются в памяти; запись — _write_locations.
+    Если курсоры за это время сдвинула другая реплика — план пересчитывается.
+    Возвращает {"written", "days", "groups", "office": {(group_key, user_id): офис-дней за период}}.
+    """
+    if date_to < date_from:
+        date_from, date_to = date_to, date_from
+    days = (date_to - date_from).days + 1
+    if days > MAX_ASSIGN_DAYS:
+        raise ValueError(f"слишком длинный период: {days} дн. (максимум {MAX_ASSIGN_DAYS})")
+    infos = get_roster().groups()
+    if groups:
+        wanted = {str(g) for g in groups}
+        infos = [g for g in infos if str(g["key"]) in wanted]
+    keys = [str(g["key"]) for g in infos]
+    result: Dict = {"written": 0, "days": days, "groups": keys, "office": {}}
+    if not infos:
+        return result
+
+    roster = build_roster(infos, date_from, date_to, require_slot=True)
+    holidays = holiday_flags(date_from, date_to)
+    slots_by_group = {str(g["key"]): {s["pos"]: s for s in g.get("slots", [])} for g in infos}
+    members_by_day: List[Tuple[date, Dict[str, list]]] = []
+    for d in roster.dates:
+        by_group: Dict[str, list] = {}
+        for info, m, slot in roster.on_duty(d):
+            k = str(info["key"])
+            by_group.setdefault(k, []).append((int(m["user_id"]), slots_by_group[k][slot]))
+        if by_group:
+            members_by_day.append((d, by_group))
+    if not members_by_day:
+        return result
+
+    for attempt in range(1, PLAN_RETRIES + 1):
+        # офис-дни и курсоры — свежие на каждой попытке
+        state = LocationState(office_days=office_days_before(keys, date_from), cursors=get_location_cursors(keys))
+        cursor_start = dict(state.cursors)
+        planned: List[Tuple[str, date]] = []
+        rows: List[LocationRow] = []
+        for d, by_group in members_by_day:
+            for k, members in by_group.items():
+                planned.append((k, d))
+                rows += plan_group_day(state, k, members, d, holidays.get(d, d.weekday() >= 5))
+        try:
+            _write_locations(keys, planned, rows, cursor_swaps(cursor_start, state.cursor_rows()))
+            break
+        except PlanConflict as e:
+            # другая реплика распределила те же группы — считаем заново
+            if attempt == PLAN_RETRIES:
+                raise
+            logger.info("assign_locations_bulk: %s, попытка %s", e, attempt + 1)
+    bump_locations_version()
+
+    office: Dict[Tuple[str, int], int] = {}
+    for g, _, uid, loc in rows:
+        if loc == OFFICE:
+            office[(g, uid)] = office.get((g, uid), 0) + 1
+    result.update(written=len(rows), office=office)
+    return result
+
 
 def assign_locations_for_group(group_key: str, on_date: date) -> int:
     """
@@ -123,109 +186,48 @@ def assign_locations_for_group(group_key: str, on_date: date) -> int:
         выбранный у кого БОЛЬШЕ всего офис-дней (при равенстве — RR тай-брейк).
     Возвращает количество записанных назначений.
     """
-    members = get_on_duty_members(group_key, on_date)
-    if not members:
-        return 0
-
-    is_hol = is_holiday_or_weekend(on_date)
-    # узнаем, какие слоты ночные
-    night_flags = {m["user_id"]: _is_night_slot(m["slot"]["start"], m["slot"]["end"]) for m in members}
-
-    # делим на дневных и ночных на эту дату
-    day_users = [m["user_id"] for m in members if not night_flags[m["user_id"]]]
-    night_users = [m["user_id"] for m in members if night_flags[m["user_id"]]]
-
-    total_written = 0
-    conn = db_connection.get_connection()
-    with conn.cursor() as cur:
-
-        def _upsert(uid: int, loc: str):
-            cur.execute("""
-                INSERT INTO location_assignments (group_key, on_date, user_id, location, slot_pos)
-                VALUES (%s,%s,%s,%s,
-                        (SELECT slot_pos FROM (
-                            VALUES %s
-                        ) AS v(uid, slot_pos) WHERE uid=%s))
-                ON CONFLICT (group_key, on_date, user_id)
-                DO UPDATE SET location=EXCLUDED.location
-            """,
-            # маленький хак: вместо VALUES %s можно просто передавать None и потом отдельным апдейтом slot_pos,
-            # чтобы не усложнять. Оставим проще:
-            )
-
-        # Проще: сначала очистим на дату для группы, затем вставим заново
-        cur.execute("DELETE FROM location_assignments WHERE group_key=%s AND on_date=%s", (group_key, on_date))
-
-        # ДЕНЬ
-        if day_users:
-            if not is_hol:
-                # будний день: все в офис
-                for uid in day_users:
-                    cur.execute("""
-                        INSERT INTO location_assignments (group_key, on_date, user_id, location)
-                        VALUES (%s,%s,%s,'office')
-                        ON CONFLICT (group_key, on_date, user_id) DO UPDATE SET location='office'
-                    """, (group_key, on_date, uid))
-                    total_written += 1
-            else:
-                # выходной/праздник: один в офис, остальные домой
-                last_uid = _cursor_get(group_key)
-                pick = _pick_one_by_max_office_days(group_key, day_users, on_date, last_uid)
-                for uid in day_users:
-                    loc = 'office' if uid == pick else 'home'
-                    cur.execute("""
-                        INSERT INTO location_assignments (group_key, on_date, user_id, location)
-                        VALUES (%s,%s,%s,%s)
-                        ON CONFLICT (group_key, on_date, user_id) DO UPDATE SET location=EXCLUDED.location
-                    """, (group_key, on_date, uid, loc))
-                    total_written += 1
-                if pick is not None:
-                    _cursor_set(group_key, pick)
-
-        # НОЧЬ — всегда только один в офис
-        if night_users:
-            last_uid = _cursor_get(group_key)
-            pick = _pick_one_by_max_office_days(group_key, night_users, on_date, last_uid)
-            for uid in night_users:
-                loc = 'office' if uid == pick else 'home'
-                cur.execute("""
-                    INSERT INTO location_assignments (group_key, on_date, user_id, location)
-                    VALUES (%s,%s,%s,%s)
-                    ON CONFLICT (group_key, on_date, user_id) DO UPDATE SET location=EXCLUDED.location
-                """, (group_key, on_date, uid, loc))
-                total_written += 1
-            if pick is not None:
-                _cursor_set(group_key, pick)
-
-        conn.commit()
-    return total_written
+    return assign_locations_bulk(on_date, on_date, [group_key])["written"]
 
 def get_locations(on_date: date, group_key: Optional[str] = None) -> List[Dict]:
-    conn = db_connection.get_connection()
-    with conn.cursor() as cur:
+    return get_locations_range(on_date, on_date, group_key)
+
+def get_locations_range(date_from: date, date_to: date, group_key: Optional[str] = None) -> List[Dict]:
+    """Назначения офис/дом за период [date_from, date_to] одним запросом."""
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         if group_key:
             cur.execute("""
                 SELECT group_key, on_date, user_id, location
                 FROM location_assignments
-                WHERE on_date=%s AND group_key=%s
-                ORDER BY group_key, user_id
-            """, (on_date, group_key))
+                WHERE on_date BETWEEN %s AND %s AND group_key=%s
+                ORDER BY on_date, group_key, user_id
+            """, (date_from, date_to, group_key))
         else:
             cur.execute("""
                 SELECT group_key, on_date, user_id, location
                 FROM location_assignments
-                WHERE on_date=%s
-                ORDER BY group_key, user_id
-            """, (on_date,))
+                WHERE on_date BETWEEN %s AND %s
+                ORDER BY on_date, group_key, user_id
+            """, (date_from, date_to))
         rows = cur.fetchall() or []
     return [{"group_key": r[0], "on_date": r[1], "user_id": r[2], "location": r[3]} for r in rows]
 
+def get_location_map(on_date: date, group_key: Optional[str] = None) -> Dict[Tuple[str, int], str]:
+    """{(group_key, user_id): location} на дату — для отрисовки бейджей 🏢/🏠 без повторных запросов."""
+    return get_location_maps(on_date, on_date, group_key).get(on_date, {})
+
+def get_location_maps(date_from: date, date_to: date,
+                      group_key: Optional[str] = None) -> Dict[date, Dict[Tuple[str, int], str]]:
+    """{on_date: {(group_key, user_id): location}} за период — предзагрузка окна для диапазонных видов."""
+    out: Dict[date, Dict[Tuple[str, int], str]] = {}
+    for r in get_locations_range(date_from, date_to, group_key):
+        out.setdefault(r["on_date"], {})[(str(r["group_key"]), int(r["user_id"]))] = r["location"]
+    return out
+
 def office_report(group_key: str, date_from: date, date_to: date) -> List[Dict]:
     """
     Свод по офис-дням за период по группе.
     """
-    conn = db_connection.get_connection()
-    with conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute("""
             SELECT user_id, COUNT(*) AS office_days
             FROM location_assignments
@@ -3,6 +3,9 @@ import logging
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date
 from .connection import db_connection
+from .roster_cache import invalidate_roster, invalidate_roster_if_user_changed
+from .username_index import note_username, forget_user, resolve_username
+from .access_cache import invalidate_access
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +18,7 @@ class UserRepository:
     def get_user(self, user_id: int) -> Optional[Dict]:
         """Получает полную информацию о пользователе"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     SELECT us.user_id, ur.name as role_name, us.is_approved
                     FROM user_settings us
@@ -38,7 +41,7 @@ class UserRepository:
     def create_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None) -> bool:
         """Создает нового пользователя или обновляет его данные"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 # Сохраняем в таблицу users
                 cursor.execute("""
                     INSERT INTO users (user_id, username, first_name, last_name)
@@ -48,7 +51,9 @@ class UserRepository:
                         first_name = EXCLUDED.first_name,
                         last_name = EXCLUDED.last_name,
                         updated_at = NOW()
+                    RETURNING (xmax = 0)
                 """, (user_id, username, first_name, last_name))
+                user_inserted = bool(cursor.fetchone()[0])
 
                 # Получаем ID роли user
                 cursor.execute("SELECT id FROM user_roles WHERE name = %s", (USER_ROLE_USER,))
@@ -60,11 +65,17 @@ class UserRepository:
                     VALUES (%s, %s, NOW(), %s)
                     ON CONFLICT (user_id) DO NOTHING
                 """, (user_id, role_id, False))
-
-                db_connection.get_connection().commit()
-                return True
+                settings_inserted = cursor.rowcount == 1
+
+                conn.commit()
+            invalidate_roster_if_user_changed(user_id, username, first_name, last_name)
+            note_username(user_id, username)
+            # права зависят только от появления строк users/user_settings, не от имени:
+            # повторный /start не сбрасывает кэш и не рассылает сброс по репликам
+            if user_inserted or settings_inserted:
+                invalidate_access(user_id)
+            return True
         except Exception as e:
-            db_connection.get_connection().rollback()
             logger.error(f"Error creating user: {e}")
             return False
 
@@ -75,9 +86,8 @@ class UserRepository:
         - удаляет записи admin_actions, где он был целевым пользователем (на случай отсутствия CASCADE),
         - удаляет его из user_settings и users.
         """
-        conn = db_connection.get_connection()
         try:
-            with conn:
+            with db_connection.transaction() as conn:
                 with conn.cursor() as cur:
                     # 1) если пользователь когда-то был админом действия — зануляем ссылку
                     cur.execute("UPDATE admin_actions SET admin_id = NULL WHERE admin_id = %s;", (user_id,))
@@ -87,19 +97,26 @@ class UserRepository:
                     cur.execute("DELETE FROM user_settings WHERE user_id = %s;", (user_id,))
                     # 4) карточка пользователя
                     cur.execute("DELETE FROM users WHERE user_id = %s;", (user_id,))
+            invalidate_roster()
+            forget_user(user_id)
+            invalidate_access(user_id)
             return True
         except Exception as e:
             logger.error(f"Error removing user: {e}")
-            try:
-                conn.rollback()
-            except Exception:
-                pass
             return False
 
+    def get_user_id_by_username(self, username: str) -> Optional[int]:
+        """user_id по @username (регистр не важен); None, если бот такого не знает"""
+        try:
+            return resolve_username(username)
+        except Exception as e:
+            logger.error(f"Error resolving username: {e}")
+            return None
+
     def approve_user(self, user_id: int, admin_id: int) -> bool:
         """Одобряет пользователя"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     UPDATE user_settings 
                     SET is_approved = TRUE, updated_at = NOW()
@@ -112,17 +129,17 @@ class UserRepository:
                     VALUES (%s, %s, %s, %s)
                 """, (admin_id, 'user_approval', user_id, '{"action": "approve"}'))
 
-                db_connection.get_connection().commit()
-                return True
+                conn.commit()
+            invalidate_access(user_id)
+            return True
         except Exception as e:
-            db_connection.get_connection().rollback()
             logger.error(f"Error approving user: {e}")
             return False
 
     def get_pending_users(self) -> List[Dict]:
         """Получает список неодобренных пользователей"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     SELECT 
                         us.user_id, 
@@ -153,7 +170,7 @@ class UserRepository:
     def get_all_users(self) -> List[Dict]:
         """Получает список всех пользователей"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     SELECT 
                         us.user_id, 
@@ -190,23 +207,22 @@ class UserRepository:
     def create_user_schedule(self, user_id: int, name: str, description: str = None) -> int:
         """Создает пользовательский график"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     INSERT INTO user_custom_schedules (user_id, name, description)
                     VALUES (%s, %s, %s) RETURNING id
                 """, (user_id, name, description))
                 schedule_id = cursor.fetchone()[0]
-                db_connection.get_connection().commit()
+                conn.commit()
                 return schedule_id
         except Exception as e:
-            db_connection.get_connection().rollback()
             logger.error(f"Error creating user schedule: {e}")
             raise
 
     def get_user_schedules(self, user_id: int) -> List[Dict]:
         """Получает все графики пользователя"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 # Стандартные графики
                 cursor.execute("SELECT id, name, description FROM work_schedules ORDER BY id")
                 standard_schedules = [
@@ -236,8 +252,7 @@ class UserRepository:
         Возвращает True, если у пользователя роль admin (без учета регистра).
         Читает user_settings.role_id -> user_roles.name.
         """
-        conn = db_connection.get_connection()
-        with conn.cursor() as cur:
+        with db_connection.acquire() as conn, conn.cursor() as cur:
             cur.execute("""
                 SELECT ur.name
                 FROM user_settings us
@@ -255,7 +270,7 @@ class ShiftRepository:
     def get_shift_settings(self, schedule_id: int, schedule_type: str = 'standard') -> Dict:
         """Получает настройки смен для графика"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 if schedule_type == 'standard':
                     cursor.execute("""
                         SELECT st.name, ss.start_time, ss.end_time, ss.description
@@ -288,7 +303,7 @@ class ScheduleRepository:
     def get_all_schedules(self) -> List[Dict]:
         """Получает все активные графики"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     SELECT id, name, description 
                     FROM work_schedules 
@@ -310,48 +325,45 @@ class ScheduleRepository:
     def create_schedule(self, name: str, description: str = None) -> int:
         """Создает новый график"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     INSERT INTO work_schedules (name, description)
                     VALUES (%s, %s) RETURNING id
                 """, (name, description))
                 schedule_id = cursor.fetchone()[0]
-                db_connection.get_connection().commit()
+                conn.commit()
                 return schedule_id
         except Exception as e:
-            db_connection.get_connection().rollback()
             logger.error(f"Error creating schedule: {e}")
             raise
 
     def update_schedule(self, schedule_id: int, name: str, description: str = None) -> bool:
         """Обновляет график"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     UPDATE work_schedules 
                     SET name = %s, description = %s
                     WHERE id = %s
                 """, (name, description, schedule_id))
-                db_connection.get_connection().commit()
+                conn.commit()
                 return cursor.rowcount > 0
         except Exception as e:
-            db_connection.get_connection().rollback()
             logger.error(f"Error updating schedule: {e}")
             return False
 
     def delete_schedule(self, schedule_id: int) -> bool:
         """Удаляет график (soft delete)"""
         try:
-            with db_connection.get_connection().cursor() as cursor:
+            with db_connection.acquire() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     UPDATE work_schedules 
                     SET is_active = FALSE
                     WHERE id = %s
                 """, (schedule_id,))
-                db_connection.get_connection().commit()
+                conn.commit()
                 return cursor.rowcount > 0
         except Exception as e:
-            db_connection.get_connection().rollback()
             logger.error(f"Error deleting schedule: {e}")
             return False
 
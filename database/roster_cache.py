@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Снимок состава тайм-групп в памяти процесса (RosterSnapshot).
+
+Вместо трёх запросов на каждую группу (группа, участники, слоты) снимок
+загружает ВСЕ time_groups, time_group_members и time_profile_slots тремя
+запросами и держит их проиндексированными по ключу группы.
+
+Инвалидация — через номер версии: любой мутатор состава (time_repository,
+group_repository, UserRepository) вызывает invalidate_roster(), и следующий
+get_roster() перечитает данные. ROSTER_CACHE_TTL ограничивает возраст снимка
+на случай правок в обход бота (ручной SQL, другой процесс).
+
+Словари, которые отдаёт снимок, общие для всех читателей — не изменяйте их.
+"""
+import functools
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config import config
+from . import cache_bus
+from .connection import db_connection
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()          # сериализует перезагрузку снимка
+_version_lock = threading.Lock()  # отдельный, чтобы мутаторы не ждали загрузку
+_version = 0
+_snapshot: Optional["RosterSnapshot"] = None
+
+
+def _fmt_hhmm(t) -> str:
+    # t может быть datetime.time или строка; приводим к HH:MM
+    try:
+        return t.strftime("%H:%M")
+    except Exception:
+        return str(t)[:5]  # на всякий случай
+
+
+def slot_row_to_dict(pos, name, start_time, end_time) -> Dict[str, Any]:
+    """Слот профиля в формате time_repository.get_group_info()."""
+    return {
+        "pos": pos,
+        "name": name or "",
+        "start": _fmt_hhmm(start_time),
+        "end": _fmt_hhmm(end_time),
+        # оставим и старые ключи на совместимость, вдруг где-то еще нужны
+        "start_time": start_time,
+        "end_time": end_time,
+    }
+
+
+class RosterSnapshot:
+    """Неизменяемый снимок: группы (в порядке имени), их участники и слоты."""
+
+    def __init__(self, version: int, groups: List[Dict[str, Any]]):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self._groups = groups
+        self._by_key = {g["key"]: g for g in groups}
+        # обратный индекс: user_id → [(группа, участник)] в порядке групп
+        self._by_user: Dict[int, List[tuple]] = {}
+        for g in groups:
+            for m in g["members"]:
+                self._by_user.setdefault(int(m["user_id"]), []).append((g, m))
+
+    def groups(self) -> List[Dict[str, Any]]:
+        """Полные карточки всех групп (как get_group_info), порядок — по имени группы."""
+        return self._groups
+
+    def get_group_info(self, group_key: str) -> Optional[Dict[str, Any]]:
+        return self._by_key.get(group_key)
+
+    def memberships(self, user_id: int) -> List[tuple]:
+        """Группы пользователя: [(карточка группы, запись участника с base_pos), ...]."""
+        return self._by_user.get(int(user_id), [])
+
+    def user_groups(self, user_id: int) -> List[Dict[str, Any]]:
+        return [g for g, _ in self.memberships(user_id)]
+
+    def list_groups(self) -> List[Dict[str, Any]]:
+        """Краткий список групп в формате time_repository.list_groups()."""
+        return [
+            {k: g[k] for k in ("key", "name", "profile_key", "epoch", "period",
+                               "rotation_dir", "tz_name", "tz_offset_hours")}
+            for g in self._groups
+        ]
+
+
+def _load(version: int) -> RosterSnapshot:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT tg.id, tg.key, tg.name, tp.key AS profile_key, tg.epoch,
+                   tg.rotation_period_days, tg.rotation_dir, tg.tz_name, tg.tz_offset_hours,
+                   tg.profile_id
+            FROM time_groups tg
+            JOIN time_profiles tp ON tp.id = tg.profile_id
+            ORDER BY tg.name
+            """
+        )
+        group_rows = cur.fetchall() or []
+
+        cur.execute(
+            """
+            SELECT m.time_group_id, m.user_id, m.base_pos,
+                   u.username, u.first_name, u.last_name
+            FROM time_group_members m
+            LEFT JOIN users u ON u.user_id = m.user_id
+            ORDER BY m.time_group_id, m.base_pos, COALESCE(u.first_name,''), COALESCE(u.last_name,''),
+                     COALESCE(u.username,''), m.user_id::text
+            """
+        )
+        member_rows = cur.fetchall() or []
+
+        cur.execute(
+            """
+            SELECT s.profile_id, s.pos, s.name, s.start_time, s.end_time
+            FROM time_profile_slots s
+            ORDER BY s.profile_id, s.pos
+            """
+        )
+        slot_rows = cur.fetchall() or []
+
+    members_by_group: Dict[int, List[Dict[str, Any]]] = {}
+    for gid, user_id, base_pos, username, first_name, last_name in member_rows:
+        members_by_group.setdefault(gid, []).append({
+            "user_id": user_id,
+            "base_pos": base_pos,
+            "username": username,
+            "first_name": first_name,
+            "last_name": last_name,
+        })
+
+    slots_by_profile: Dict[int, List[Dict[str, Any]]] = {}
+    for profile_id, pos, name, start_time, end_time in slot_rows:
+        slots_by_profile.setdefault(profile_id, []).append(slot_row_to_dict(pos, name, start_time, end_time))
+
+    groups = []
+    for r in group_rows:
+        groups.append({
+            "key": r[1],
+            "name": r[2],
+            "profile_key": r[3],
+            "epoch": r[4],
+            "period": r[5],
+            "rotation_dir": r[6],
+            "tz_name": r[7],
+            "tz_offset_hours": r[8],
+            "members": members_by_group.get(r[0], []),
+            "slots": slots_by_profile.get(r[9], []),
+        })
+    return RosterSnapshot(version, groups)
+
+
+def get_roster() -> RosterSnapshot:
+    """Актуальный снимок состава; перечитывается после invalidate_roster() или по TTL."""
+    global _snapshot
+    snap = _snapshot
+    ttl = float(config.ROSTER_CACHE_TTL)
+    if snap is not None and snap.version == _version and time.monotonic() - snap.loaded_at < ttl:
+        return snap
+    with _lock:
+        snap = _snapshot
+        if snap is not None and snap.version == _version and time.monotonic() - snap.loaded_at < ttl:
+            return snap
+        # версию фиксируем ДО чтения: если во время загрузки придёт invalidate,
+        # снимок сразу окажется устаревшим и перечитается на следующем вызове
+        version = _version
+        snap = _load(version)
+        _snapshot = snap
+        logger.debug("roster snapshot v%s: %s групп", version, len(snap.groups()))
+        return snap
+
+
+def invalidate_roster() -> None:
+    """Пометить снимок устаревшим (вызывать после изменения групп/участников/слотов/пользователей)."""
+    global _version
+    with _version_lock:
+        _version += 1
+    cache_bus.publish("roster")
+
+
+def roster_version() -> int:
+    return _version
+
+
+def invalidates_roster(func):
+    """Декоратор для мутаторов состава: после вызова (успешного или нет) снимок сбрасывается."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            invalidate_roster()
+    return wrapper
+
+
+def invalidate_roster_if_user_changed(user_id: int, username, first_name, last_name) -> None:
+    """
+    create_user вызывается на каждом /start — сбрасываем снимок, только если
+    пользователь состоит в группах и его имя/username в снимке отличаются.
+    """
+    snap = _snapshot
+    if snap is None:
+        return
+    for g in snap.groups():
+        for m in g["members"]:
+            if m["user_id"] == user_id and (
+                m["username"], m["first_name"], m["last_name"]
+            ) != (username, first_name, last_name):
+                invalidate_roster()
+                return
+
+
+cache_bus.register("roster", lambda key: invalidate_roster())
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+SchemaCapabilities — какие необязательные таблицы/колонки есть в БД.
+
+Раньше код спрашивал information_schema на каждом вызове (есть ли users.role,
+users.tz, admin_actions, group_users...). Теперь схема читается одним запросом
+при старте (main.on_startup) и держится в памяти; перечитывается по команде
+/admin_schema_refresh или после миграций, которые делает сам бот
+(вызывают schema_caps.invalidate()).
+
+    from database.schema import schema_caps
+    if schema_caps.has_column("users", "role"): ...
+"""
+import logging
+import threading
+from typing import Dict, Optional, Set
+
+from . import cache_bus
+from .connection import db_connection
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaCapabilities:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns: Optional[Dict[str, Set[str]]] = None
+
+    def refresh(self) -> None:
+        """Перечитать список таблиц и колонок схемы public (один запрос)."""
+        with db_connection.acquire() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT table_name, column_name
+                FROM information_schema.columns
+                WHERE table_schema = 'public'
+            """)
+            rows = cur.fetchall() or []
+        columns: Dict[str, Set[str]] = {}
+        for table, column in rows:
+            columns.setdefault(table, set()).add(column)
+        with self._lock:
+            self._columns = columns
+        logger.info("Схема БД: %s таблиц", len(columns))
+
+    def invalidate(self) -> None:
+        """Схема поменялась (DDL из кода) — перечитать при следующем обращении."""
+        with self._lock:
+            self._columns = None
+        cache_bus.publish("schema")
+
+    def _snapshot(self) -> Dict[str, Set[str]]:
+        cols = self._columns
+        if cols is None:
+            self.refresh()
+            cols = self._columns or {}
+        return cols
+
+    # --- проверки ---
+    def has_table(self, table: str) -> bool:
+        return table in self._snapshot()
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in self._snapshot().get(table, ())
+
+    def columns(self, table: str) -> Set[str]:
+        return set(self._snapshot().get(table, ()))
+
+    # --- флаги, которые проверяет код бота ---
+    @property
+    def users_role(self) -> bool:
+        return self.has_column("users", "role")
+
+    @property
+    def users_is_approved(self) -> bool:
+        return self.has_column("users", "is_approved")
+
+    @property
+    def users_tz_column(self) -> Optional[str]:
+        """Колонка IANA-пояса в users: 'tz', 'tz_name' или None."""
+        for col in ("tz", "tz_name"):
+            if self.has_column("users", col):
+                return col
+        return None
+
+    @property
+    def users_tz_offset(self) -> bool:
+        return self.has_column("users", "tz_offset_hours")
+
+    @property
+    def admin_actions(self) -> bool:
+        return self.has_table("admin_actions")
+
+    @property
+    def group_members(self) -> bool:
+        return self.has_table("time_group_members")
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "tables": len(self._snapshot()),
+            "users.role": self.users_role,
+            "users.is_approved": self.users_is_approved,
+            "users.tz": self.users_tz_column or False,
+            "users.tz_offset_hours": self.users_tz_offset,
+            "admin_actions": self.admin_actions,
+            "time_group_members": self.group_members,
+            "duty_group_members": self.has_table("duty_group_members"),
+            "group_users": self.has_table("group_users"),
+        }
+
+
+schema_caps = SchemaCapabilities()
+cache_bus.register("schema", lambda key: schema_caps.invalidate())
@@ -1,26 +1,29 @@
 import logging
 from datetime import datetime, date
 from .connection import db_connection
+from .roster_cache import get_roster, invalidates_roster
 from database.group_repository import list_groups, list_users_in_group
 from services.shift_calculator import ShiftCalculator
 
 logger = logging.getLogger(__name__)
 
+@invalidates_roster
 def delete_time_group(group_key: str) -> bool:
     """Удалить тайм-группу по ключу. Возвращает True, если что-то удалилось."""
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(
             "DELETE FROM time_groups WHERE key = %s",
             (group_key,),
         )
         return cur.rowcount > 0
 
+@invalidates_roster
 def delete_time_profile(profile_key: str) -> bool:
     """Удалить тайм-профиль по ключу.
     Работает только если нет связанных групп (time_groups).
     Возвращает True, если профиль удалён.
     """
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         try:
             cur.execute(
                 "DELETE FROM time_profiles WHERE key = %s",
@@ -31,9 +34,10 @@ def delete_time_profile(profile_key: str) -> bool:
             # например, ForeignKey violation из-за связанных групп
             raise e
 
+@invalidates_roster
 def create_profile(key: str, name: str, tz_name: str = None, tz_offset_hours: int = 0):
     """Создать профиль времени"""
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(
             """
             INSERT INTO time_profiles (key, name, tz_name, tz_offset_hours)
@@ -50,7 +54,7 @@ def create_profile(key: str, name: str, tz_name: str = None, tz_offset_hours: in
 
 def list_profiles():
     """Вернуть список всех профилей времени"""
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(
             """
             SELECT key, name, tz_name, tz_offset_hours
@@ -64,9 +68,10 @@ def list_profiles():
             for r in rows
         ]
 
+@invalidates_roster
 def add_slot(profile_key: str, pos: int, start: str, end: str, name: str = None):
     """Добавить слот в профиль времени"""
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(
             """
             INSERT INTO time_profile_slots (profile_id, pos, name, start_time, end_time)
@@ -83,9 +88,10 @@ def add_slot(profile_key: str, pos: int, start: str, end: str, name: str = None)
         )
         return cur.fetchone()[0]
 
+@invalidates_roster
 def clear_profile_slots(profile_key: str):
     """Очистить все слоты профиля"""
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(
             """
             DELETE FROM time_profile_slots
@@ -95,9 +101,10 @@ def clear_profile_slots(profile_key: str):
         )
         return cur.rowcount
 
+@invalidates_roster
 def add_user_to_group(group_key: str, user_id: int, base_pos: int):
     """Добавить пользователя в тайм-группу"""
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         sql = """
         INSERT INTO time_group_members (time_group_id, user_id, base_pos)
         SELECT tg.id, %s, %s
@@ -109,9 +116,10 @@ def add_user_to_group(group_key: str, user_id: int, base_pos: int):
         cur.execute(sql, (user_id, base_pos, group_key))
         return cur.rowcount > 0
 
+@invalidates_roster
 def remove_user_from_group(group_key: str, user_id: int):
     """Удалить пользователя из тайм-группы"""
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(
             """
             DELETE FROM time_group_members
@@ -123,31 +131,8 @@ def remove_user_from_group(group_key: str, user_id: int):
         return cur.rowcount > 0
 
 def list_groups():
-    """Вернуть список всех тайм-групп"""
-    with db_connection.connect() as conn, conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT tg.key, tg.name, tp.key AS profile_key, tg.epoch,
-                   tg.rotation_period_days, tg.rotation_dir, tg.tz_name, tg.tz_offset_hours
-            FROM time_groups tg
-            JOIN time_profiles tp ON tg.profile_id = tp.id
-            ORDER BY tg.name
-            """
-        )
-        rows = cur.fetchall()
-        return [
-            {
-                "key": r[0],
-                "name": r[1],
-                "profile_key": r[2],
-                "epoch": r[3],
-                "period": r[4],
-                "rotation_dir": r[5],
-                "tz_name": r[6],
-                "tz_offset_hours": r[7],
-            }
-            for r in rows
-        ]
+    """Вернуть список всех тайм-групп (из снимка состава, см. roster_cache)"""
+    return get_roster().list_groups()
 
 def get_group_info(group_key: str):
     """
@@ -157,112 +142,24 @@ def get_group_info(group_key: str):
       members: [{user_id, base_pos, username, first_name, last_name}, ...],
       slots:   [{pos, name, start_time, end_time}, ...]
     }
+    Данные берутся из снимка состава; возвращается копия, её можно менять.
     """
-    with db_connection.connect() as conn, conn.cursor() as cur:
-        # 1) Основная информация по группе
-        cur.execute(
-            """
-            SELECT tg.id,
-                   tg.key,
-                   tg.name,
-                   tp.key AS profile_key,
-                   tg.epoch,
-                   tg.rotation_period_days,
-                   tg.rotation_dir,
-                   tg.tz_name,
-                   tg.tz_offset_hours
-            FROM time_groups tg
-            JOIN time_profiles tp ON tp.id = tg.profile_id
-            WHERE tg.key = %s
-            """,
-            (group_key,),
-        )
-        row = cur.fetchone()
-        if not row:
-            return None
-
-        group_id = row[0]
-        info = {
-            "key": row[1],
-            "name": row[2],
-            "profile_key": row[3],
-            "epoch": row[4],
-            "period": row[5],
-            "rotation_dir": row[6],
-            "tz_name": row[7],
-            "tz_offset_hours": row[8],
-            "members": [],
-            "slots": [],
-        }
-
-        # 2) Участники группы
-        cur.execute(
-            """
-            SELECT m.user_id,
-                   m.base_pos,
-                   u.username,
-                   u.first_name,
-                   u.last_name
-            FROM time_group_members m
-            LEFT JOIN users u ON u.user_id = m.user_id
-            WHERE m.time_group_id = %s
-            ORDER BY m.base_pos, COALESCE(u.first_name,'') , COALESCE(u.last_name,''), COALESCE(u.username,''), m.user_id::text
-            """,
-            (group_id,),
-        )
-        members = cur.fetchall() or []
-        info["members"] = [
-            {
-                "user_id": r[0],
-                "base_pos": r[1],
-                "username": r[2],
-                "first_name": r[3],
-                "last_name": r[4],
-            }
-            for r in members
-        ]
-
-        # 3) Слоты профиля (для удобного отображения в /admin_tg_show)
-        cur.execute(
-            """
-            SELECT s.pos, s.name, s.start_time, s.end_time
-            FROM time_profile_slots s
-            JOIN time_profiles tp ON tp.id = s.profile_id
-            WHERE tp.key = %s
-            ORDER BY s.pos
-            """,
-            (info["profile_key"],),
-        )
-        slots = cur.fetchall() or []
-
-        def _fmt(t):
-            # t может быть datetime.time или строка; приводим к HH:MM
-            try:
-                return t.strftime("%H:%M")
-            except Exception:
-                return str(t)[:5]  # на всякий случай
-
-        info["slots"] = [
-            {
-                "pos": r[0],
-                "name": r[1] or "",
-                "start": _fmt(r[2]),
-                "end": _fmt(r[3]),
-                # оставим и старые ключи на совместимость, вдруг где-то еще нужны
-                "start_time": r[2],
-                "end_time": r[3],
-            }
-            for r in slots
-        ]
-
-        return info
+    info = get_roster().get_group_info(group_key)
+    if info is None:
+        return None
+    return {
+        **info,
+        "members": [dict(m) for m in info["members"]],
+        "slots": [dict(s) for s in info["slots"]],
+    }
 
+@invalidates_roster
 def set_group_tz(group_key: str, tz_name: str) -> bool:
     """Установить IANA-часовой пояс для тайм-группы.
        Пример tz_name: 'Europe/Moscow', 'Asia/Vladivostok'.
        Возвращает True, если обновлена хотя бы одна строка.
     """
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(
             """
             UPDATE time_groups
@@ -273,6 +170,7 @@ def set_group_tz(group_key: str, tz_name: str) -> bool:
         )
         return cur.rowcount > 0
 
+@invalidates_roster
 def set_group_period(group_key: str, days: int) -> bool:
     """
     Установить период ротации (в днях) для тайм-группы.
@@ -282,7 +180,7 @@ def set_group_period(group_key: str, days: int) -> bool:
     if days < 0:
         raise ValueError("period (days) не может быть отрицательным")
 
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         cur.execute(
             """
             UPDATE time_groups
@@ -308,7 +206,7 @@ def get_profile_info(profile_key: str):
       ]
     }
     """
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         # 1) Находим сам профиль и его id
         cur.execute(
             """
@@ -352,16 +250,18 @@ def get_profile_info(profile_key: str):
 
         return profile
 
+@invalidates_roster
 def update_name(key: str, new_name: str) -> bool:
     if not key or not new_name:
         return False
 
-    with db_connection.get_connection() as conn:
+    with db_connection.acquire() as conn:
         cur = conn.cursor()
         cur.execute(f"UPDATE {TABLE} SET name = %s WHERE key = %s", (new_name.strip(), key.strip().lower()))
         conn.commit()
         return cur.rowcount > 0
 
+@invalidates_roster
 def create_time_group(
     group_key: str,
     profile_key: str,
@@ -392,7 +292,7 @@ def create_time_group(
     else:
         raise TypeError(f"epoch должен быть str или date, получено: {type(epoch).__name__}")
 
-    with db_connection.connect() as conn, conn.cursor() as cur:
+    with db_connection.acquire() as conn, conn.cursor() as cur:
         # 1) получаем профиль
         cur.execute(
             "SELECT id, name, tz_name, tz_offset_hours FROM time_profiles WHERE key = %s",
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Индекс username → user_id (без учёта регистра) в памяти процесса.
+
+Строится одним запросом по таблице users при первом обращении; дальше
+UserRepository.create_user/remove_user поддерживают его точечно
+(note_username / forget_user). Промах проверяется одним запросом по
+функциональному индексу lower(username) — на случай записи в обход бота.
+"""
+import logging
+import threading
+from typing import Dict, Optional
+
+from . import cache_bus
+from .connection import db_connection
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_by_name: Optional[Dict[str, int]] = None   # lower(username) → user_id
+_by_user: Dict[int, str] = {}               # user_id → lower(username)
+_index_ensured = False
+
+
+def _norm(username: Optional[str]) -> str:
+    return (username or "").strip().lstrip("@").lower()
+
+
+def _ensure_db_index() -> None:
+    """Функциональный индекс для lower(username). Безопасно вызывать многократно."""
+    global _index_ensured
+    if _index_ensured:
+        return
+    try:
+        with db_connection.acquire() as conn, conn.cursor() as cur:
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users (lower(username))")
+        _index_ensured = True
+    except Exception as e:
+        logger.error("Не удалось создать индекс lower(username) на users: %s", e)
+
+
+def _load() -> Dict[str, int]:
+    _ensure_db_index()
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT lower(username), user_id
+            FROM users
+            WHERE username IS NOT NULL AND username <> ''
+            """
+        )
+        rows = cur.fetchall() or []
+    return {name: int(uid) for name, uid in rows}
+
+
+def _ensure_loaded() -> Dict[str, int]:
+    global _by_name
+    current = _by_name
+    if current is not None:
+        return current
+    loaded = _load()
+    with _lock:
+        if _by_name is None:
+            _by_name = loaded
+            _by_user.clear()
+            _by_user.update({uid: name for name, uid in loaded.items()})
+        return _by_name
+
+
+def resolve_username(username: Optional[str]) -> Optional[int]:
+    """user_id по username (с @ или без, регистр не важен) или None."""
+    name = _norm(username)
+    if not name:
+        return None
+    uid = _ensure_loaded().get(name)
+    if uid is not None:
+        return uid
+    # промах: пользователь мог появиться в обход бота — одна точечная проверка по индексу
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute("SELECT user_id FROM users WHERE lower(username) = %s LIMIT 1", (name,))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    note_username(int(row[0]), name)
+    return int(row[0])
+
+
+def _apply(user_id: int, name: str) -> bool:
+    """Записать name → user_id в индекс; True — запись изменилась (или индекс не загружен)."""
+    with _lock:
+        if _by_name is None:
+            return True  # индекс ещё не загружен — подхватит при загрузке; прежнего имени не знаем
+        if _by_user.get(user_id) == (name or None) and (not name or _by_name.get(name) == user_id):
+            return False
+        old = _by_user.pop(user_id, None)
+        if old is not None and _by_name.get(old) == user_id:
+            del _by_name[old]
+        if name:
+            _by_name[name] = user_id
+            _by_user[user_id] = name
+        return True
+
+
+def note_username(user_id: int, username: Optional[str]) -> None:
+    """Обновить индекс после записи пользователя (create_user) и сообщить другим репликам."""
+    name = _norm(username)
+    if _apply(int(user_id), name):
+        # переименование, username перешёл к другому аккаунту или убран — иначе
+        # реплики продолжат отдавать по старому имени этого пользователя
+        cache_bus.publish("usernames", f"{int(user_id)}:{name}" if name else int(user_id))
+
+
+def forget_user(user_id: int) -> None:
+    """Убрать пользователя из индекса (remove_user)."""
+    _apply(int(user_id), "")
+    cache_bus.publish("usernames", user_id)
+
+
+def invalidate_username_index() -> None:
+    """Полный сброс: следующий resolve_username() перечитает users."""
+    global _by_name
+    with _lock:
+        _by_name = None
+        _by_user.clear()
+    cache_bus.publish("usernames")
+
+
+def _on_bus(key: Optional[str]) -> None:
+    # "<user_id>:<name>" — новое имя, "<user_id>" — пользователь удалён, None — полный сброс
+    if not key:
+        invalidate_username_index()
+    elif ":" in key:
+        uid, name = key.split(":", 1)
+        note_username(int(uid), name)
+    else:
+        forget_user(int(key))
+
+
+cache_bus.register("usernames", _on_bus)
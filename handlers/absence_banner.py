@@ -1,31 +1,47 @@
 # handlers/absence_banner.py
 # -*- coding: utf-8 -*-
 import re
-from datetime import datetime
-from typing import Tuple
+from datetime import date, datetime
+from typing import Optional, Tuple
 from telegram.constants import ParseMode
 from database.absence_repository import get_absence_on_date
+from services.db_executor import run_blocking
+from services.principal import get_principal
 
 DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
 
-def inject_absence_banner_for_text(raw_text: str, user_id: int) -> Tuple[str, bool]:
+def _banner_date(raw_text: str) -> Optional[date]:
+    m = DATE_RE.search(raw_text or "")
+    if not m:
+        return None
+    try:
+        return datetime.strptime(m.group(0), "%Y-%m-%d").date()
+    except Exception:
+        return None
+
+def _principal_covers(principal, user_id: int, target_date: date) -> bool:
+    # в деталях Principal — только текущие и будущие отсутствия автора апдейта
+    return (principal is not None and principal.details
+            and principal.user_id == user_id and target_date >= date.today())
+
+def inject_absence_banner_for_text(raw_text: str, user_id: int, principal=None) -> Tuple[str, bool]:
     """
     Возвращает (текст_с_возможным_баннером, использован_html_баннер).
     Баннер добавляется только если день попадает в отпуск/больничный.
+    principal (необязательно) — отсутствия автора апдейта уже загружены,
+    для него и дат не раньше сегодняшней запрос в БД не делается.
     """
     if not raw_text:
         return raw_text, False
 
-    m = DATE_RE.search(raw_text)
-    if not m:
-        return raw_text, False
-
-    try:
-        target_date = datetime.strptime(m.group(0), "%Y-%m-%d").date()
-    except Exception:
+    target_date = _banner_date(raw_text)
+    if target_date is None:
         return raw_text, False
 
-    absence = get_absence_on_date(user_id, target_date)
+    if _principal_covers(principal, user_id, target_date):
+        absence = principal.absence_on(target_date)
+    else:
+        absence = get_absence_on_date(user_id, target_date)
     if not absence:
         return raw_text, False
 
@@ -38,10 +54,21 @@ def inject_absence_banner_for_text(raw_text: str, user_id: int) -> Tuple[str, bo
     )
     return banner + raw_text, True
 
-async def reply_with_absence_banner(update, text: str, user_id: int):
+async def reply_with_absence_banner(update, text: str, user_id: int, context=None):
     """
     Всегда отправляем parse_mode=HTML, потому что исходные тексты уже содержат <b>, <code> и т.п.
     Если отсутствия нет — просто отправим исходный текст как HTML.
+    С context отсутствия автора команды берутся из деталей Principal апдейта (один запрос на апдейт).
     """
-    new_text, _ = inject_absence_banner_for_text(text, user_id)
+    target_date = _banner_date(text)
+    principal = None
+    author = getattr(update, "effective_user", None)
+    if (context is not None and target_date is not None and target_date >= date.today()
+            and author is not None and author.id == user_id):
+        # отсутствия автора загружаются с деталями Principal — один раз на апдейт
+        principal = await get_principal(update, context, details=True)
+    if target_date is None or _principal_covers(principal, user_id, target_date):
+        new_text, _ = inject_absence_banner_for_text(text, user_id, principal)
+    else:
+        new_text, _ = await run_blocking(inject_absence_banner_for_text, text, user_id, principal)
     await update.message.reply_text(new_text, parse_mode=ParseMode.HTML)
@@ -9,6 +9,7 @@ from database.absence_repository import (
     list_absences_period,   # <— НОВОЕ
 )
 from database.repository import UserRepository, USER_ROLE_ADMIN
+from services.principal import caller_is_admin
 
 # --- local date parsers (compat) ---
 from datetime import datetime, date
@@ -55,26 +56,6 @@ def _fmt_user_line(r: dict) -> str:
     return "👤 " + " ".join(parts)
 
 
-def _is_admin(user_id: int) -> bool:
-    ur = UserRepository()
-    # Надёжная проверка по БД (без чувствительности к регистру)
-    if hasattr(ur, "is_user_admin"):
-        try:
-            return bool(ur.is_user_admin(user_id))
-        except Exception:
-            pass
-
-    # Fallback: если где-то всё ещё используют get_user_roles/константу
-    roles = []
-    if hasattr(ur, "get_user_roles"):
-        try:
-            roles = ur.get_user_roles(user_id) or []
-        except Exception:
-            roles = []
-    roles_lower = {str(r).strip().lower() for r in roles}
-    return ("admin" in roles_lower)
-
-
 # ---- НОВОЕ: парсинг периода для общих отчётов ----
 
 def _format_absence_row(r):
@@ -180,8 +161,7 @@ def _fmt_user_line_by_uid(uid: int) -> str:
 
 # --- admin: list all vacations by period ---
 async def vacations_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    caller = update.effective_user
-    if not _is_admin(caller.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     d_from, d_to = _parse_period(context.args or [])
@@ -295,7 +275,7 @@ async def sick_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # --- admin: vacation ---
 async def admin_vacation_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     caller = update.effective_user
-    if not _is_admin(caller.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
@@ -313,7 +293,7 @@ async def admin_vacation_add(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def admin_vacation_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     caller = update.effective_user
-    if not _is_admin(caller.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
@@ -330,8 +310,7 @@ async def admin_vacation_edit(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("❌ Ошибка. Формат: /admin_vacation_edit <id> YYYY-MM-DD YYYY-MM-DD [комментарий]")
 
 async def admin_vacation_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    caller = update.effective_user
-    if not _is_admin(caller.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
@@ -348,7 +327,7 @@ async def admin_vacation_del(update: Update, context: ContextTypes.DEFAULT_TYPE)
 # --- admin: sick ---
 async def admin_sick_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     caller = update.effective_user
-    if not _is_admin(caller.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
@@ -366,7 +345,7 @@ async def admin_sick_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def admin_sick_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     caller = update.effective_user
-    if not _is_admin(caller.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
@@ -383,8 +362,7 @@ async def admin_sick_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Ошибка. Формат: /admin_sick_edit <id> YYYY-MM-DD YYYY-MM-DD [комментарий]")
 
 async def admin_sick_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    caller = update.effective_user
-    if not _is_admin(caller.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
@@ -402,8 +380,7 @@ async def admin_sick_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # --- admin: list all vacations by period ---
 async def vacations_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    caller = update.effective_user
-    if not _is_admin(caller.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
 
@@ -432,8 +409,7 @@ async def vacations_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # --- admin: list all sick leaves by period ---
 async def sick_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    caller = update.effective_user
-    if not _is_admin(caller.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     d_from, d_to = _parse_period(context.args or [])
@@ -456,8 +432,7 @@ async def sick_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # --- admin: vacations aggregated ---
 async def vacations_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    caller = update.effective_user
-    if not _is_admin(caller.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
 
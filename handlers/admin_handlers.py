@@ -12,6 +12,9 @@ from __future__ import annotations
 
 import logging
 import inspect
+import os
+import tempfile
+from datetime import datetime
 from html import escape
 from pathlib import Path
 from typing import Any, Iterable, Optional, Callable
@@ -21,9 +24,26 @@ from telegram.ext import ContextTypes
 
 from utils.decorators import require_admin
 from database.repository import UserRepository
+from database.connection import db_connection
+from services.db_executor import db_executor, run_blocking
+from utils.cache import all_caches
+from database.schema import schema_caps
+from database.load_counters import rebuild_counters
+from database.holiday_calendar import import_production_calendar
+from services.snapshot import create_snapshot, restore_snapshot
+from services.export import ENTITIES as EXPORT_ENTITIES, FORMATS as EXPORT_FORMATS, export_entity
 from handlers.help_texts import HELP_USERS_SHORT
 logger = logging.getLogger(__name__)
 
+async def _user_id_arg(arg: str) -> Optional[int]:
+    """Аргумент команды → user_id: число как есть, @username — через индекс users."""
+    arg = (arg or "").strip()
+    if arg.lstrip("-").isdigit():
+        return int(arg)
+    if arg.startswith("@"):
+        return await run_blocking(UserRepository().get_user_id_by_username, arg)
+    return None
+
 def _load_admin_users_footer() -> str:
     # Берём короткую шпаргалку из help_texts, без файлов на диске
     return HELP_USERS_SHORT
@@ -339,14 +359,13 @@ async def admin_approve(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Одобрить: /admin_approve <user_id> [group_key]."""
     if not context.args:
         await update.message.reply_text(
-            "❌ Использование: <code>/admin_approve</code> <i>user_id</i> [<i>group_key</i>]",
+            "❌ Использование: <code>/admin_approve</code> <i>user_id|@username</i> [<i>group_key</i>]",
             parse_mode="HTML",
         )
         return
-    try:
-        user_id = int(context.args[0])
-    except Exception:
-        await update.message.reply_text("❌ user_id должен быть числом")
+    user_id = await _user_id_arg(context.args[0])
+    if user_id is None:
+        await update.message.reply_text("❌ Укажите числовой user_id или @username известного боту пользователя")
         return
 
     admin_id = update.effective_user.id if update.effective_user else None
@@ -386,14 +405,13 @@ async def admin_removeuser(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Удалить: /admin_removeuser <user_id> (работает через UserRepository)."""
     if not context.args:
         await update.message.reply_text(
-            "❌ Использование: <code>/admin_removeuser</code> <i>user_id</i>",
+            "❌ Использование: <code>/admin_removeuser</code> <i>user_id|@username</i>",
             parse_mode="HTML",
         )
         return
-    try:
-        user_id = int(context.args[0])
-    except Exception:
-        await update.message.reply_text("❌ user_id должен быть числом")
+    user_id = await _user_id_arg(context.args[0])
+    if user_id is None:
+        await update.message.reply_text("❌ Укажите числовой user_id или @username известного боту пользователя")
         return
 
     repo = UserRepository()
@@ -411,12 +429,11 @@ remove_user = admin_removeuser
 async def admin_set_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Назначить группу: /admin_set_group <user_id> <group_key>."""
     if len(context.args) < 2:
-        await update.message.reply_text("❌ Использование: <code>/admin_set_group</code> <i>user_id</i> <i>group_key</i>", parse_mode="HTML")
+        await update.message.reply_text("❌ Использование: <code>/admin_set_group</code> <i>user_id|@username</i> <i>group_key</i>", parse_mode="HTML")
         return
-    try:
-        user_id = int(context.args[0])
-    except Exception:
-        await update.message.reply_text("❌ user_id должен быть числом")
+    user_id = await _user_id_arg(context.args[0])
+    if user_id is None:
+        await update.message.reply_text("❌ Укажите числовой user_id или @username известного боту пользователя")
         return
     group_key = context.args[1].strip()
 
@@ -438,12 +455,11 @@ async def admin_set_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def admin_unset_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Снять группу: /admin_unset_group <user_id>."""
     if not context.args:
-        await update.message.reply_text("❌ Использование: <code>/admin_unset_group</code> <i>user_id</i>", parse_mode="HTML")
+        await update.message.reply_text("❌ Использование: <code>/admin_unset_group</code> <i>user_id|@username</i>", parse_mode="HTML")
         return
-    try:
-        user_id = int(context.args[0])
-    except Exception:
-        await update.message.reply_text("❌ user_id должен быть числом")
+    user_id = await _user_id_arg(context.args[0])
+    if user_id is None:
+        await update.message.reply_text("❌ Укажите числовой user_id или @username известного боту пользователя")
         return
 
     try:
@@ -520,12 +536,11 @@ async def update_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def admin_promote(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Выдать админ-права: /admin_promote <user_id>"""
     if not context.args:
-        await update.message.reply_text("❌ Использование: <code>/admin_promote</code> <i>user_id</i>", parse_mode="HTML")
+        await update.message.reply_text("❌ Использование: <code>/admin_promote</code> <i>user_id|@username</i>", parse_mode="HTML")
         return
-    try:
-        user_id = int(context.args[0])
-    except Exception:
-        await update.message.reply_text("❌ user_id должен быть числом")
+    user_id = await _user_id_arg(context.args[0])
+    if user_id is None:
+        await update.message.reply_text("❌ Укажите числовой user_id или @username известного боту пользователя")
         return
 
     try:
@@ -572,12 +587,11 @@ async def admin_promote(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def admin_demote(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Снять админ-права: /admin_demote <user_id>"""
     if not context.args:
-        await update.message.reply_text("❌ Использование: <code>/admin_demote</code> <i>user_id</i>", parse_mode="HTML")
+        await update.message.reply_text("❌ Использование: <code>/admin_demote</code> <i>user_id|@username</i>", parse_mode="HTML")
         return
-    try:
-        user_id = int(context.args[0])
-    except Exception:
-        await update.message.reply_text("❌ user_id должен быть числом")
+    user_id = await _user_id_arg(context.args[0])
+    if user_id is None:
+        await update.message.reply_text("❌ Укажите числовой user_id или @username известного боту пользователя")
         return
 
     try:
@@ -620,6 +634,195 @@ async def admin_demote(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Не удалось снять админ-права у пользователя <code>{user_id}</code>", parse_mode="HTML")
 
 
+@require_admin
+async def admin_perf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Метрики производительности: пул соединений БД и пул потоков (/admin_perf)."""
+    p = db_connection.stats()
+    e = db_executor.stats()
+    lines = [
+        "⚙️ <b>Пул БД</b>",
+        f"• соединений: {p['in_use']}/{p['max']} (пик {p['peak_in_use']}, min {p['min']})",
+        f"• выдач: {p['acquired']}, таймаутов: {p['timeouts']}, заменено битых: {p['replaced']}",
+        f"• ожидание: ср. {p['wait_avg_ms']:.1f} мс, макс. {p['wait_max_ms']:.1f} мс",
+        "",
+        "🧵 <b>Пул потоков</b>",
+        f"• потоков: {e['workers']}, выполняется: {e['running']}, в очереди: {e['queued']} (пик {e['peak_queued']})",
+        f"• задач: {e['completed']}/{e['submitted']}, с ошибкой: {e['failed']}",
+        f"• ожидание в очереди: ср. {e['wait_avg_ms']:.1f} мс, макс. {e['wait_max_ms']:.1f} мс",
+        f"• выполнение: ср. {e['run_avg_ms']:.1f} мс",
+    ]
+    caches = [c.stats() for c in all_caches()]
+    if caches:
+        lines += ["", "🗃 <b>Кэши</b>"]
+        for c in caches:
+            lines.append(
+                f"• {c['name']}: {c['size']}/{c['maxsize']}, попаданий {c['hits']}, промахов {c['misses']} "
+                f"({c['hit_rate']:.0%}), ожидали чужой расчёт {c['coalesced']}, вытеснено {c['evictions']}"
+            )
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
+
+
+@require_admin
+async def admin_schema_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Перечитать схему БД после ручной миграции (/admin_schema_refresh)."""
+    try:
+        await run_blocking(schema_caps.refresh)
+    except Exception as e:
+        logger.error("schema refresh failed: %s", e)
+        await update.message.reply_text(f"❌ Не удалось прочитать схему БД: {escape(str(e))}", parse_mode="HTML")
+        return
+    info = schema_caps.summary()
+    lines = ["🗂 <b>Схема БД перечитана</b>", f"• таблиц: {info.pop('tables')}"]
+    for name, value in info.items():
+        mark = "✅" if value else "—"
+        extra = f" ({value})" if isinstance(value, str) else ""
+        lines.append(f"• {mark} <code>{name}</code>{extra}")
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
+
+
+@require_admin
+async def admin_counters_rebuild(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пересчитать счётчики нагрузки из назначений (/admin_counters_rebuild)."""
+    try:
+        res = await run_blocking(rebuild_counters)
+    except Exception as e:
+        logger.error("counters rebuild failed: %s", e)
+        await update.message.reply_text(f"❌ Не удалось пересчитать счётчики: {escape(str(e))}", parse_mode="HTML")
+        return
+    await update.message.reply_text(
+        f"✅ Счётчики пересчитаны: обязанности — {res['duty']} строк, офис-дни — {res['office']} строк",
+        parse_mode="HTML",
+    )
+
+
+@require_admin
+async def admin_holidays_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Загрузить производственный календарь (/admin_holidays_import ответом на сообщение с CSV).
+    Форматы — см. database.holiday_calendar.
+    """
+    src = update.message.reply_to_message
+    doc = src.document if src else None
+    if not doc:
+        await update.message.reply_text(
+            "Ответьте командой <code>/admin_holidays_import</code> на сообщение с CSV-файлом календаря.",
+            parse_mode="HTML",
+        )
+        return
+    data = bytes(await (await doc.get_file()).download_as_bytearray())
+    try:
+        res = await run_blocking(import_production_calendar, data)
+    except Exception as e:
+        logger.error("holidays import failed: %s", e)
+        await update.message.reply_text(f"❌ Импорт не удался: {escape(str(e))}", parse_mode="HTML")
+        return
+    lines = [
+        f"📅 Календарь загружен: {res['days']} дн., из них выходных/праздников — {res['holidays']}",
+        f"• годы: {', '.join(map(str, res['years'])) or '—'}",
+    ]
+    if res["errors"]:
+        lines.append(f"⚠️ Пропущено строк: {len(res['errors'])}")
+        lines += [f"• {escape(e)}" for e in res["errors"][:10]]
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
+
+
+@require_admin
+async def admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /export <таблица> [YYYY-MM-DD [YYYY-MM-DD]] [csv|jsonl] — выгрузка в .gz файлом.
+    """
+    args = list(context.args or [])
+    usage = (
+        "Формат: <code>/export</code> <i>таблица</i> [<i>YYYY-MM-DD</i> [<i>YYYY-MM-DD</i>]] [<i>csv|jsonl</i>]\n"
+        f"Таблицы: {escape(', '.join(EXPORT_ENTITIES))}"
+    )
+    if not args or args[0] not in EXPORT_ENTITIES:
+        await update.message.reply_text(usage, parse_mode="HTML")
+        return
+    entity = args.pop(0)
+    fmt = args.pop() if args and args[-1] in EXPORT_FORMATS else "csv"
+    try:
+        dates = [datetime.strptime(a, "%Y-%m-%d").date() for a in args[:2]]
+    except ValueError:
+        await update.message.reply_text(usage, parse_mode="HTML")
+        return
+    date_from = dates[0] if dates else None
+    date_to = dates[-1] if dates else None
+
+    try:
+        res = await run_blocking(export_entity, entity, date_from, date_to, fmt)
+    except Exception as e:
+        logger.error("export %s failed: %s", entity, e)
+        await update.message.reply_text(f"❌ Выгрузка не удалась: {escape(str(e))}", parse_mode="HTML")
+        return
+    try:
+        caption = f"📦 {entity}: {res.rows} строк"
+        if dates and not res.date_filtered:
+            caption += " (у таблицы нет дат — выгружена целиком)"
+        await update.message.reply_document(document=res.file, filename=res.filename, caption=caption)
+    finally:
+        res.file.close()
+
+
+@require_admin
+async def admin_snapshot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Снимок данных бота файлом (/admin_snapshot); восстановить — /admin_restore."""
+    fd, path = tempfile.mkstemp(suffix=".stbsnap")
+    os.close(fd)
+    try:
+        try:
+            manifest = await run_blocking(create_snapshot, path)
+        except Exception as e:
+            logger.error("snapshot failed: %s", e)
+            await update.message.reply_text(f"❌ Снимок не удался: {escape(str(e))}", parse_mode="HTML")
+            return
+        rows = sum(t["rows"] for t in manifest["tables"])
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                document=f,
+                filename=f"snapshot_{datetime.now().strftime('%Y%m%d_%H%M')}.stbsnap",
+                caption=f"💾 Снимок: {len(manifest['tables'])} таблиц, {rows} строк",
+            )
+    finally:
+        os.unlink(path)
+
+
+@require_admin
+async def admin_restore(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /admin_restore confirm — ответом на сообщение с .stbsnap.
+    Заменяет данные всех таблиц снимка одной транзакцией.
+    """
+    src = update.message.reply_to_message
+    doc = src.document if src else None
+    if not doc or (context.args or [""])[0] != "confirm":
+        await update.message.reply_text(
+            "Ответьте <code>/admin_restore confirm</code> на сообщение с файлом снимка.\n"
+            "⚠️ Данные таблиц из снимка будут заменены целиком.",
+            parse_mode="HTML",
+        )
+        return
+    fd, path = tempfile.mkstemp(suffix=".stbsnap")
+    os.close(fd)
+    try:
+        await (await doc.get_file()).download_to_drive(path)
+        try:
+            manifest = await run_blocking(restore_snapshot, path)
+        except Exception as e:
+            logger.error("restore failed: %s", e)
+            await update.message.reply_text(
+                f"❌ Восстановление отменено, база не изменена: {escape(str(e))}", parse_mode="HTML")
+            return
+    finally:
+        os.unlink(path)
+    rows = sum(t["rows"] for t in manifest["tables"])
+    await update.message.reply_text(
+        f"✅ Восстановлено из снимка от {escape(str(manifest.get('created_at')))}: "
+        f"{len(manifest['tables'])} таблиц, {rows} строк",
+        parse_mode="HTML",
+    )
+
+
 # ===== Простой /admin_help (чтобы импорт в main.py не падал) ===============
 async def admin_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Короткая справка по админ-командам пользователей."""
@@ -9,31 +9,20 @@ from database.duty_admin_repository import (
     set_member_rank, list_member_ranks,
     add_exclusion, remove_exclusion, list_exclusions
 )
-from database.duty_repository import auto_assign_for_date_rr, get_assignments
-from database.repository import UserRepository, USER_ROLE_ADMIN
+from database.duty_repository import (
+    auto_assign_for_date_rr, auto_assign_for_date_weighted, auto_assign_range, get_assignments, list_duties
+)
+from handlers.duty_handlers import parse_period_args, format_plan_report
+from services.simulation import simulate, DUTY_MODES
+from database.load_counters import get_duty_load
+from database.roster_cache import get_roster
+from logic.duty_planner import display_name
+from services.db_executor import run_blocking
+from services.principal import caller_is_admin
 from html import escape
 
 logger = logging.getLogger(__name__)
 
-def _is_admin(user_id: int) -> bool:
-    ur = UserRepository()
-    # Надёжная проверка по БД (без чувствительности к регистру)
-    if hasattr(ur, "is_user_admin"):
-        try:
-            return bool(ur.is_user_admin(user_id))
-        except Exception:
-            pass
-
-    # Fallback: если где-то всё ещё используют get_user_roles/константу
-    roles = []
-    if hasattr(ur, "get_user_roles"):
-        try:
-            roles = ur.get_user_roles(user_id) or []
-        except Exception:
-            roles = []
-    roles_lower = {str(r).strip().lower() for r in roles}
-    return ("admin" in roles_lower)
-
 def _d(s: str) -> date:
     return datetime.strptime(s, "%Y-%m-%d").date()
 
@@ -44,7 +33,7 @@ async def rank_set(update: Update, context: ContextTypes.DEFAULT_TYPE):
     rank: 1-лидер, 2-специалист, 3-младший
     """
     uid = update.effective_user.id
-    if not _is_admin(uid):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
@@ -55,7 +44,7 @@ async def rank_set(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if rank not in (1,2,3):
         await update.message.reply_text("Ранг должен быть 1,2 или 3.")
         return
-    ok = set_member_rank(gk, user_id, rank, uid)
+    ok = await run_blocking(set_member_rank, gk, user_id, rank, uid)
     await update.message.reply_text("✅ Сохранено." if ok else "❌ Не удалось.")
 
 async def rank_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -67,7 +56,7 @@ async def rank_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Формат: /rank_list <group_key>")
         return
     gk = args[0]
-    rows = list_member_ranks(gk)
+    rows = await run_blocking(list_member_ranks, gk)
     if not rows:
         await update.message.reply_text("Пока нет записей.")
         return
@@ -83,7 +72,7 @@ async def duty_exclude(update: Update, context: ContextTypes.DEFAULT_TYPE):
     group_key можно не указывать (тогда исключение глобальное).
     """
     uid = update.effective_user.id
-    if not _is_admin(uid):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
@@ -102,7 +91,7 @@ async def duty_exclude(update: Update, context: ContextTypes.DEFAULT_TYPE):
             gk = args[3]
         if len(args) >= 5:
             reason = " ".join(args[4:])
-        new_id = add_exclusion(user_id, d1, d2, gk, reason, uid)
+        new_id = await run_blocking(add_exclusion, user_id, d1, d2, gk, reason, uid)
         await update.message.reply_text(f"✅ Исключение создано: #{new_id}")
     except Exception:
         await update.message.reply_text("❌ Ошибка парсинга. Формат дат YYYY-MM-DD.")
@@ -111,15 +100,14 @@ async def duty_exclude_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     /duty_exclude_del <id>
     """
-    uid = update.effective_user.id
-    if not _is_admin(uid):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
     if len(args) != 1 or not args[0].isdigit():
         await update.message.reply_text("Формат: /duty_exclude_del <id>")
         return
-    ok = remove_exclusion(int(args[0]))
+    ok = await run_blocking(remove_exclusion, int(args[0]))
     await update.message.reply_text("🗑 Удалено." if ok else "❌ Не удалось удалить.")
 
 async def duty_exclude_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -138,7 +126,7 @@ async def duty_exclude_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(rest) >= 2 and rest[1].isdigit():
         uid_f = int(rest[1])
 
-    rows = list_exclusions(on_date, gk, uid_f)
+    rows = await run_blocking(list_exclusions, on_date, gk, uid_f)
     if not rows:
         await update.message.reply_text("Нет исключений по заданным условиям.")
         return
@@ -152,20 +140,148 @@ async def duty_exclude_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ===== RR ASSIGN =====
 async def assign_duties_rr(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    /assign_duties_rr [YYYY-MM-DD] [group_key]
-    Round-robin распределение (честное по очереди).
+    /assign_duties_rr [YYYY-MM-DD [YYYY-MM-DD]] [group_key]
+    Round-robin распределение (честное по очереди). Две даты — весь период:
+    очередь переходит со дня на день в памяти, запись в БД одна в конце.
     """
     uid = update.effective_user.id
-    if not _is_admin(uid):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
-    args = context.args or []
-    if args and re.match(r"^\d{4}-\d{2}-\d{2}$", args[0]):
-        on_date = datetime.strptime(args[0], "%Y-%m-%d").date()
-        gk = args[1] if len(args) > 1 else None
-    else:
-        on_date = date.today()
-        gk = args[0] if args else None
-
-    cnt = auto_assign_for_date_rr(on_date, author_id=uid, group_key=gk)
-    await update.message.reply_text(f"✅ RR-назначено: {cnt} (дата {on_date}, группа {gk or 'ALL'}).")
+    try:
+        date_from, date_to, rest = parse_period_args(context.args)
+    except ValueError:
+        await update.message.reply_text("Формат: /assign_duties_rr [YYYY-MM-DD [YYYY-MM-DD]] [group_key]")
+        return
+    gk = rest[0] if rest else None
+
+    if date_from == date_to:
+        cnt = await run_blocking(auto_assign_for_date_rr, date_from, author_id=uid, group_key=gk)
+        await update.message.reply_text(f"✅ RR-назначено: {cnt} (дата {date_from}, группа {gk or 'ALL'}).")
+        return
+
+    try:
+        res = await run_blocking(auto_assign_range, date_from, date_to, author_id=uid, group_key=gk, mode="rr")
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    await update.message.reply_text(
+        format_plan_report(res, f"RR-назначено {date_from}—{date_to}", gk), parse_mode=ParseMode.HTML
+    )
+
+# ===== WEIGHTED ASSIGN =====
+async def assign_duties_fair(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /assign_duties_fair [YYYY-MM-DD [YYYY-MM-DD]] [group_key]
+    Взвешенная справедливость: вес из каталога, target_rank, офисные обязанности.
+    """
+    uid = update.effective_user.id
+    if not await caller_is_admin(update, context):
+        await update.message.reply_text("⛔ Только для админов.")
+        return
+    try:
+        date_from, date_to, rest = parse_period_args(context.args)
+    except ValueError:
+        await update.message.reply_text("Формат: /assign_duties_fair [YYYY-MM-DD [YYYY-MM-DD]] [group_key]")
+        return
+    gk = rest[0] if rest else None
+
+    if date_from == date_to:
+        cnt = await run_blocking(auto_assign_for_date_weighted, date_from, author_id=uid, group_key=gk)
+        await update.message.reply_text(f"✅ Назначено по весам: {cnt} (дата {date_from}, группа {gk or 'ALL'}).")
+        return
+
+    try:
+        res = await run_blocking(auto_assign_range, date_from, date_to, author_id=uid, group_key=gk, mode="weighted")
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    await update.message.reply_text(
+        format_plan_report(res, f"Назначено по весам {date_from}—{date_to}", gk), parse_mode=ParseMode.HTML
+    )
+
+# ===== SIMULATION =====
+async def admin_simulate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /admin_simulate YYYY-MM-DD YYYY-MM-DD [group_key] [rr|load|weighted]
+    Прогон обязанностей и офис/дом без записи в БД + статистика справедливости.
+    """
+    if not await caller_is_admin(update, context):
+        await update.message.reply_text("⛔ Только для админов.")
+        return
+    usage = "Формат: /admin_simulate YYYY-MM-DD YYYY-MM-DD [group_key] [rr|load|weighted]"
+    try:
+        date_from, date_to, rest = parse_period_args(context.args)
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
+    mode = "rr"
+    if rest and rest[-1].lower() in DUTY_MODES:
+        mode = rest.pop().lower()
+    gk = rest[0] if rest else None
+
+    try:
+        rep = await run_blocking(simulate, date_from, date_to, gk, mode)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+
+    lines = [
+        f"🧪 <b>Симуляция</b> {rep['date_from']}—{rep['date_to']} ({rep['days']} дн.), "
+        f"режим <code>{mode}</code>, группа {escape(gk or 'ALL')}",
+        f"<i>в БД ничего не записано; расчёт {rep['elapsed_ms']:.0f} мс</i>",
+        "",
+        "<b>Сотрудник</b>: обязанностей (вес) · офис-дней · выходные (обяз./офис)",
+    ]
+    for u in rep["users"]:
+        lines.append(
+            f"• {escape(u['name'])}: {u['duties']} ({u['weight']}) · {u['office_days']} · "
+            f"{u['weekend_duties']}/{u['weekend_office']}"
+        )
+    lines += [
+        "",
+        "<b>Разброс (макс − мин)</b>",
+        f"• обязанности: {rep['duties']['spread']} ({rep['duties']['min']}…{rep['duties']['max']})",
+        f"• вес: {rep['weight']['spread']} ({rep['weight']['min']}…{rep['weight']['max']})",
+        f"• офис-дни: {rep['office']['spread']} ({rep['office']['min']}…{rep['office']['max']})",
+        f"• нагрузка в выходные: {rep['weekend']['spread']} ({rep['weekend']['min']}…{rep['weekend']['max']})",
+    ]
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+# ===== LOAD STATS =====
+async def duty_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /duty_stats [group_key] [YYYY-MM [YYYY-MM]]
+    Сколько раз каждый получал обязанности за месяцы (по счётчикам, без подсчёта истории).
+    """
+    if not await caller_is_admin(update, context):
+        await update.message.reply_text("⛔ Только для админов.")
+        return
+    args = list(context.args or [])
+    months = []
+    while args and re.match(r"^\d{4}-\d{2}$", args[-1]):
+        months.insert(0, datetime.strptime(args.pop(), "%Y-%m").date())
+    gk = args[0] if args else None
+    if not months:
+        months = [date.today().replace(day=1)]
+    m_from, m_to = months[0], months[-1]
+
+    rows = await run_blocking(get_duty_load, gk, m_from, m_to)
+    if not rows:
+        await update.message.reply_text("Назначений за период нет.")
+        return
+    titles = {d["id"]: d["title"] for d in await run_blocking(list_duties, None, False)}
+    roster = await run_blocking(get_roster)
+    names = {}
+    for g in roster.groups():
+        for m in g["members"]:
+            names[int(m["user_id"])] = display_name(m)
+
+    period = f"{m_from:%Y-%m}" if m_from == m_to else f"{m_from:%Y-%m}—{m_to:%Y-%m}"
+    lines = [f"📊 <b>Обязанности за {period}</b> (группа {escape(gk or 'ALL')})"]
+    for r in rows[:100]:
+        lines.append(
+            f"• {escape(names.get(int(r['user_id']), str(r['user_id'])))} — "
+            f"{escape(titles.get(r['duty_id'], str(r['duty_id'])))} [{escape(r['group_key'])}]: {r['cnt']}"
+        )
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
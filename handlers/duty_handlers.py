@@ -10,9 +10,10 @@ from telegram.constants import ParseMode
 
 from database.duty_repository import (
     list_duties, create_duty, update_duty, delete_duty,
-    auto_assign_for_date, get_assignments
+    auto_assign_for_date, auto_assign_range, get_assignments
 )
-from database.repository import UserRepository, USER_ROLE_ADMIN
+from services.db_executor import run_blocking
+from services.principal import caller_is_admin
 from html import escape
 
 logger = logging.getLogger(__name__)
@@ -21,25 +22,6 @@ logger = logging.getLogger(__name__)
 ROLE_BY_NUM = {1: "leader", 2: "specialist", 3: "junior"}
 NUM_BY_ROLE = {"leader": 1, "specialist": 2, "junior": 3}
 
-def _is_admin(user_id: int) -> bool:
-    ur = UserRepository()
-    # Надёжная проверка по БД (без чувствительности к регистру)
-    if hasattr(ur, "is_user_admin"):
-        try:
-            return bool(ur.is_user_admin(user_id))
-        except Exception:
-            pass
-
-    # Fallback: если где-то всё ещё используют get_user_roles/константу
-    roles = []
-    if hasattr(ur, "get_user_roles"):
-        try:
-            roles = ur.get_user_roles(user_id) or []
-        except Exception:
-            roles = []
-    roles_lower = {str(r).strip().lower() for r in roles}
-    return ("admin" in roles_lower)
-
 def _parse_ondate(args) -> date:
     if not args:
         return date.today()
@@ -63,6 +45,34 @@ def _parse_ondate(args) -> date:
     except Exception:
         return date.today()
 
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+def _parse_date(s: str) -> date:
+    return datetime.strptime(s, "%Y-%m-%d").date()
+
+def parse_period_args(args):
+    """
+    [YYYY-MM-DD [YYYY-MM-DD]] [остальное] → (date_from, date_to, остальные аргументы).
+    Без дат — сегодня; одна дата — этот день.
+    """
+    args = list(args or [])
+    dates = []
+    while args and len(dates) < 2 and _ISO_DATE.match(args[0]):
+        dates.append(_parse_date(args.pop(0)))
+    if not dates:
+        dates = [date.today()]
+    return dates[0], dates[-1], args
+
+def format_plan_report(res, title: str, gkey) -> str:
+    """Итог auto_assign_range: число назначений и раскладка по людям."""
+    lines = [f"✅ {escape(title)}: {res['assigned']} за {res['days']} дн. (группа {escape(gkey or 'ALL')})"]
+    if res["totals"]:
+        lines.append("")
+        lines.append("<b>По сотрудникам:</b>")
+        for t in res["totals"]:
+            lines.append(f"• {escape(t['name'])} — {t['count']}")
+    return "\n".join(lines)
+
 def _fmt_assign_row(r) -> str:
     return f"• {escape(r['group_key'])}: <b>{escape(r['title'])}</b> → {r['user_id']}"
 
@@ -74,8 +84,7 @@ async def duty_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     kind_num: 1=лидер, 2=специалист, 3=младший специалист
     пример: /duty_add 3 "Обработка инцидентов" |описание| 3
     """
-    uid = update.effective_user.id
-    if not _is_admin(uid):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
 
@@ -109,7 +118,7 @@ async def duty_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         title = rest.strip().strip("«»\"'")
 
-    new_id = create_duty(title=title, kind=kind, description=desc, min_rank=min_rank)
+    new_id = await run_blocking(create_duty, title=title, kind=kind, description=desc, min_rank=min_rank)
     await update.message.reply_text(f"✅ Duty создан: id={new_id}" if new_id else "❌ Не удалось создать.")
 
 async def duties_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -126,7 +135,7 @@ async def duties_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Фильтр: 1=лидер, 2=специалист, 3=младший специалист")
             return
 
-    rows = list_duties(kind=kind)
+    rows = await run_blocking(list_duties, kind=kind)
     if not rows:
         await update.message.reply_text("Пока нет обязанностей.")
         return
@@ -144,8 +153,7 @@ async def duty_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
     fields: title,description,kind,min_rank,is_active
     kind: 1|2|3 (1=leader, 2=specialist, 3=junior)
     """
-    uid = update.effective_user.id
-    if not _is_admin(uid):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
@@ -172,60 +180,70 @@ async def duty_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 updates[k] = (v.lower() in ("1","true","yes","y","on"))
             else:
                 updates[k] = v
-    ok = update_duty(duty_id, **updates)
+    ok = await run_blocking(update_duty, duty_id, **updates)
     await update.message.reply_text("✅ Обновлено." if ok else "❌ Не удалось обновить.")
 
 async def duty_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     /duty_delete <id>
     """
-    uid = update.effective_user.id
-    if not _is_admin(uid):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
     if len(args) != 1 or not args[0].isdigit():
         await update.message.reply_text("Формат: /duty_delete <id>")
         return
-    ok = delete_duty(int(args[0]))
+    ok = await run_blocking(delete_duty, int(args[0]))
     await update.message.reply_text("🗑 Удалено." if ok else "❌ Не удалось удалить.")
 
 # ===== Assignments =====
 
 async def assign_duties(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    /assign_duties [YYYY-MM-DD] [group_key]
-    Если дата не указана — сегодня. Если ключ не указан — все группы.
+    /assign_duties [YYYY-MM-DD [YYYY-MM-DD]] [group_key]
+    Если дата не указана — сегодня. Две даты — весь период (одной записью в конце).
+    Если ключ не указан — все группы.
     """
     uid = update.effective_user.id
-    if not _is_admin(uid):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
 
-    args = context.args or []
-    if args and re.match(r"^\d{4}-\d{2}-\d{2}$", args[0]):
-        on_date = _parse_date(args[0])
-        gkey = args[1] if len(args) > 1 else None
-    else:
-        on_date = date.today()
-        gkey = args[0] if args else None
+    try:
+        date_from, date_to, rest = parse_period_args(context.args)
+    except ValueError:
+        await update.message.reply_text("Формат: /assign_duties [YYYY-MM-DD [YYYY-MM-DD]] [group_key]")
+        return
+    gkey = rest[0] if rest else None
+
+    if date_from == date_to:
+        count = await run_blocking(auto_assign_for_date, date_from, author_id=uid, group_key=gkey)
+        await update.message.reply_text(f"✅ Назначено {count} обязанностей на {date_from}.")
+        return
 
-    count = auto_assign_for_date(on_date, author_id=uid, group_key=gkey)
-    await update.message.reply_text(f"✅ Назначено {count} обязанностей на {on_date}.")
+    try:
+        res = await run_blocking(auto_assign_range, date_from, date_to, author_id=uid, group_key=gkey, mode="load")
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    await update.message.reply_text(
+        format_plan_report(res, f"Назначено {date_from}—{date_to}", gkey), parse_mode=ParseMode.HTML
+    )
 
 async def duties_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     /duties_today [YYYY-MM-DD] [group_key]
     """
     args = context.args or []
-    if args and re.match(r"^\d{4}-\d{2}-\d{2}$", args[0]):
+    if args and _ISO_DATE.match(args[0]):
         on_date = _parse_date(args[0])
         gkey = args[1] if len(args) > 1 else None
     else:
         on_date = date.today()
         gkey = args[0] if args else None
 
-    rows = get_assignments(on_date, gkey)
+    rows = await run_blocking(get_assignments, on_date, gkey)
     if not rows:
         await update.message.reply_text("Назначений нет.")
         return
@@ -237,7 +255,7 @@ async def duties_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def my_duties(update: Update, context: ContextTypes.DEFAULT_TYPE):
     on_date = _parse_ondate(context.args)
     uid = update.effective_user.id
-    rows = get_assignments(on_date)
+    rows = await run_blocking(get_assignments, on_date)
 
     mine = [r for r in rows if int(r["user_id"]) == int(uid)]
     if not mine:
@@ -256,7 +274,7 @@ async def my_duties_next(update: Update, context: ContextTypes.DEFAULT_TYPE):
     horizon = 30
     for i in range(horizon + 1):
         day = start + timedelta(days=i)
-        mine = [r for r in get_assignments(day) if int(r["user_id"]) == int(uid)]
+        mine = [r for r in await run_blocking(get_assignments, day) if int(r["user_id"]) == int(uid)]
         if mine:
             lines = [f"🗓 {day:%A}, {day:%Y-%m-%d} — ближайшие ваши обязанности:"]
             for r in mine:
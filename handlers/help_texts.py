@@ -18,11 +18,11 @@ HELP_MAIN_FULL = """
 
 👥 Пользователи:
 • /admin_pending — список ожидающих
-• <code>/admin_approve</code> <i>user_id</i> [<i>group_key</i>] — одобрить
+• <code>/admin_approve</code> <i>user_id|@username</i> [<i>group_key</i>] — одобрить
 • /admin_users — все пользователи
-• <code>/admin_removeuser</code> <i>user_id</i> — удалить
-• <code>/admin_set_group</code> <i>user_id</i> <i>group_key</i> — назначить группу
-• <code>/admin_unset_group</code> <i>user_id</i> — снять группу
+• <code>/admin_removeuser</code> <i>user_id|@username</i> — удалить
+• <code>/admin_set_group</code> <i>user_id|@username</i> <i>group_key</i> — назначить группу
+• <code>/admin_unset_group</code> <i>user_id|@username</i> — снять группу
 • <code>/admin_list_group</code> <i>group_key</i> — пользователи в группе
 • /admin_update_all_users — обновить профили (username/имена)
 
@@ -90,11 +90,11 @@ HELP_USERS_SHORT = """
 • /help_users — пользователи (админ)
 • /admin_users - список пользователей
 • /admin_pending
-• <code>/admin_approve</code> <i>user_id</i> [<i>group_key</i>]
+• <code>/admin_approve</code> <i>user_id|@username</i> [<i>group_key</i>]
 • /admin_users
-• <code>/admin_removeuser</code> <i>user_id</i>
-• <code>/admin_set_group</code> <i>user_id</i> <i>group_key</i>
-• <code>/admin_unset_group</code> <i>user_id</i>
+• <code>/admin_removeuser</code> <i>user_id|@username</i>
+• <code>/admin_set_group</code> <i>user_id|@username</i> <i>group_key</i>
+• <code>/admin_unset_group</code> <i>user_id|@username</i>
 • <code>/admin_list_group</code> <i>group_key</i>
 """.strip()
 
@@ -104,12 +104,12 @@ HELP_USERS_FULL = """
 📌 <b>Одобрение / модерация</b>
 • /admin_users — все пользователи (с группами)
 • /admin_pending — список ожидающих одобрения
-• <code>/admin_approve</code> <i>user_id</i> [<i>group_key</i>] — одобрить (можно сразу назначить группу)
-• <code>/admin_removeuser</code> <i>user_id</i> — удалить пользователя
+• <code>/admin_approve</code> <i>user_id|@username</i> [<i>group_key</i>] — одобрить (можно сразу назначить группу)
+• <code>/admin_removeuser</code> <i>user_id|@username</i> — удалить пользователя
 
 👷 <b>Назначение групп</b>
-• <code>/admin_set_group</code> <i>user_id</i> <i>group_key</i> — назначить группу
-• <code>/admin_unset_group</code> <i>user_id</i> — снять группу
+• <code>/admin_set_group</code> <i>user_id|@username</i> <i>group_key</i> — назначить группу
+• <code>/admin_unset_group</code> <i>user_id|@username</i> — снять группу
 • <code>/admin_list_group</code> <i>group_key</i> — пользователи в группе
 
 🔄 <b>Служебное</b>
@@ -230,12 +230,12 @@ HELP_ADMIN_ALL_FULL = """
 
 👥 <b>Пользователи</b>:
 • /admin_pending
-• <code>/admin_approve</code> <i>user_id</i> [<i>group_key</i>]
+• <code>/admin_approve</code> <i>user_id|@username</i> [<i>group_key</i>]
 • /admin_users
-• <code>/admin_removeuser</code> <i>user_id</i>
+• <code>/admin_removeuser</code> <i>user_id|@username</i>
 • /admin_update_all_users
-• <code>/admin_set_group</code> <i>user_id</i> <i>group_key</i>
-• <code>/admin_unset_group</code> <i>user_id</i>
+• <code>/admin_set_group</code> <i>user_id|@username</i> <i>group_key</i>
+• <code>/admin_unset_group</code> <i>user_id|@username</i>
 • <code>/admin_list_group</code> <i>group_key</i>
 
 👷 <b>Группы</b>:
@@ -264,6 +264,16 @@ HELP_ADMIN_ALL_FULL = """
 🤒 <b>Больничные</b>:
 • /sick_add, /sick_list, /sick_edit, /sick_del
 • /admin_sick_add, /admin_sick_edit, /admin_sick_del
+
+⚙️ <b>Диагностика</b>:
+• /admin_perf — метрики пула БД и пула потоков
+• /admin_schema_refresh — перечитать схему БД после миграции
+• /admin_counters_rebuild — пересчитать счётчики нагрузки (обязанности, офис-дни)
+• /admin_holidays_import — ответом на CSV: загрузить производственный календарь
+• <code>/export</code> <i>таблица</i> [<i>YYYY-MM-DD</i> [<i>YYYY-MM-DD</i>]] [<i>csv|jsonl</i>] — выгрузка .gz
+  (duty, duty_assignments, location_assignments, user_absences, time_group_members)
+• /admin_snapshot — снимок данных бота файлом
+• <code>/admin_restore confirm</code> — ответом на файл снимка: заменить данные одной транзакцией
 """.strip()
 
 
@@ -279,6 +289,10 @@ HELP_DUTIES_SHORT = '''
 • /duty_export — выгрузить каталог в CSV
 • /assign_duties — авторспределение на сегодня (справедливость по истории)
 • /assign_duties_rr — авторспределение Round-Robin
+• <code>/assign_duties_rr</code> <i>YYYY-MM-DD YYYY-MM-DD</i> [<i>group_key</i>] — на период, с итогами по людям
+• /assign_duties_fair — по весам каталога (баланс нагрузки, target_rank, офис)
+• <code>/admin_simulate</code> <i>YYYY-MM-DD YYYY-MM-DD</i> [<i>group_key</i>] [<i>rr|load|weighted</i>] — прогон без записи в БД
+• /duty_stats [<i>group_key</i>] [<i>YYYY-MM</i> [<i>YYYY-MM</i>]] — сколько обязанностей у каждого за месяцы
 • /rank_list — ранги участников по группам
 • <code>/rank_set</code> <i>group_key</i> <i>user_id</i> <i>rank(1..3)</i>
 • <code>/duty_exclude</code> <i>user_id</i> <i>YYYY-MM-DD..YYYY-MM-DD</i> [<i>group_key</i>] [<i>reason</i>]
@@ -310,6 +324,16 @@ HELP_DUTIES_FULL = '''
 <b>Автораспределение</b>
 • /assign_duties — справедливая выдача по истории (у кого меньше назначений, того вперед)
 • /assign_duties_rr — алгоритм Round-Robin по каждому duty
+• /assign_duties_fair — взвешенная справедливость: суммарный вес обязанностей за окно
+  (DUTY_FAIR_WINDOW_DAYS, по умолчанию 30 дней) выравнивается между людьми; тяжёлые раздаются первыми;
+  <code>min_rank</code> и <code>office_required</code> обязательны, <code>target_rank</code> — предпочтение
+
+<b>Симуляция</b>
+• <code>/admin_simulate</code> <i>YYYY-MM-DD YYYY-MM-DD</i> [<i>group_key</i>] [<i>rr|load|weighted</i>] —
+  обязанности и офис/дом на период без записи в БД: по людям и разброс (обязанности, вес, офис-дни, выходные)
+• Обе команды принимают период: <code>/assign_duties_rr</code> <i>2025-10-01 2025-10-31</i> [<i>group_key</i>] —
+  очередь и нагрузка переносятся между днями, исключения и отсутствия учитываются,
+  в ответе — сколько назначений получил каждый
 
 <b>Ранги</b>
 • /rank_list — показать текущие ранги по группам
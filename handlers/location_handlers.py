@@ -1,22 +1,27 @@
 # /home/telegrambot/shift_tracker_bot/handlers/location_handlers.py
 # -*- coding: utf-8 -*-
 from datetime import date, datetime, timedelta
+import logging
 import re
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 from html import escape
 
-from database.repository import UserRepository
-from database.location_repository import assign_locations_for_group, get_locations, office_report
+from database.location_repository import (
+    assign_locations_bulk, assign_locations_for_group, get_locations, office_report,
+)
+from database.coordination import PlanConflict
+from database.roster_cache import get_roster
+from logic.duty_planner import display_name
 from database import time_repository as time_repo
+from services.db_executor import run_blocking
+from services.principal import caller_is_admin
 
-def _is_admin(uid: int) -> bool:
-    ur = UserRepository()
-    try:
-        return bool(getattr(ur, "is_user_admin")(uid))
-    except Exception:
-        return False
+logger = logging.getLogger(__name__)
+
+# строк офис-дней в ответе /loc_assign_range (лимит сообщения Telegram — 4096 символов)
+OFFICE_LINES_MAX = 60
 
 def _parse_date(s: str) -> date | None:
     try: return datetime.strptime(s, "%Y-%m-%d").date()
@@ -27,7 +32,7 @@ async def loc_assign(update: Update, context: ContextTypes.DEFAULT_TYPE):
     /loc_assign <YYYY-MM-DD> <group_key>
     Назначает офис/дом по правилам.
     """
-    if not _is_admin(update.effective_user.id):
+    if not await caller_is_admin(update, context):
         await update.message.reply_text("⛔ Только для админов.")
         return
     args = context.args or []
@@ -39,9 +44,56 @@ async def loc_assign(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not d:
         await update.message.reply_text("Дата в формате YYYY-MM-DD.")
         return
-    cnt = assign_locations_for_group(g, d)
+    cnt = await run_blocking(assign_locations_for_group, g, d)
     await update.message.reply_text(f"✅ Назначено {cnt} записей для {g} на {d}.")
 
+async def loc_assign_range(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /loc_assign_range <YYYY-MM-DD> <YYYY-MM-DD> [group_key ...]
+    Офис/дом на период по всем группам (или перечисленным) одной записью.
+    """
+    if not await caller_is_admin(update, context):
+        await update.message.reply_text("⛔ Только для админов.")
+        return
+    args = context.args or []
+    fmt = "Формат: /loc_assign_range <YYYY-MM-DD> <YYYY-MM-DD> [group_key ...]"
+    if len(args) < 2:
+        await update.message.reply_text(fmt)
+        return
+    d1 = _parse_date(args[0]); d2 = _parse_date(args[1])
+    if not d1 or not d2:
+        await update.message.reply_text("Даты в формате YYYY-MM-DD.")
+        return
+    try:
+        res = await run_blocking(assign_locations_bulk, d1, d2, args[2:] or None)
+    except ValueError as e:
+        await update.message.reply_text(f"⚠️ {escape(str(e))}")
+        return
+    except PlanConflict:
+        await update.message.reply_text("⚠️ Группы одновременно распределяет другая реплика бота. Повторите позже.")
+        return
+    except Exception as e:
+        logger.exception("loc_assign_range failed: %s", e)
+        await update.message.reply_text("⚠️ Не удалось назначить офис/дом, подробности в логе.")
+        return
+    if not res["groups"]:
+        await update.message.reply_text("Группы не найдены.")
+        return
+
+    roster = await run_blocking(get_roster)
+    names = {int(m["user_id"]): display_name(m) for g in roster.groups() for m in g["members"]}
+    lines = [f"✅ Назначено {res['written']} записей за {res['days']} дн. "
+             f"({escape(', '.join(res['groups']))})"]
+    if res["office"]:
+        lines.append("")
+        lines.append("<b>Офис-дни за период:</b>")
+        office = sorted(res["office"].items(), key=lambda kv: (kv[0][0], -kv[1]))
+        for (g, uid), cnt in office[:OFFICE_LINES_MAX]:
+            lines.append(f"• {escape(g)}: {escape(names.get(uid, str(uid)))} — {cnt}")
+        if len(office) > OFFICE_LINES_MAX:
+            lines.append(f"… и ещё {len(office) - OFFICE_LINES_MAX} (полный свод — /loc_report)")
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
 async def loc_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     /loc_today [YYYY-MM-DD] [group_key]
@@ -53,7 +105,7 @@ async def loc_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         d = date.today()
         g = args[0] if args else None
-    rows = get_locations(d, g)
+    rows = await run_blocking(get_locations, d, g)
     if not rows:
         await update.message.reply_text("Назначений нет.")
         return
@@ -76,7 +128,7 @@ async def loc_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not d1 or not d2:
         await update.message.reply_text("Даты в формате YYYY-MM-DD.")
         return
-    rows = office_report(g, d1, d2)
+    rows = await run_blocking(office_report, g, d1, d2)
     if not rows:
         await update.message.reply_text("Данных нет.")
         return
@@ -9,18 +9,24 @@ from telegram import Update
 from telegram.ext import ContextTypes
 
 from database.connection import db_connection  # для определения TZ пользователя
-from database import time_repository as time_repo
-from database.location_repository import get_locations
+from database.schema import schema_caps
+from database.roster_cache import get_roster, roster_version
+from database.repository import UserRepository
+from database.location_repository import get_location_map, locations_version
 from logic.duty import _local_cycle_day, _phase_kind
 from logic.duty import parse_date_arg
-from logic.duty import resolve_slot_ddnn_alternating as resolve4
-from logic.duty import resolve_slot_ddnn_alt_8 as resolve8
+from logic.duty import next_shift_any, next_shift_for_member
+from logic.duty import member_slot_on
+from logic.roster_engine import build_roster
 
 from database.absence_repository import get_absence_on_date
 from datetime import date  # если ещё не импортирован
 from telegram.constants import ParseMode  # для parse_mode=HTML
 
 from handlers.absence_banner import reply_with_absence_banner
+from services.db_executor import run_blocking
+from utils.cache import TTLCache
+from config import config
 
 WEEKDAY_RU = ["Понедельник","Вторник","Среда","Четверг","Пятница","Суббота","Воскресенье"]
 
@@ -63,48 +69,43 @@ def _detect_user_tz_name(user_id: int) -> Optional[str]:
     Пытаемся вытащить TZ пользователя из таблицы users:
       - колонка tz или tz_name (IANA)
       - или tz_offset_hours (целое)
+    Какие колонки есть — знает schema_caps (без запроса к information_schema).
     Если не нашли — вернём None (дальше возьмём Europe/Moscow).
     """
+    tz_col = schema_caps.users_tz_column
+    has_offset = schema_caps.users_tz_offset
+    if not tz_col and not has_offset:
+        return None
+    cols = ", ".join(c for c in (tz_col, "tz_offset_hours" if has_offset else None) if c)
     try:
-        conn = db_connection.get_connection()
-        cur = conn.cursor()
-        # Проверим наличие нужных колонок
-        cur.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema='public' AND table_name='users'
-        """)
-        cols = {r[0] for r in cur.fetchall()}
-
-        if 'tz' in cols or 'tz_name' in cols:
-            col = 'tz' if 'tz' in cols else 'tz_name'
-            cur.execute(f"SELECT {col} FROM users WHERE user_id = %s LIMIT 1", (user_id,))
+        with db_connection.acquire() as conn, conn.cursor() as cur:
+            cur.execute(f"SELECT {cols} FROM users WHERE user_id = %s LIMIT 1", (user_id,))
             row = cur.fetchone()
-            cur.close()
-            if row and row[0]:
-                return str(row[0]).strip()
-
-        if 'tz_offset_hours' in cols:
-            cur.execute("SELECT tz_offset_hours FROM users WHERE user_id = %s LIMIT 1", (user_id,))
-            row = cur.fetchone()
-            cur.close()
-            if row is not None and row[0] is not None:
-                # для фиксированного смещения вернём псевдо-строку
-                return f"FIXED:{int(row[0])}"
-        cur.close()
+        if row is None:
+            return None
+        if tz_col and row[0]:
+            return str(row[0]).strip()
+        if has_offset and row[-1] is not None:
+            # для фиксированного смещения вернём псевдо-строку
+            return f"FIXED:{int(row[-1])}"
     except Exception:
         # не падаем — просто вернём None
         pass
     return None
 
-def _get_user_tz(update: Update) -> timezone | ZoneInfo:
+def _get_user_tz(update: Update, principal=None) -> timezone | ZoneInfo:
     """
     Итоговый TZ пользователя:
     - users.tz/users.tz_name → ZoneInfo(...)
     - FIXED:<h> → timezone(hours=h)
     - иначе Europe/Moscow
+    principal — Principal апдейта с деталями (get_principal(..., details=True)): TZ уже загружен.
     """
     uid = update.effective_user.id
-    tz_name = _detect_user_tz_name(uid)
+    if principal is not None and principal.user_id == uid:
+        tz_name = principal.tz_name
+    else:
+        tz_name = _detect_user_tz_name(uid)
     if tz_name:
         if tz_name.startswith("FIXED:"):
             try:
@@ -152,11 +153,7 @@ def _phase_kind_for_group(info: Dict[str, Any], on_date: date) -> str:
     return _phase_kind(idx)  # 'day'|'night'|'off'
 
 def _slot_idx_for_member(info: Dict[str, Any], on_date: date, base_pos: int) -> Optional[int]:
-    epoch = info.get("epoch")
-    period = int(info.get("period") or info.get("rotation_period_days") or 4)
-    if period == 8:
-        return resolve8(epoch, 8, base_pos, on_date)
-    return resolve4(epoch, 4, base_pos, on_date)
+    return _resolve_slot_for_member(info, on_date, base_pos)
 
 def _choose_group_window(info: Dict[str, Any], on_date: date, used_slots: List[int]) -> tuple[str, str]:
     """
@@ -207,10 +204,8 @@ def _resolve_slot_for_member(info: Dict[str, Any], on_date: date, base_pos: int)
     """Вернёт индекс слота (int) или None (если отдых в period=8)."""
     epoch = info.get("epoch")                      # date
     period = int(info.get("period") or info.get("rotation_period_days") or 4)
-    if period == 8:
-        return resolve8(epoch, 8, base_pos, on_date)
-    # по умолчанию считаем 4 (ДД/НН без OFF)
-    return resolve4(epoch, 4, base_pos, on_date)
+    # period=8 — ДД/НН + 4 OFF, иначе 4 (ДД/НН без OFF)
+    return member_slot_on(epoch, period, base_pos, on_date)
 
 # ── helper: заголовок группы «Группа <Имя>» ─────────────────────────────────────
 def _group_title(info: Dict[str, Any]) -> str:
@@ -232,18 +227,19 @@ def _assignments_for_date(on_date: date) -> List[str]:
     ...
     """
     lines: List[str] = []
-    groups = time_repo.list_groups()  # [{'key', 'profile_key', ...}]
-    if not groups:
-        return lines
-
-    for g in groups:
-        info = time_repo.get_group_info(g["key"])
-        if not info:
-            continue
-
-        # Какие участники реально работают в эту дату
+    # весь состав — из одного снимка (без запросов на каждую группу),
+    # слоты всех участников на дату — одной матрицей
+    groups = get_roster().groups()
+    working: Dict[int, List[tuple]] = {}
+    for info, m, slot_idx in build_roster(groups, on_date, on_date).on_duty(on_date):
+        working.setdefault(id(info), []).append((m, slot_idx))
+    # офис/дом всех групп на дату — одним запросом
+    locations = get_location_map(on_date) if working else {}
+
+    for info in groups:
+
+        # Какие участники реально работают в эту дату (отдых уже отфильтрован)
         slots = info.get("slots", []) or []
-        members = info.get("members", []) or []
         group_block: List[str] = []
 
         # Заголовок группы
@@ -251,13 +247,7 @@ def _assignments_for_date(on_date: date) -> List[str]:
 
         # Детализация участников
         any_working = False
-        for m in members:
-            base_pos = int(m.get("base_pos") or 0)
-            slot_idx = _resolve_slot_for_member(info, on_date, base_pos)
-            if slot_idx is None:
-                # День отдыха (в 8-дневной схеме OFF) — пропускаем
-                continue
-
+        for m, slot_idx in working.get(id(info), []):
             slot = next((s for s in slots if s.get("pos") == slot_idx), None)
             if not slot:
                 continue
@@ -271,7 +261,7 @@ def _assignments_for_date(on_date: date) -> List[str]:
             if not slot_name:
                 # Фоллбек на краткое имя, если название пустое
                 slot_name = f"Слот {slot.get('pos')}"
-            badge = _badge_location(int(m.get("user_id")), on_date, info.get("key"))
+            badge = _badge_location(locations, int(m.get("user_id")), info.get("key"))
             group_block.append(f"{escape(slot_name)}{badge}")
 
             any_working = True
@@ -293,15 +283,8 @@ def _assignments_for_date(on_date: date) -> List[str]:
 def _my_assignments_for_date(uid: int, on_date: date) -> List[str]:
     """Возвращает строки только по заданному пользователю."""
     lines: List[str] = []
-    groups = time_repo.list_groups()
-    for g in groups:
-        info = time_repo.get_group_info(g["key"])
-        if not info:
-            continue
-
-        me = next((m for m in info.get("members", []) if int(m.get("user_id")) == int(uid)), None)
-        if not me:
-            continue
+    # только группы пользователя — по обратному индексу снимка
+    for info, me in get_roster().memberships(uid):
 
         # вычисляем слот
         slot_idx = _resolve_slot_for_member(info, on_date, int(me.get("base_pos") or 0))
@@ -335,24 +318,10 @@ def _my_assignments_compact(uid: int, on_date: date) -> list[str]:
     Группы не упоминаем, только сами слоты. Если ничего — вернём [].
     """
     results: list[str] = []
-    for g in (time_repo.list_groups() or []):
-        info = time_repo.get_group_info(g["key"])
-        if not info:
-            continue
+    # только группы пользователя — по обратному индексу снимка
+    for info, me in get_roster().memberships(uid):
 
-        me = next((m for m in info.get("members", []) if int(m.get("user_id")) == int(uid)), None)
-        if not me:
-            continue
-
-        epoch = info.get("epoch")                       # date
-        period = int(info.get("period") or info.get("rotation_period_days") or 4)
-        base_pos = int(me.get("base_pos") or 0)
-
-        # выберем нужный резолвер
-        if period == 8 and resolve8 is not None:
-            slot_idx = resolve8(epoch, period, base_pos, on_date)
-        else:
-            slot_idx = resolve4(epoch, 4, base_pos, on_date)
+        slot_idx = _resolve_slot_for_member(info, on_date, int(me.get("base_pos") or 0))
 
         if slot_idx is None:
             # день отдыха в 8-дневной схеме — просто не добавляем строку (пусть выйдет "Выходной")
@@ -372,6 +341,50 @@ def _my_assignments_compact(uid: int, on_date: date) -> list[str]:
 
     return results
 
+# ── поиск ближайшего дня и рендер обзора (синхронно; хендлеры зовут через run_blocking) ──
+def _find_next_personal(uid: int, start: date, days: int = 60,
+                        skip_absent: bool = False) -> Optional[tuple[date, List[str]]]:
+    """Ближайший день (до days дней вперёд) со сменой пользователя uid и краткие строки слотов."""
+    hit = next_shift_for_member(get_roster().user_groups(uid), uid, start, days, skip_absent=skip_absent)
+    if not hit:
+        return None
+    d, _ = hit
+    lines = _my_assignments_compact(uid, d)
+    return (d, lines) if lines else None
+
+def _find_next_overview(start: date, days: int = 60,
+                        skip_absent: bool = False) -> Optional[tuple[date, List[str]]]:
+    """Ближайший день (до days дней вперёд), когда хоть в одной группе есть смены."""
+    d = next_shift_any(get_roster().groups(), start, days, skip_absent=skip_absent)
+    if d is None:
+        return None
+    lines = _assignments_for_date(d)  # возвращает список строк по ВСЕМ группам на дату
+    return (d, lines) if lines else None
+
+def _find_uid_by_username(username: str) -> Optional[int]:
+    """Найдём user_id по username (индекс по таблице users, не только участники групп)."""
+    return UserRepository().get_user_id_by_username(username)
+
+def _day_overview_html(on_date: date) -> str:
+    """Групповой обзор на дату для /today, /tomorrow, /ondate (без баннера отсутствия)."""
+    lines = _assignments_for_date(on_date)  # уже добавляет 🏢/🏠 внутри
+    header = f"🗓 <b>{_ru_weekday(on_date)}, {on_date.strftime('%Y-%m-%d')}</b>\n"
+    if not lines:
+        return header + "Смен нет."
+    return header + "\n".join(lines).strip()
+
+
+# Обзор на дату одинаков для всех (баннер отсутствия добавляется отдельно), поэтому
+# кэшируем готовый HTML. Версии состава и локаций в ключе: после любой их правки
+# ключ меняется, старые записи уходят по LRU/TTL.
+_overview_cache = TTLCache("overview", maxsize=config.OVERVIEW_CACHE_SIZE, ttl=config.OVERVIEW_CACHE_TTL)
+
+async def _day_overview_cached(on_date: date) -> str:
+    key = (on_date, roster_version(), locations_version())
+    # single-flight: одновременные /today ждут одного расчёта
+    return await _overview_cache.get_or_compute_async(key, lambda: run_blocking(_day_overview_html, on_date))
+
+
 # === REPLACE my_next_command WITH THIS ===
 async def my_next_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -382,18 +395,12 @@ async def my_next_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     today = date.today()
 
     # ищем ближайшую дату со сменой для пользователя
-    target = None
-    for i in range(0, 60):
-        d = today + timedelta(days=i)
-        lines = _my_assignments_compact(uid, d)
-        if lines:
-            target = (d, lines)
-            break
+    target = await run_blocking(_find_next_personal, uid, today, 60)
 
     if not target:
         text_html = "Ближайшие 60 дней смен не найдены."
         user_id = update.effective_user.id
-        await reply_with_absence_banner(update, text_html, user_id)
+        await reply_with_absence_banner(update, text_html, user_id, context)
         return
 
     on_date, lines = target
@@ -403,7 +410,7 @@ async def my_next_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text_html = header + body
 
     user_id = update.effective_user.id
-    await reply_with_absence_banner(update, text_html, user_id)
+    await reply_with_absence_banner(update, text_html, user_id, context)
 
 
 # === REPLACE next_command WITH THIS ===
@@ -426,52 +433,33 @@ async def next_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             target_uid = int(a0)
         elif a0.startswith("@"):
             # найдём по username в участниках групп
-            for g in (time_repo.list_groups() or []):
-                info = time_repo.get_group_info(g["key"])
-                if not info:
-                    continue
-                m = next((m for m in info.get("members", [])
-                          if (m.get("username") or "").strip().lower() == a0[1:].lower()), None)
-                if m:
-                    target_uid = int(m.get("user_id"))
-                    break
+            target_uid = await run_blocking(_find_uid_by_username, a0[1:])
+            if target_uid is None:
+                await update.message.reply_text(f"Пользователь {escape(a0)} не найден.")
+                return
 
     if target_uid is not None:
         # персональный next (как в /my_next, но по чужому user_id)
-        today = date.today()
-        target = None
-        for i in range(60):
-            d = today + timedelta(days=i)
-            lines = _my_assignments_compact(target_uid, d)
-            if lines:
-                target = (d, lines)
-                break
+        target = await run_blocking(_find_next_personal, target_uid, date.today(), 60)
 
         if not target:
             text_html = "Ближайшие 60 дней смен не найдены."
-            await reply_with_absence_banner(update, text_html, target_uid)
+            await reply_with_absence_banner(update, text_html, target_uid, context)
             return
 
         on_date, lines = target
         header = f"🗓 <b>{_weekday_ru(on_date)}, {on_date.strftime('%Y-%m-%d')}</b>\n"
         body = "\n".join(f"• {l}" for l in lines)
         text_html = header + body
-        await reply_with_absence_banner(update, text_html, target_uid)
+        await reply_with_absence_banner(update, text_html, target_uid, context)
         return
 
     # --- режим 2: групповой обзор (как раньше) ---
-    today = date.today()
-    target = None
-    for i in range(60):
-        d = today + timedelta(days=i)
-        lines = _assignments_for_date(d)  # возвращает список строк по ВСЕМ группам на дату
-        if lines:
-            target = (d, lines)
-            break
+    target = await run_blocking(_find_next_overview, date.today(), 60)
 
     if not target:
         text_html = "Ближайшие 60 дней по группам смен не найдены."
-        await reply_with_absence_banner(update, text_html, req_uid)
+        await reply_with_absence_banner(update, text_html, req_uid, context)
         return
 
     on_date, lines = target
@@ -480,7 +468,7 @@ async def next_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text_html = header + body
 
     # Баннер показываем для автора команды (его отсутствие), т.к. обзор групповой
-    await reply_with_absence_banner(update, text_html, req_uid)
+    await reply_with_absence_banner(update, text_html, req_uid, context)
 
 # === FIX TODAY/TOMORROW/ONDATE ===
 
@@ -488,28 +476,16 @@ async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
     on_date = date.today()
 
-    lines = _assignments_for_date(on_date)  # уже добавляет 🏢/🏠 внутри
-    if not lines:
-        text_html = f"🗓 <b>{_ru_weekday(on_date)}, {on_date.strftime('%Y-%m-%d')}</b>\nСмен нет."
-    else:
-        header = f"🗓 <b>{_ru_weekday(on_date)}, {on_date.strftime('%Y-%m-%d')}</b>\n"
-        text_html = header + "\n".join(lines).strip()
-
-    await reply_with_absence_banner(update, text_html, uid)
+    text_html = await _day_overview_cached(on_date)
+    await reply_with_absence_banner(update, text_html, uid, context)
 
 
 async def tomorrow_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
     on_date = date.today() + timedelta(days=1)
 
-    lines = _assignments_for_date(on_date)
-    if not lines:
-        text_html = f"🗓 <b>{_ru_weekday(on_date)}, {on_date.strftime('%Y-%m-%d')}</b>\nСмен нет."
-    else:
-        header = f"🗓 <b>{_ru_weekday(on_date)}, {on_date.strftime('%Y-%m-%d')}</b>\n"
-        text_html = header + "\n".join(lines).strip()
-
-    await reply_with_absence_banner(update, text_html, uid)
+    text_html = await _day_overview_cached(on_date)
+    await reply_with_absence_banner(update, text_html, uid, context)
 
 
 async def ondate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -525,19 +501,13 @@ async def ondate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Не понял дату. Пример: /ondate 05.09.2025")
         return
 
-    lines = _assignments_for_date(on_date)
-    if not lines:
-        text_html = f"🗓 <b>{_ru_weekday(on_date)}, {on_date.strftime('%Y-%m-%d')}</b>\nСмен нет."
-    else:
-        header = f"🗓 <b>{_ru_weekday(on_date)}, {on_date.strftime('%Y-%m-%d')}</b>\n"
-        text_html = header + "\n".join(lines).strip()
-
-    await reply_with_absence_banner(update, text_html, uid)
+    text_html = await _day_overview_cached(on_date)
+    await reply_with_absence_banner(update, text_html, uid, context)
 
-def _badge_location(uid: int, on_date: date, group_key: str | None = None) -> str:
-    rows = get_locations(on_date, group_key)
-    for r in rows:
-        if int(r["user_id"]) == int(uid):
-            return " 🏢" if r["location"] == "office" else " 🏠"
-    return ""
+def _badge_location(locations: Dict[tuple, str], uid: int, group_key: str | None) -> str:
+    """Бейдж 🏢/🏠 по заранее загруженной карте get_location_map()."""
+    loc = locations.get((str(group_key), int(uid)))
+    if loc is None:
+        return ""
+    return " 🏢" if loc == "office" else " 🏠"
 
@@ -3,6 +3,7 @@ from telegram.ext import ContextTypes
 from keyboards.main_menu import get_main_keyboard
 from services.auth_manager import auth_manager
 from services.user_manager import user_manager
+from services.principal import refresh_principal
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -33,7 +34,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
         # Добавляем информацию о правах для админов
-        if auth_manager.is_admin(user.id):
+        principal = await refresh_principal(update, context)  # после register_user
+        if principal is not None and principal.is_admin:
             welcome_text += "⚡ <b>Вы являетесь администратором системы!</b>\n"
             welcome_text += "Используйте /admin_help для просмотра админ. команд\n\n"
 
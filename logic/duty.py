@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 from datetime import date, datetime, timedelta, time
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterable, Sequence, Tuple
 import re
 
 from database import group_repository
+from database import absence_repository
 
 
 CYCLE_LEN = 8
@@ -86,6 +87,163 @@ def resolve_slot_ddnn_alt_8(epoch: date, period: int, base_pos: int, day: date):
         return 3 - base_pos        # 0→3, 1→2
     return None
 
+def member_slot_on(epoch: date, period: int, base_pos: int, day: date) -> Optional[int]:
+    """Слот участника на дату: period=8 → ДД/НН + 4 OFF, иначе 4-дневная схема (как в хендлерах)."""
+    if int(period or 0) == 8:
+        return resolve_slot_ddnn_alt_8(epoch, 8, base_pos, day)
+    return resolve_slot_ddnn_alternating(epoch, 4, base_pos, day)
+
+# -------- поиск ближайшей смены без перебора дней --------
+#
+# Цикл короткий (4 или 8 суток), поэтому для участника достаточно один раз
+# вычислить, в какие фазы цикла у него есть слот, а дальше прыгать к ближайшей
+# такой фазе арифметикой по модулю. Отсутствия (отпуск/больничный) — отсортированные
+# интервалы: попав в интервал, перескакиваем на день после его конца.
+
+Interval = Tuple[date, date]
+
+
+def _working_phases(epoch: date, period: int, base_pos: int, slot_ok=None) -> Tuple[int, List[int]]:
+    """(длина цикла, фазы цикла, в которые у участника есть подходящий слот)."""
+    cycle = 8 if int(period or 0) == 8 else 4
+    phases = []
+    for ph in range(cycle):
+        slot = member_slot_on(epoch, period, base_pos, epoch + timedelta(days=ph))
+        if slot is None or (slot_ok is not None and not slot_ok(slot)):
+            continue
+        phases.append(ph)
+    return cycle, phases
+
+
+def next_member_shift(
+    epoch: date,
+    period: int,
+    base_pos: int,
+    start: date,
+    horizon: int = 60,
+    *,
+    slot_ok=None,
+    blocked: Sequence[Interval] = (),
+) -> Optional[Tuple[date, int]]:
+    """
+    Ближайший день в [start, start + horizon) со сменой участника: (дата, слот) или None.
+      slot_ok — фильтр слотов (например, «слот есть в профиле группы»);
+      blocked — интервалы (date_from, date_to) включительно, которые нужно пропустить.
+    Стоимость — O(1) на цикл + O(len(blocked)), независимо от horizon.
+    """
+    if horizon <= 0:
+        return None
+    cycle, phases = _working_phases(epoch, period, base_pos, slot_ok)
+    if not phases:
+        return None
+    end = start + timedelta(days=horizon)
+    intervals = sorted(blocked)
+    i = 0
+    d = start
+    while d < end:
+        k = (d - epoch).days % cycle
+        d += timedelta(days=min((ph - k) % cycle for ph in phases))
+        # пропускаем интервалы, закончившиеся раньше d
+        while i < len(intervals) and intervals[i][1] < d:
+            i += 1
+        if i < len(intervals) and intervals[i][0] <= d:
+            d = intervals[i][1] + timedelta(days=1)
+            continue
+        if d >= end:
+            break
+        return d, member_slot_on(epoch, period, base_pos, d)
+    return None
+
+
+def _slot_ok_for(info: Dict):
+    positions = {s.get("pos") for s in (info.get("slots") or [])}
+    return positions.__contains__
+
+
+def _absence_map(user_ids: Iterable[int], start: date, horizon: int) -> Dict[int, List[Interval]]:
+    return absence_repository.list_absence_intervals(
+        start, start + timedelta(days=horizon - 1), user_ids=list(user_ids)
+    )
+
+
+def next_shift_for_member(
+    groups: Iterable[Dict],
+    user_id: int,
+    start: date,
+    horizon: int = 60,
+    *,
+    skip_absent: bool = False,
+) -> Optional[Tuple[date, List[Tuple[Dict, Dict, int]]]]:
+    """
+    Ближайший день со сменой пользователя по всем его группам.
+    groups — карточки в формате time_repository.get_group_info (members + slots).
+    Возвращает (дата, [(группа, участник, слот), ...]) или None.
+    skip_absent=True — дни отпуска/больничного пользователя пропускаются.
+    """
+    uid = int(user_id)
+    memberships = [
+        (g, m) for g in groups for m in (g.get("members") or [])
+        if int(m.get("user_id")) == uid
+    ]
+    if not memberships or horizon <= 0:
+        return None
+    blocked = _absence_map([uid], start, horizon).get(uid, []) if skip_absent else []
+
+    best: Optional[date] = None
+    for g, m in memberships:
+        hit = next_member_shift(
+            g.get("epoch"), int(g.get("period") or 4), int(m.get("base_pos") or 0),
+            start, horizon, slot_ok=_slot_ok_for(g), blocked=blocked,
+        )
+        if hit and (best is None or hit[0] < best):
+            best = hit[0]
+    if best is None:
+        return None
+
+    items = []
+    for g, m in memberships:
+        slot = member_slot_on(g.get("epoch"), int(g.get("period") or 4), int(m.get("base_pos") or 0), best)
+        if slot is not None and _slot_ok_for(g)(slot):
+            items.append((g, m, slot))
+    return best, items
+
+
+def next_shift_any(
+    groups: Iterable[Dict],
+    start: date,
+    horizon: int = 60,
+    *,
+    skip_absent: bool = False,
+) -> Optional[date]:
+    """
+    Ближайший день, когда хоть в одной группе работает хоть один участник.
+    skip_absent=True — участник в отпуске/на больничном в этот день не считается.
+    Стоимость — O(число членств), а не дни × группы.
+    """
+    groups = list(groups)
+    if horizon <= 0:
+        return None
+    absences: Dict[int, List[Interval]] = {}
+    if skip_absent:
+        uids = {int(m.get("user_id")) for g in groups for m in (g.get("members") or [])}
+        absences = _absence_map(uids, start, horizon) if uids else {}
+
+    best: Optional[date] = None
+    for g in groups:
+        slot_ok = _slot_ok_for(g)
+        for m in (g.get("members") or []):
+            # дальше уже найденного искать нечего — сужаем горизонт
+            h = (best - start).days if best is not None else horizon
+            hit = next_member_shift(
+                g.get("epoch"), int(g.get("period") or 4), int(m.get("base_pos") or 0),
+                start, h, slot_ok=slot_ok, blocked=absences.get(int(m.get("user_id")), []),
+            )
+            if hit:
+                best = hit[0]
+                if best == start:
+                    return best
+    return best
+
 def build_duty_message(d: date, requester_id: int) -> str:
     duty_groups = _find_duty_groups(d)
     wday = weekday_ru(d)
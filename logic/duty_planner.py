@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Распределение обязанностей в памяти (без запросов к БД).
+
+Всё, что раньше читалось построчно (ранги, исключения, отсутствия, RR-курсоры,
+история назначений), загружается заранее пачкой — duty_repository.load_planner_state() —
+и лежит в PlannerState. plan_day() считает назначения на одну дату и сразу
+обновляет состояние (курсоры, историю), поэтому его можно вызывать подряд по
+дням диапазона. Запись результата — duty_repository.save_plan().
+
+Режимы:
+  "rr"   — round-robin: следующий после last_user_id в отсортированном пуле
+           (как auto_assign_for_date_rr);
+  "load" — реже назначавшийся за последние load_days дней, при равенстве —
+           по имени (как auto_assign_for_date);
+  "weighted" — баланс суммарной взвешенной нагрузки (вес из каталога duty)
+           в скользящем окне load_days дней по всем обязанностям группы.
+           Обязанности раздаются от тяжёлой к лёгкой, каждая — наименее
+           загруженному подходящему; target_rank мягкий (штраф за отклонение),
+           min_rank и office_required — жёсткие. Нагрузка ведётся инкрементально
+           (очередь событий окна на участника), поэтому день считается за
+           O(обязанности × участники) без повторного обхода истории.
+
+Окна нагрузки — оба по load_days суток, но сдвинуты на день намеренно:
+  "load"     — [on_date - load_days, on_date): счёт по ОДНОЙ обязанности, а
+               она раздаётся раз в день, так что запись на сам on_date может
+               быть только прежним назначением перепланируемой даты — его
+               save_plan заменит, учитывать его нельзя;
+  "weighted" — (on_date - load_days, on_date]: сумма по ВСЕМ обязанностям
+               группы, и назначения, уже сделанные в этот же день (тяжёлые
+               раздаются первыми), должны утяжелять участника — иначе один
+               человек соберёт все обязанности дня.
+"""
+from bisect import bisect_left
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+DEFAULT_RANK = 2
+DEFAULT_WEIGHT = 10   # как upsert_duty в duty_catalog_repository
+
+# (duty_id, group_key, on_date, user_id)
+Assignment = Tuple[int, str, date, int]
+
+
+@dataclass
+class PlannerState:
+    ranks: Dict[Tuple[str, int], int] = field(default_factory=dict)             # (group_key, user_id) → rank
+    exclusions: Dict[int, List[Tuple[Optional[str], date, date]]] = field(default_factory=dict)  # uid → [(group|None, from, to)]
+    cursors: Dict[Tuple[str, int], int] = field(default_factory=dict)           # (group_key, duty_id) → last_user_id
+    history: Dict[Tuple[str, int, int], List[date]] = field(default_factory=dict)  # (group, duty, uid) → отсортированные даты
+    absences: Dict[int, List[Tuple[date, date]]] = field(default_factory=dict)  # uid → [(from, to)] отпуска/больничные
+    locations: Dict[date, Dict[str, Dict[int, str]]] = field(default_factory=dict)  # дата → группа → uid → office/home
+    weights: Dict[int, int] = field(default_factory=dict)                       # duty_id → вес (для "weighted")
+    changed_cursors: Set[Tuple[str, int]] = field(default_factory=set)
+
+    # взвешенная нагрузка в окне: (group, uid) → deque[(дата, вес)] и текущая сумма
+    _wq: Optional[Dict[Tuple[str, int], deque]] = field(default=None, init=False, repr=False)
+    _ws: Dict[Tuple[str, int], int] = field(default_factory=dict, init=False, repr=False)
+
+    # --- справочники ---
+    def rank_of(self, group_key: str, m: Dict[str, Any]) -> int:
+        """Ранг из member_ranks (1..3), иначе из карточки участника, иначе 2."""
+        r = self.ranks.get((group_key, int(m["user_id"])))
+        if r in (1, 2, 3):
+            return r
+        try:
+            return int(m.get("rank") or DEFAULT_RANK)
+        except (TypeError, ValueError):
+            return DEFAULT_RANK
+
+    def is_excluded(self, group_key: str, user_id: int, d: date) -> bool:
+        """Исключение на дату (group_key NULL в duty_exclusions — во всех группах)."""
+        for g, d_from, d_to in self.exclusions.get(int(user_id), ()):
+            if (g is None or str(g) == str(group_key)) and d_from <= d <= d_to:
+                return True
+        return False
+
+    def is_available(self, group_key: str, user_id: int, d: date) -> bool:
+        """Не исключён из обязанностей и не в отпуске/на больничном."""
+        if self.is_excluded(group_key, user_id, d):
+            return False
+        return not any(d_from <= d <= d_to for d_from, d_to in self.absences.get(int(user_id), ()))
+
+    def in_office(self, group_key: str, user_id: int, d: date) -> bool:
+        """
+        Будет ли в офисе. Если локации группы на эту дату ещё не распределены —
+        ограничения нет (считаем, что может быть в офисе).
+        """
+        planned = self.locations.get(d, {}).get(str(group_key))
+        if not planned:
+            return True
+        return planned.get(int(user_id)) == "office"
+
+    def load(self, group_key: str, duty_id: int, user_id: int, on_date: date, days: int) -> int:
+        """Сколько раз назначали за [on_date - days, on_date) — без самого дня (см. описание модуля)."""
+        dates = self.history.get((group_key, duty_id, int(user_id)))
+        if not dates:
+            return 0
+        return bisect_left(dates, on_date) - bisect_left(dates, on_date - timedelta(days=days))
+
+    def _weighted_queues(self) -> Dict[Tuple[str, int], deque]:
+        if self._wq is None:
+            self._wq, self._ws = {}, {}
+            events = sorted(
+                (d, g, uid, self.weights.get(duty_id, DEFAULT_WEIGHT))
+                for (g, duty_id, uid), dates in self.history.items() for d in dates
+            )
+            for d, g, uid, w in events:
+                self._push_weight(g, uid, d, w)
+        return self._wq
+
+    def _push_weight(self, group_key: str, user_id: int, d: date, weight: int) -> None:
+        k = (group_key, int(user_id))
+        self._wq.setdefault(k, deque()).append((d, weight))
+        self._ws[k] = self._ws.get(k, 0) + weight
+
+    def weighted_load(self, group_key: str, user_id: int, on_date: date, days: int) -> int:
+        """
+        Сумма весов за (on_date - days, on_date] — включая уже розданное в
+        этот день (см. «Окна нагрузки» в описании модуля). Даты запросов по одному
+        участнику должны не убывать (дни плана идут по порядку) — тогда
+        устаревшие события просто снимаются с головы очереди.
+        """
+        k = (group_key, int(user_id))
+        q = self._weighted_queues().get(k)
+        if not q:
+            return 0
+        border = on_date - timedelta(days=days)
+        while q and q[0][0] <= border:
+            self._ws[k] -= q.popleft()[1]
+        return self._ws[k]
+
+    # --- изменения ---
+    def record(self, a: Assignment) -> None:
+        duty_id, group_key, on_date, uid = a
+        dates = self.history.setdefault((group_key, duty_id, uid), [])
+        i = bisect_left(dates, on_date)
+        if i == len(dates) or dates[i] != on_date:
+            dates.insert(i, on_date)
+            if self._wq is not None:
+                self._push_weight(group_key, uid, on_date, self.weights.get(duty_id, DEFAULT_WEIGHT))
+
+    def move_cursor(self, group_key: str, duty_id: int, user_id: int) -> None:
+        self.cursors[(group_key, duty_id)] = int(user_id)
+        self.changed_cursors.add((group_key, duty_id))
+
+    def cursor_rows(self) -> List[Tuple[str, int, int]]:
+        """Изменённые курсоры для записи: [(group_key, duty_id, last_user_id)]."""
+        return [(g, d, self.cursors[(g, d)]) for g, d in sorted(self.changed_cursors)]
+
+
+def display_name(m: Dict[str, Any]) -> str:
+    fn = (m.get("first_name") or "").strip()
+    ln = (m.get("last_name") or "").strip()
+    u = (m.get("username") or "").strip()
+    return f"{fn} {ln}".strip() or (f"@{u}" if u else "") or str(m.get("user_id"))
+
+
+def rank_ok(duty: Dict[str, Any], rank: int) -> bool:
+    """leader — только ранг 1; остальные — ранг не хуже min_rank (по умолчанию 2)."""
+    if duty.get("kind") == "leader":
+        return rank <= 1
+    return rank <= int(duty.get("min_rank") or DEFAULT_RANK)
+
+
+def duty_weight(duty: Dict[str, Any]) -> int:
+    try:
+        return max(0, int(duty.get("weight") if duty.get("weight") is not None else DEFAULT_WEIGHT))
+    except (TypeError, ValueError):
+        return DEFAULT_WEIGHT
+
+
+def _pick_weighted(state: PlannerState, key: str, duty: Dict[str, Any],
+                   pool: List[Tuple[Dict[str, Any], int]], on_date: date, days: int) -> Optional[int]:
+    """
+    Наименее загруженный из пула. Отклонение ранга от target_rank стоит
+    как одно лишнее назначение этой обязанности; при равенстве — по имени.
+    """
+    target = duty.get("target_rank")
+    penalty = duty_weight(duty) or 1
+    best, best_cost = None, None
+    for m, r in pool:
+        uid = int(m["user_id"])
+        if duty.get("office_required") and not state.in_office(key, uid, on_date):
+            continue
+        cost = state.weighted_load(key, uid, on_date, days)
+        if target is not None:
+            cost += abs(r - int(target)) * penalty
+        c = (cost, display_name(m).lower(), uid)
+        if best_cost is None or c < best_cost:
+            best, best_cost = uid, c
+    return best
+
+
+def next_in_ring(pool: Sequence[int], last: Optional[int]) -> int:
+    """Следующий после last в отсортированном пуле; last выбыл из пула — первый."""
+    if last is None:
+        return pool[0]
+    try:
+        return pool[(pool.index(last) + 1) % len(pool)]
+    except ValueError:
+        return pool[0]
+
+
+def plan_day(
+    state: PlannerState,
+    on_duty: Iterable[Tuple[str, List[Dict[str, Any]]]],
+    duties: Sequence[Dict[str, Any]],
+    on_date: date,
+    *,
+    mode: str = "rr",
+    load_days: int = 30,
+) -> List[Assignment]:
+    """
+    Назначения на on_date. on_duty — [(group_key, [участники в смене])].
+    Исключённые и отсутствующие на дату не участвуют. Состояние (курсоры, история) обновляется.
+    """
+    out: List[Assignment] = []
+    if mode == "weighted":
+        # тяжёлые обязанности раздаём первыми, пока выбор шире
+        duties = sorted(duties, key=lambda d: -duty_weight(d))
+        for d in duties:
+            state.weights.setdefault(int(d["id"]), duty_weight(d))
+    for key, members in on_duty:
+        key = str(key)
+        present = [m for m in members if state.is_available(key, int(m["user_id"]), on_date)]
+        if not present:
+            continue
+        ranked = [(m, state.rank_of(key, m)) for m in present]
+
+        for d in duties:
+            if not d.get("is_active", True):
+                continue
+            duty_id = int(d["id"])
+            pool = [(m, r) for m, r in ranked if rank_ok(d, r)]
+            if not pool:
+                continue
+
+            if mode == "rr":
+                uids = sorted({int(m["user_id"]) for m, _ in pool})
+                uid = next_in_ring(uids, state.cursors.get((key, duty_id)))
+                state.move_cursor(key, duty_id, uid)
+            elif mode == "weighted":
+                uid = _pick_weighted(state, key, d, pool, on_date, load_days)
+                if uid is None:
+                    continue
+            else:
+                best, _ = min(pool, key=lambda mr: (
+                    state.load(key, duty_id, int(mr[0]["user_id"]), on_date, load_days),
+                    display_name(mr[0]).lower(),
+                ))
+                uid = int(best["user_id"])
+
+            a = (duty_id, key, on_date, uid)
+            state.record(a)
+            out.append(a)
+    return out
+
+
+def plan_totals(assignments: Iterable[Assignment]) -> Dict[int, int]:
+    """Сколько назначений получил каждый: {user_id: count}."""
+    res: Dict[int, int] = {}
+    for _, _, _, uid in assignments:
+        res[uid] = res.get(uid, 0) + 1
+    return res
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Правила офис/дом в памяти — те же, что в location_repository.assign_locations_for_group:
+  - будни & НЕ ночной слот → все 'office';
+  - выходной/праздник ИЛИ ночной слот → ровно один 'office' (остальные 'home'),
+    у кого БОЛЬШЕ всего офис-дней, при равенстве — RR после курсора группы.
+
+Счётчики офис-дней и курсоры лежат в LocationState и обновляются после
+каждого дня, поэтому plan_group_day() можно вызывать подряд по диапазону
+(массовое распределение, симуляция) без запросов к БД.
+"""
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+OFFICE = "office"
+HOME = "home"
+
+# (group_key, on_date, user_id, location)
+LocationRow = Tuple[str, date, int, str]
+
+
+def _hhmm_minutes(s: str) -> int:
+    hh, mm = str(s).split(":")[:2]
+    return int(hh) * 60 + int(mm)
+
+
+def is_night_slot(start_hhmm: str, end_hhmm: str) -> bool:
+    """Ночь = интервал, который пересекает 00:00 (например, 20:00–08:00 или 20:00–04:00)."""
+    return _hhmm_minutes(end_hhmm) <= _hhmm_minutes(start_hhmm)
+
+
+@dataclass
+class LocationState:
+    office_days: Dict[Tuple[str, int], int] = field(default_factory=dict)  # (group_key, user_id) → офис-дней
+    cursors: Dict[str, int] = field(default_factory=dict)                  # group_key → last_user_id
+    changed_cursors: Dict[str, int] = field(default_factory=dict)
+
+    def pick_one(self, group_key: str, user_ids: Sequence[int]) -> Optional[int]:
+        """Один в офис: максимум офис-дней, при равенстве — следующий после курсора."""
+        if not user_ids:
+            return None
+        counts = [(uid, self.office_days.get((group_key, uid), 0)) for uid in user_ids]
+        top = max(cnt for _, cnt in counts)
+        pool = sorted(uid for uid, cnt in counts if cnt == top)
+        last = self.cursors.get(group_key)
+        if last is None or last not in pool:
+            return pool[0]
+        return pool[(pool.index(last) + 1) % len(pool)]
+
+    def move_cursor(self, group_key: str, user_id: int) -> None:
+        self.cursors[group_key] = user_id
+        self.changed_cursors[group_key] = user_id
+
+    def cursor_rows(self) -> List[Tuple[str, int]]:
+        return sorted(self.changed_cursors.items())
+
+
+def plan_group_day(
+    state: LocationState,
+    group_key: str,
+    members: Sequence[Tuple[int, Dict[str, str]]],
+    on_date: date,
+    is_holiday: bool,
+) -> List[LocationRow]:
+    """
+    Локации группы на дату. members — [(user_id, слот {"start","end",...})]
+    тех, кто в смене. Счётчики офис-дней и курсор обновляются.
+    """
+    if not members:
+        return []
+    day_users = [uid for uid, slot in members if not is_night_slot(slot["start"], slot["end"])]
+    night_users = [uid for uid, slot in members if is_night_slot(slot["start"], slot["end"])]
+
+    plan: Dict[int, str] = {}
+    if day_users:
+        if not is_holiday:
+            plan.update({uid: OFFICE for uid in day_users})
+        else:
+            pick = state.pick_one(group_key, day_users)
+            plan.update({uid: (OFFICE if uid == pick else HOME) for uid in day_users})
+            if pick is not None:
+                state.move_cursor(group_key, pick)
+    if night_users:
+        pick = state.pick_one(group_key, night_users)
+        plan.update({uid: (OFFICE if uid == pick else HOME) for uid in night_users})
+        if pick is not None:
+            state.move_cursor(group_key, pick)
+
+    rows: List[LocationRow] = []
+    for uid, loc in plan.items():
+        rows.append((group_key, on_date, uid, loc))
+        if loc == OFFICE:
+            state.office_days[(group_key, uid)] = state.office_days.get((group_key, uid), 0) + 1
+    return rows
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Векторизованный расчёт графика: матрица слотов (участники × дни) за диапазон дат.
+
+Та же арифметика, что в resolve_slot_ddnn_alternating / resolve_slot_ddnn_alt_8
+(logic/duty.py), но одной операцией NumPy для всех участников и всех дней:
+
+    фаза 0 (Д1) → base_pos      фаза 2 (Н1) → base_pos + 2
+    фаза 1 (Д2) → 1 - base_pos  фаза 3 (Н2) → 3 - base_pos
+    фазы 4..7 (только period=8) → REST
+
+Цикл — 8 суток при period == 8, иначе 4 (как в хендлерах). base_pos ∈ {0, 1}.
+
+Использование:
+    roster = build_roster(get_roster().groups(), date_from, date_to)
+    for info, member, slot in roster.on_duty(day): ...
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+REST = -1
+
+
+def cycle_len(period) -> int:
+    return 8 if int(period or 0) == 8 else 4
+
+
+def _local_shift_days(tz_offset_hours: np.ndarray) -> np.ndarray:
+    # как _local_cycle_day: полдень даты, сдвинутый на смещение группы
+    return np.floor_divide(12 + tz_offset_hours, 24)
+
+
+def slot_matrix(
+    epochs: Sequence[date],
+    periods: Sequence[int],
+    base_pos: Sequence[int],
+    start: date,
+    days: int,
+    tz_offset_hours: Optional[Sequence[int]] = None,
+) -> np.ndarray:
+    """
+    Матрица int16 формы (участники, days): слот участника i в день start + j или REST.
+    tz_offset_hours (необязательно) — сдвиг локальной даты группы, как в _local_cycle_day.
+    """
+    n = len(epochs)
+    if n == 0 or days <= 0:
+        return np.full((n, max(days, 0)), REST, dtype=np.int16)
+
+    ep = np.array(epochs, dtype="datetime64[D]").astype(np.int64)
+    cyc = np.array([cycle_len(p) for p in periods], dtype=np.int64)
+    b = np.asarray(base_pos, dtype=np.int64)
+
+    day0 = np.datetime64(start, "D").astype(np.int64)
+    offs = np.arange(days, dtype=np.int64)
+    delta = (day0 - ep)[:, None] + offs[None, :]          # (n, days)
+    if tz_offset_hours is not None:
+        delta += _local_shift_days(np.asarray(tz_offset_hours, dtype=np.int64))[:, None]
+    phase = np.mod(delta, cyc[:, None])                   # mod по положительному модулю ≥ 0
+
+    bb = np.broadcast_to(b[:, None], phase.shape)
+    out = np.select(
+        [phase == 0, phase == 1, phase == 2, phase == 3],
+        [bb, 1 - bb, bb + 2, 3 - bb],
+        default=REST,
+    )
+    return out.astype(np.int16)
+
+
+class RosterMatrix:
+    """
+    Результат build_roster: rows[i] = (карточка группы, участник), dates[j] — даты,
+    slots[i, j] — индекс слота или REST.
+    """
+
+    def __init__(self, rows: List[Tuple[Dict[str, Any], Dict[str, Any]]], start: date, slots: np.ndarray):
+        self.rows = rows
+        self.start = start
+        self.slots = slots
+
+    @property
+    def days(self) -> int:
+        return int(self.slots.shape[1])
+
+    @property
+    def dates(self) -> List[date]:
+        return [self.start + timedelta(days=j) for j in range(self.days)]
+
+    def day_index(self, d: date) -> int:
+        j = (d - self.start).days
+        if not 0 <= j < self.days:
+            raise IndexError(f"{d} вне диапазона матрицы")
+        return j
+
+    def working_mask(self) -> np.ndarray:
+        return self.slots != REST
+
+    def on_duty(self, d: date, group_key: Optional[str] = None) -> List[Tuple[Dict[str, Any], Dict[str, Any], int]]:
+        """Кто работает в день d: [(группа, участник, слот), ...] в порядке rows."""
+        col = self.slots[:, self.day_index(d)]
+        res = []
+        for i in np.flatnonzero(col != REST):
+            info, m = self.rows[i]
+            if group_key is not None and str(info.get("key")) != str(group_key):
+                continue
+            res.append((info, m, int(col[i])))
+        return res
+
+
+def build_roster(
+    groups: Iterable[Dict[str, Any]],
+    date_from: date,
+    date_to: date,
+    *,
+    require_slot: bool = False,
+    apply_tz: bool = False,
+) -> RosterMatrix:
+    """
+    Матрица по всем участникам переданных групп (формат time_repository.get_group_info)
+    за [date_from, date_to] включительно.
+      require_slot — слот, которого нет в профиле группы, считается отдыхом;
+      apply_tz     — учитывать tz_offset_hours группы (по умолчанию, как и прежние
+                     resolve-функции, дата берётся как есть).
+    """
+    rows: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    epochs, periods, bases, tzs = [], [], [], []
+    for g in groups:
+        period = int(g.get("period") or g.get("rotation_period_days") or 4)
+        for m in (g.get("members") or []):
+            rows.append((g, m))
+            epochs.append(g.get("epoch"))
+            periods.append(period)
+            bases.append(int(m.get("base_pos") or 0))
+            tzs.append(int(g.get("tz_offset_hours") or 0))
+
+    days = (date_to - date_from).days + 1
+    slots = slot_matrix(epochs, periods, bases, date_from, days, tzs if apply_tz else None)
+
+    if require_slot and rows:
+        # маска «слот есть в профиле»: по группе — множество pos, сравниваем построчно
+        allowed = np.zeros((len(rows), 4), dtype=bool)
+        cache: Dict[int, np.ndarray] = {}
+        for i, (g, _) in enumerate(rows):
+            row = cache.get(id(g))
+            if row is None:
+                row = np.zeros(4, dtype=bool)
+                for s in (g.get("slots") or []):
+                    pos = s.get("pos")
+                    if isinstance(pos, int) and 0 <= pos < 4:
+                        row[pos] = True
+                cache[id(g)] = row
+            allowed[i] = row
+        working = (slots >= 0) & (slots < 4)
+        idx = np.where(working, slots, 0).astype(np.int64)
+        ok = np.take_along_axis(allowed, idx, axis=1)
+        slots = np.where(working & ok, slots, REST).astype(np.int16)
+
+    return RosterMatrix(rows, date_from, slots)
+
+
+def on_duty_members(info: Dict[str, Any], on_date: date, *, require_slot: bool = False) -> List[Tuple[Dict[str, Any], int]]:
+    """Участники одной группы, работающие в on_date: [(участник, слот), ...]."""
+    roster = build_roster([info], on_date, on_date, require_slot=require_slot)
+    return [(m, slot) for _, m, slot in roster.on_duty(on_date)]
@@ -1,9 +1,18 @@
+import asyncio
 import logging
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes
 from telegram.error import TelegramError
 
 from config import config
+from database.connection import db_connection
+from services.db_executor import db_executor, run_blocking
+from database.schema import schema_caps
+from database.load_counters import ensure_counter_tables
+from database import cache_bus, change_events
+from database.cache_bus import cache_bus_listener
+from services.principal import principal_prehandler
+from services.update_processor import PerChatUpdateProcessor
 
 from handlers.start import start_command
 from handlers.common import handle_message, my_id_command
@@ -36,6 +45,8 @@ from handlers.admin_handlers import (
     admin_groups, admin_group_create, admin_group_rename,
     admin_group_set_offset, admin_group_set_epoch, admin_group_delete,
     admin_set_group, admin_unset_group, admin_list_group,
+    admin_perf, admin_schema_refresh, admin_counters_rebuild, admin_holidays_import, admin_export,
+    admin_snapshot, admin_restore,
 )
 
 import handlers.absence_handlers as absence_handlers
@@ -48,10 +59,10 @@ from handlers.duty_handlers import (
 from handlers.duty_admin_handlers import (
     rank_set, rank_list,
     duty_exclude, duty_exclude_del, duty_exclude_list,
-    assign_duties_rr
+    assign_duties_rr, assign_duties_fair, admin_simulate, duty_stats,
 )
 
-from handlers.location_handlers import loc_assign, loc_today, loc_report
+from handlers.location_handlers import loc_assign, loc_assign_range, loc_today, loc_report
 from tools.duty_import_export_handlers import register_import_export_handlers
 from handlers.duty_catalog import duties_catalog, duty_show
 import handlers.time_handlers as time_handlers
@@ -85,6 +96,9 @@ async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def setup_handlers(application):
     """Настройка обработчиков команд"""
 
+    # Principal (роль, одобрение, TZ, группы) — один запрос на апдейт, до всех хендлеров
+    application.add_handler(TypeHandler(Update, principal_prehandler), group=-1)
+
     # Регистрируем оба хендлера разом (/duty_import и /duty_export)
     register_import_export_handlers(application)
 
@@ -128,6 +142,13 @@ def setup_handlers(application):
     application.add_handler(CommandHandler("admin_users", admin_users))
     application.add_handler(CommandHandler("admin_removeuser", remove_user))
     application.add_handler(CommandHandler("admin_update_all_users", update_all_users))
+    application.add_handler(CommandHandler("admin_perf", admin_perf))
+    application.add_handler(CommandHandler("admin_schema_refresh", admin_schema_refresh))
+    application.add_handler(CommandHandler("admin_counters_rebuild", admin_counters_rebuild))
+    application.add_handler(CommandHandler("admin_holidays_import", admin_holidays_import))
+    application.add_handler(CommandHandler("export", admin_export))
+    application.add_handler(CommandHandler("admin_snapshot", admin_snapshot))
+    application.add_handler(CommandHandler("admin_restore", admin_restore))
 
     # === Группы смен (legacy duty groups) ===
     application.add_handler(CommandHandler("admin_groups", admin_groups))
@@ -196,9 +217,13 @@ def setup_handlers(application):
     application.add_handler(CommandHandler("duty_exclude_del", duty_exclude_del))
     application.add_handler(CommandHandler("duty_exclude_list", duty_exclude_list))
     application.add_handler(CommandHandler("assign_duties_rr", assign_duties_rr))
+    application.add_handler(CommandHandler("assign_duties_fair", assign_duties_fair))
+    application.add_handler(CommandHandler("admin_simulate", admin_simulate))
+    application.add_handler(CommandHandler("duty_stats", duty_stats))
 
     # === Локации ===
     application.add_handler(CommandHandler("loc_assign", loc_assign))
+    application.add_handler(CommandHandler("loc_assign_range", loc_assign_range))
     application.add_handler(CommandHandler("loc_today", loc_today))
     application.add_handler(CommandHandler("loc_report", loc_report))
 
@@ -208,12 +233,77 @@ def setup_handlers(application):
     application.add_handler(MessageHandler(filters.COMMAND, unknown_command))
 
 
+async def on_startup(application: Application) -> None:
+    """Один раз читаем схему БД (какие необязательные таблицы/колонки есть) и слушаем сбросы кэшей: от реплик и из триггеров БД."""
+    try:
+        await run_blocking(schema_caps.refresh)
+    except Exception as e:
+        # не критично: schema_caps перечитает схему при первом обращении
+        logger.error("Не удалось прочитать схему БД при старте: %s", e)
+    try:
+        # до первой записи назначений: писатели DDL не делают
+        await run_blocking(ensure_counter_tables)
+    except Exception as e:
+        logger.error("Не удалось создать таблицы счётчиков нагрузки: %s", e)
+    if config.CACHE_BUS:
+        # сбросы кэшей от других реплик
+        cache_bus_listener.listen(config.CACHE_BUS_CHANNEL, cache_bus.dispatch, cache_bus.reset_all)
+    if config.CACHE_DB_EVENTS:
+        # изменения таблиц из триггеров БД
+        try:
+            await run_blocking(change_events.install_triggers)
+            change_events.install_default_handlers()
+            cache_bus_listener.listen(config.CACHE_EVENTS_CHANNEL, change_events.dispatch_change,
+                                      change_events.reset_all)
+        except Exception as e:
+            logger.error("Не удалось установить триггеры событий изменений: %s", e)
+    if cache_bus_listener.channels:
+        try:
+            cache_bus_listener.start(asyncio.get_running_loop())
+        except Exception as e:
+            logger.error("Не удалось подписаться на сбросы кэшей: %s", e)
+
+
+async def on_shutdown(application: Application) -> None:
+    """Дожидаемся блокирующих задач в пуле потоков и закрываем пул соединений с БД."""
+    cache_bus_listener.stop()
+    db_executor.shutdown(wait=True)
+    db_connection.close()
+
+
+def build_application() -> Application:
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if config.CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerChatUpdateProcessor(config.CONCURRENT_UPDATES))
+    return builder.build()
+
+
 def main():
     """Точка входа"""
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    application = build_application()
     setup_handlers(application)
-    logger.info("🚀 Бот запущен")
-    application.run_polling()
+
+    if config.BOT_MODE == "webhook":
+        if not config.WEBHOOK_URL:
+            raise SystemExit("BOT_MODE=webhook: задайте WEBHOOK_URL (публичный адрес reverse proxy)")
+        logger.info("🚀 Бот запущен (webhook %s:%s/%s, параллельно до %s)",
+                    config.WEBHOOK_LISTEN, config.WEBHOOK_PORT, config.WEBHOOK_PATH, config.CONCURRENT_UPDATES)
+        application.run_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            webhook_url=f"{config.WEBHOOK_URL}/{config.WEBHOOK_PATH}",
+            secret_token=config.WEBHOOK_SECRET or None,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        logger.info("🚀 Бот запущен (polling, параллельно до %s)", config.CONCURRENT_UPDATES)
+        application.run_polling()
 
 
 if __name__ == "__main__":
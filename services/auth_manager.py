@@ -4,8 +4,9 @@ import logging
 from typing import Optional
 
 from database import user_repository
-from services.user_manager import user_manager
 from database.connection import db_connection
+from database.schema import schema_caps
+from database.access_cache import get_access, invalidate_access
 from config import config
 
 logger = logging.getLogger(__name__)
@@ -30,16 +31,6 @@ class AuthManager:
         except Exception:
             return False
 
-    def _db_has_column(self, conn, table: str, column: str) -> bool:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT 1
-                FROM information_schema.columns
-                WHERE table_schema='public' AND table_name=%s AND column_name=%s
-                LIMIT 1
-            """, (table, column))
-            return cur.fetchone() is not None
-
     def _ensure_role_row(self, conn, role_name: str) -> int:
         with conn.cursor() as cur:
             cur.execute("SELECT id FROM user_roles WHERE name=%s LIMIT 1", (role_name,))
@@ -50,7 +41,7 @@ class AuthManager:
             return int(cur.fetchone()[0])
 
     def _set_users_role_text_if_exists(self, conn, user_id: int, role: str) -> None:
-        if not self._db_has_column(conn, "users", "role"):
+        if not schema_caps.users_role:
             return
         with conn.cursor() as cur:
             cur.execute("UPDATE users SET role=%s WHERE user_id=%s", (role, user_id))
@@ -69,13 +60,8 @@ class AuthManager:
                 """, (user_id, role_id))
 
     def _log_admin_action(self, conn, admin_id: int, action_type: str, target_user_id: int, details_json: str) -> None:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT 1 FROM information_schema.tables
-                WHERE table_schema='public' AND table_name='admin_actions' LIMIT 1
-            """)
-            if cur.fetchone() is None:
-                return
+        if not schema_caps.admin_actions:
+            return
         with conn.cursor() as cur:
             cur.execute("""
                 INSERT INTO admin_actions (admin_id, action_type, target_user_id, details)
@@ -92,85 +78,30 @@ class AuthManager:
 
     def is_user_approved(self, user_id: int) -> bool:
         try:
-            user = self.user_repo.get_user(user_id)
-            return bool(user and user.get('is_approved', False))
+            return get_access(user_id)[1]
         except Exception as e:
             logger.error(f"Error checking user approval: {e}")
             return False
 
     def is_admin(self, user_id: int) -> bool:
+        # Конфиговые суперпользователи — сразу True; остальные — из кэша прав
+        # (LRU+TTL, сбрасывается при promote/demote/approve/remove)
+        if self._owner_or_config_admin(user_id):
+            return True
         try:
-            # 0) Конфиговые суперпользователи — сразу True
-            if self._owner_or_config_admin(user_id):
-                return True
-
-            # 1) Быстрый кэш/слой user_manager (если есть)
-            try:
-                if user_manager.is_user_admin(user_id):
-                    return True
-            except Exception:
-                pass
-
-            # 2) Читаем из БД c автопочинкой/ретраем
-            conn = db_connection.get_connection()
-
-            for attempt in (1, 2):
-                try:
-                    # (а) users.role (текстовая роль)
-                    if self._db_has_column(conn, "users", "role"):
-                        with conn.cursor() as cur:
-                            cur.execute("SELECT role FROM users WHERE user_id=%s LIMIT 1", (user_id,))
-                            row = cur.fetchone()
-                            if row and str(row[0]).lower() == USER_ROLE_ADMIN:
-                                return True
-
-                    # (б) user_settings.role_id → user_roles.name
-                    with conn.cursor() as cur:
-                        cur.execute("""
-                            SELECT ur.name
-                            FROM user_settings us
-                            JOIN user_roles ur ON ur.id = us.role_id
-                            WHERE us.user_id = %s
-                            LIMIT 1
-                        """, (user_id,))
-                        row = cur.fetchone()
-                        if row and str(row[0]).lower() == USER_ROLE_ADMIN:
-                            return True
-
-                    # если дошли сюда — админ не найден
-                    return False
-
-                except Exception as e:
-                    # Починка "aborted" соединения и повтор
-                    from database.connection import safe_rollback, is_tx_aborted_error
-                    logger.error("is_admin attempt %s failed: %s", attempt, e)
-                    safe_rollback(conn)
-                    if is_tx_aborted_error(e):
-                        try:
-                            conn = db_connection.reconnect()
-                        except Exception:
-                            # если не получилось переподключиться — выходим
-                            break
-                    # и даём второй шанс циклом
-
+            return get_access(user_id)[0] == USER_ROLE_ADMIN
         except Exception as e:
             logger.error(f"is_admin error: {e}")
-
-        return False
+            return False
 
     def authorize_user(self, user_id: int, required_role: str = USER_ROLE_USER) -> bool:
         try:
             if required_role == USER_ROLE_ADMIN:
                 return self.is_admin(user_id)
-            if not self.is_user_approved(user_id):
-                return False
-            if self.is_admin(user_id):
-                return True
-            user = self.user_repo.get_user(user_id)
-            if not user:
+            role, approved = get_access(user_id)
+            if not approved:
                 return False
-            role = (user.get('role') or '').lower()
-            return role in (USER_ROLE_USER, USER_ROLE_ADMIN)
+            return self._owner_or_config_admin(user_id) or role in (USER_ROLE_USER, USER_ROLE_ADMIN)
         except Exception as e:
             logger.error(f"Authorization error: {e}")
             return False
@@ -194,34 +125,30 @@ class AuthManager:
     def promote_to_admin(self, target_user_id: int, admin_id: int) -> bool:
         if not self.authorize_user(admin_id, USER_ROLE_ADMIN):
             return False
-        conn = db_connection.get_connection()
         try:
-            role_id = self._ensure_role_row(conn, USER_ROLE_ADMIN)
-            self._set_user_settings_role(conn, target_user_id, role_id)
-            self._set_users_role_text_if_exists(conn, target_user_id, USER_ROLE_ADMIN)
-            self._log_admin_action(conn, admin_id, 'promote_to_admin', target_user_id, '{"action":"promote"}')
-            conn.commit()
+            with db_connection.transaction() as conn:
+                role_id = self._ensure_role_row(conn, USER_ROLE_ADMIN)
+                self._set_user_settings_role(conn, target_user_id, role_id)
+                self._set_users_role_text_if_exists(conn, target_user_id, USER_ROLE_ADMIN)
+                self._log_admin_action(conn, admin_id, 'promote_to_admin', target_user_id, '{"action":"promote"}')
+            invalidate_access(target_user_id)
             return True
         except Exception as e:
-            try: conn.rollback()
-            except Exception: pass
             logger.error(f"Promote to admin error: {e}")
             return False
 
     def demote_from_admin(self, target_user_id: int, admin_id: int) -> bool:
         if not self.authorize_user(admin_id, USER_ROLE_ADMIN):
             return False
-        conn = db_connection.get_connection()
         try:
-            role_id = self._ensure_role_row(conn, USER_ROLE_USER)
-            self._set_user_settings_role(conn, target_user_id, role_id)
-            self._set_users_role_text_if_exists(conn, target_user_id, USER_ROLE_USER)
-            self._log_admin_action(conn, admin_id, 'demote_from_admin', target_user_id, '{"action":"demote"}')
-            conn.commit()
+            with db_connection.transaction() as conn:
+                role_id = self._ensure_role_row(conn, USER_ROLE_USER)
+                self._set_user_settings_role(conn, target_user_id, role_id)
+                self._set_users_role_text_if_exists(conn, target_user_id, USER_ROLE_USER)
+                self._log_admin_action(conn, admin_id, 'demote_from_admin', target_user_id, '{"action":"demote"}')
+            invalidate_access(target_user_id)
             return True
         except Exception as e:
-            try: conn.rollback()
-            except Exception: pass
             logger.error(f"Demote from admin error: {e}")
             return False
 
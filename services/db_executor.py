@@ -0,0 +1,144 @@
+# services/db_executor.py
+# -*- coding: utf-8 -*-
+"""
+Ограниченный пул потоков для синхронных вызовов репозиториев из async-хендлеров.
+
+Пока слой БД синхронный (psycopg2), любой запрос внутри `async def` блокирует
+event loop python-telegram-bot. Хендлеры отдают такие вызовы сюда:
+
+    rows = await run_blocking(get_locations, on_date, group_key)
+
+или объявляют обёртку декоратором:
+
+    @offload
+    def _build_report(...): ...      # теперь это корутина
+    text = await _build_report(...)
+
+Число потоков ограничено (по умолчанию = размеру пула соединений), чтобы
+потоки не простаивали в ожидании соединения. stats() показывает глубину
+очереди и время ожидания — по ним видно, когда пул насыщается.
+"""
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class BlockingExecutor:
+    def __init__(self, max_workers: int, queue_warn: int = 0):
+        self._max_workers = max(1, int(max_workers))
+        self._queue_warn = int(queue_warn)
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+        # метрики
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._queued = 0
+        self._running = 0
+        self._peak_queued = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    def _ensure(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._max_workers,
+                        thread_name_prefix="db-worker",
+                    )
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Выполнить func(*args, **kwargs) в пуле потоков и дождаться результата."""
+        loop = asyncio.get_running_loop()
+        submitted = time.monotonic()
+        with self._lock:
+            self._submitted += 1
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+            queued = self._queued
+        if self._queue_warn and queued > self._queue_warn:
+            logger.warning("db executor: очередь %s задач (workers=%s)", queued, self._max_workers)
+
+        def _task():
+            started = time.monotonic()
+            waited = started - submitted
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    if not ok:
+                        self._failed += 1
+                    self._run_total += time.monotonic() - started
+
+        fut = self._ensure().submit(_task)
+        fut.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(fut, loop=loop)
+
+    def _on_done(self, fut) -> None:
+        # отменённая до старта задача (ожидающую корутину отменили) из очереди так и не вышла
+        if fut.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "workers": self._max_workers,
+                "queued": self._queued,
+                "running": self._running,
+                "peak_queued": self._peak_queued,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_avg_ms": (self._wait_total / started * 1000.0) if started else 0.0,
+                "wait_max_ms": self._wait_max * 1000.0,
+                "run_avg_ms": (self._run_total / self._completed * 1000.0) if self._completed else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Дождаться уже принятых задач (wait=True) и остановить потоки."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+db_executor = BlockingExecutor(config.DB_EXECUTOR_WORKERS, queue_warn=config.DB_EXECUTOR_QUEUE_WARN)
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Хелпер для хендлеров: await run_blocking(repo_func, ...)."""
+    return await db_executor.run(func, *args, **kwargs)
+
+
+def offload(func: Callable[..., Any]):
+    """Декоратор: синхронная функция → корутина, исполняемая в db_executor.
+    Исходная синхронная версия доступна как wrapper.sync."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await db_executor.run(func, *args, **kwargs)
+    wrapper.sync = func
+    return wrapper
@@ -0,0 +1,157 @@
+# services/export.py
+# -*- coding: utf-8 -*-
+"""
+Потоковая выгрузка таблиц в gzip CSV/JSONL.
+
+Строки читаются именованным (серверным) курсором пачками по EXPORT_FETCH_SIZE
+и сразу пишутся через gzip в SpooledTemporaryFile: пока файл маленький, он
+в памяти, большой — уходит на диск. Память не растёт с объёмом истории.
+
+    res = await run_blocking(export_entity, "duty_assignments", date(2024, 1, 1), date(2024, 12, 31))
+    try:
+        await update.message.reply_document(document=res.file, filename=res.filename)
+    finally:
+        res.file.close()
+"""
+import csv
+import gzip
+import io
+import json
+import logging
+import tempfile
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from database.connection import db_connection
+from database.schema import schema_caps
+from config import config
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+
+# таблица → (колонки по порядку, фильтр по датам или None, сортировка)
+# фильтр: одна колонка — дата в периоде; две — интервал пересекается с периодом
+ENTITIES: Dict[str, Tuple[Sequence[str], Optional[Tuple[str, ...]], str]] = {
+    "duty": (
+        ("id", "key", "title", "description", "weight", "office_required",
+         "target_rank", "min_rank", "kind", "is_active"),
+        None, "key",
+    ),
+    "duty_assignments": (
+        ("id", "duty_id", "group_key", "on_date", "user_id", "created_by"),
+        ("on_date",), "on_date, group_key, duty_id",
+    ),
+    "location_assignments": (
+        ("group_key", "on_date", "user_id", "location"),
+        ("on_date",), "on_date, group_key, user_id",
+    ),
+    "user_absences": (
+        ("id", "user_id", "absence_type", "date_from", "date_to", "comment",
+         "created_by", "is_deleted", "created_at", "updated_at"),
+        ("date_from", "date_to"), "date_from, id",
+    ),
+    "time_group_members": (
+        ("group_key", "user_id", "base_pos"),
+        None, "group_key, user_id",
+    ),
+}
+
+
+@dataclass
+class ExportResult:
+    file: Any          # SpooledTemporaryFile, позиция — в начале
+    filename: str
+    rows: int
+    compressed_bytes: int
+    date_filtered: bool
+
+
+def _columns(entity: str) -> List[str]:
+    wanted, _, _ = ENTITIES[entity]
+    have = schema_caps.columns(entity)
+    if not have:
+        raise ValueError(f"таблица {entity} не найдена")
+    return [c for c in wanted if c in have]
+
+
+def _query(entity: str, cols: List[str], date_from: Optional[date],
+           date_to: Optional[date]) -> Tuple[str, list, bool]:
+    _, date_cols, order = ENTITIES[entity]
+    where, params = [], []
+    if date_cols and (date_from or date_to):
+        lo_col, hi_col = date_cols[0], date_cols[-1]
+        if date_from:
+            where.append(f"{hi_col} >= %s"); params.append(date_from)
+        if date_to:
+            where.append(f"{lo_col} <= %s"); params.append(date_to)
+    sql = f"SELECT {', '.join(cols)} FROM {entity}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + f" ORDER BY {order}", params, bool(where)
+
+
+def _json_default(v):
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    return str(v)
+
+
+def _iter_rows(sql: str, params: list, name: str) -> Iterator[tuple]:
+    """Серверный курсор: в памяти только текущая пачка."""
+    size = int(config.EXPORT_FETCH_SIZE)
+    with db_connection.transaction() as conn:
+        with conn.cursor(name=name) as cur:
+            cur.itersize = size
+            cur.execute(sql, params)
+            while True:
+                chunk = cur.fetchmany(size)
+                if not chunk:
+                    break
+                yield from chunk
+
+
+def export_entity(entity: str, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                  fmt: str = "csv") -> ExportResult:
+    """
+    Выгрузить таблицу entity (ключ ENTITIES) в gzip-файл формата fmt.
+    Для таблиц без дат фильтр периода не применяется (date_filtered=False).
+    Файл (result.file) закрывает вызывающий.
+    """
+    if entity not in ENTITIES:
+        raise ValueError(f"неизвестная таблица: {entity} (доступны: {', '.join(ENTITIES)})")
+    if fmt not in FORMATS:
+        raise ValueError(f"неизвестный формат: {fmt} (доступны: {', '.join(FORMATS)})")
+
+    cols = _columns(entity)
+    sql, params, filtered = _query(entity, cols, date_from, date_to)
+    spool = tempfile.SpooledTemporaryFile(max_size=int(config.EXPORT_SPOOL_MAX_BYTES))
+    try:
+        rows = 0
+        with gzip.GzipFile(fileobj=spool, mode="wb", compresslevel=6) as gz, \
+                io.TextIOWrapper(gz, encoding="utf-8", newline="") as out:
+            if fmt == "csv":
+                writer = csv.writer(out)
+                writer.writerow(cols)
+                for row in _iter_rows(sql, params, f"export_{entity}"):
+                    writer.writerow(row)
+                    rows += 1
+            else:
+                for row in _iter_rows(sql, params, f"export_{entity}"):
+                    out.write(json.dumps(dict(zip(cols, row)), ensure_ascii=False, default=_json_default))
+                    out.write("\n")
+                    rows += 1
+        size = spool.tell()
+        spool.seek(0)
+
+        suffix = ""
+        if filtered:
+            suffix = f"_{date_from or ''}_{date_to or ''}".replace("-", "")
+        filename = f"{entity}{suffix}_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}.gz"
+        logger.info("Выгрузка %s: %s строк, %s байт gzip", entity, rows, size)
+        return ExportResult(file=spool, filename=filename, rows=rows,
+                            compressed_bytes=size, date_filtered=filtered)
+    except BaseException:
+        spool.close()
+        raise
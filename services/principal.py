@@ -0,0 +1,176 @@
+# services/principal.py
+# -*- coding: utf-8 -*-
+"""
+Principal — кто прислал апдейт: роль, одобрение, часовой пояс, группы, отсутствия.
+
+Создаётся в пре-хендлере (группа -1, см. main.setup_handlers) и кладётся в
+context.principal. Роль и одобрение берутся из кэша прав (database.access_cache):
+при попадании — без запроса в БД и без перехода в пул потоков, так что
+декораторы require_admin/require_approved на частом пути в БД не ходят:
+
+    p = await get_principal(update, context)
+    if not p.is_admin: ...
+
+Часовой пояс, группы и отсутствия («детали») загружаются одним запросом
+только там, где нужны: get_principal(update, context, details=True).
+
+Если пре-хендлер не отработал (например, хендлер вызван напрямую),
+get_principal() загрузит Principal сам и тоже сохранит в context.
+"""
+import json
+import logging
+from dataclasses import dataclass, field, replace
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.access_cache import command_access, peek_command_access
+from database.connection import db_connection
+from services.auth_manager import auth_manager, USER_ROLE_ADMIN, USER_ROLE_USER
+from services.db_executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: int
+    role: str = USER_ROLE_USER
+    is_approved: bool = False
+    tz_name: Optional[str] = None          # IANA или "FIXED:<часы>" (как _detect_user_tz_name)
+    memberships: Tuple[Tuple[str, int], ...] = ()   # (group_key, base_pos)
+    absences: Tuple[Dict[str, Any], ...] = field(default=(), repr=False)  # текущие и будущие
+    registered: bool = False
+    details: bool = False                  # tz_name/memberships/absences/registered загружены
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == USER_ROLE_ADMIN
+
+    @property
+    def group_keys(self) -> List[str]:
+        return [k for k, _ in self.memberships]
+
+    def absence_on(self, d: date) -> Optional[Dict[str, Any]]:
+        """Отсутствие на дату из загруженных (только date_to >= сегодня); None — не найдено."""
+        for a in self.absences:
+            if a["date_from"] <= d <= a["date_to"]:
+                return a
+        return None
+
+
+# users читаем через to_jsonb(u): так видны необязательные колонки
+# (tz, tz_name, tz_offset_hours) без отдельных проверок схемы.
+_DETAILS_SQL = """
+    SELECT to_jsonb(u) AS u,
+           COALESCE((
+               SELECT json_agg(json_build_array(tg.key, m.base_pos) ORDER BY tg.name)
+               FROM time_group_members m
+               JOIN time_groups tg ON tg.id = m.time_group_id
+               WHERE m.user_id = x.user_id
+           ), '[]'::json) AS memberships,
+           COALESCE((
+               SELECT json_agg(json_build_object(
+                          'id', a.id, 'absence_type', a.absence_type,
+                          'date_from', a.date_from, 'date_to', a.date_to, 'comment', a.comment
+                      ) ORDER BY a.date_from DESC, a.id DESC)
+               FROM user_absences a
+               WHERE a.user_id = x.user_id AND a.is_deleted = FALSE AND a.date_to >= CURRENT_DATE
+           ), '[]'::json) AS absences
+    FROM (SELECT %s::bigint AS user_id) x
+    LEFT JOIN users u ON u.user_id = x.user_id
+"""
+
+
+def _as_json(v):
+    return json.loads(v) if isinstance(v, str) else v
+
+
+def _tz_from_user_row(u: Dict[str, Any]) -> Optional[str]:
+    for col in ("tz", "tz_name"):
+        if u.get(col):
+            return str(u[col]).strip()
+    if u.get("tz_offset_hours") is not None:
+        try:
+            return f"FIXED:{int(u['tz_offset_hours'])}"
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def _from_access(user_id: int, access) -> Principal:
+    role, approved = access
+    is_admin = auth_manager._owner_or_config_admin(user_id) or role == USER_ROLE_ADMIN
+    return Principal(
+        user_id=int(user_id),
+        role=USER_ROLE_ADMIN if is_admin else USER_ROLE_USER,
+        is_approved=approved,
+    )
+
+
+def load_principal(user_id: int) -> Principal:
+    """Роль и одобрение из кэша прав (при промахе — запрос; вызывать через run_blocking)."""
+    return _from_access(user_id, command_access(user_id))
+
+
+def load_details(p: Principal) -> Principal:
+    """Дозагрузить часовой пояс, группы и отсутствия одним запросом (через run_blocking)."""
+    with db_connection.acquire() as conn, conn.cursor() as cur:
+        cur.execute(_DETAILS_SQL, (int(p.user_id),))
+        u, memberships, absences = cur.fetchone()
+
+    u = _as_json(u) or {}
+    abs_rows = []
+    for a in _as_json(absences) or []:
+        a["date_from"] = date.fromisoformat(a["date_from"])
+        a["date_to"] = date.fromisoformat(a["date_to"])
+        abs_rows.append(a)
+
+    return replace(
+        p,
+        tz_name=_tz_from_user_row(u),
+        memberships=tuple((str(k), int(pos or 0)) for k, pos in (_as_json(memberships) or [])),
+        absences=tuple(abs_rows),
+        registered=bool(u),
+        details=True,
+    )
+
+
+async def get_principal(update, context, details: bool = False) -> Optional[Principal]:
+    """Principal текущего апдейта (из context, либо загрузить и запомнить)."""
+    p = getattr(context, "principal", None)
+    if p is None:
+        user = getattr(update, "effective_user", None)
+        if user is None:
+            return None
+        access = peek_command_access(user.id)
+        if access is not None:
+            p = _from_access(user.id, access)
+        else:
+            p = await run_blocking(load_principal, user.id)
+        context.principal = p
+    if details and not p.details:
+        p = await run_blocking(load_details, p)
+        context.principal = p
+    return p
+
+
+async def caller_is_admin(update, context) -> bool:
+    """Замена локальных _is_admin(uid) в хендлерах: роль берётся из Principal апдейта."""
+    p = await get_principal(update, context)
+    return bool(p and p.is_admin)
+
+
+async def refresh_principal(update, context) -> Optional[Principal]:
+    """Перечитать Principal после изменения пользователя в этом же апдейте (например, /start)."""
+    context.principal = None
+    return await get_principal(update, context)
+
+
+async def principal_prehandler(update, context) -> None:
+    """TypeHandler(Update) в группе -1: загружает Principal до основных хендлеров."""
+    try:
+        await get_principal(update, context)
+    except Exception as e:
+        # не роняем апдейт: декораторы попробуют загрузить ещё раз
+        logger.error("principal load failed: %s", e)
+        context.principal = None
@@ -0,0 +1,120 @@
+# services/simulation.py
+# -*- coding: utf-8 -*-
+"""
+Симуляция (dry-run) распределения обязанностей и офис/дом на будущий период.
+
+Текущее состояние (ранги, исключения, отсутствия, курсоры, история, офис-дни)
+читается из БД несколькими запросами, дальше всё считается в памяти теми же
+правилами, что и боевые команды (logic.duty_planner, logic.location_planner).
+В БД ничего не пишется — можно сравнить правила до того, как их применять.
+
+    report = simulate(date(2025, 10, 1), date(2026, 9, 30), duty_mode="weighted")
+"""
+import logging
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from database.duty_repository import (
+    MAX_PLAN_DAYS, list_planning_duties, load_planner_state, on_duty_by_date, select_groups,
+)
+from database.location_repository import holiday_flags, office_days_before, get_location_cursors
+from logic.duty_planner import display_name, duty_weight, plan_day
+from logic.location_planner import LocationState, OFFICE, plan_group_day
+from logic.roster_engine import build_roster
+from config import config
+
+logger = logging.getLogger(__name__)
+
+DUTY_MODES = ("rr", "load", "weighted")
+
+
+def _spread(values: List[int]) -> Dict[str, int]:
+    if not values:
+        return {"min": 0, "max": 0, "spread": 0}
+    return {"min": min(values), "max": max(values), "spread": max(values) - min(values)}
+
+
+def simulate(date_from: date, date_to: date, group_key: Optional[str] = None,
+             duty_mode: str = "rr") -> Dict[str, Any]:
+    """
+    Прогон обязанностей (duty_mode: rr/load/weighted) и локаций по дням периода.
+    Возвращает:
+      {"date_from", "date_to", "days", "mode", "elapsed_ms",
+       "users": [{"user_id","name","duties","weight","office_days","weekend_duties","weekend_office"}],
+       "duties": {min,max,spread}, "weight": {...}, "office": {...}, "weekend": {...}}
+    """
+    if duty_mode not in DUTY_MODES:
+        raise ValueError(f"неизвестный режим: {duty_mode} (доступны: {', '.join(DUTY_MODES)})")
+    if date_to < date_from:
+        date_from, date_to = date_to, date_from
+    days = (date_to - date_from).days + 1
+    if days > MAX_PLAN_DAYS:
+        raise ValueError(f"слишком длинный период: {days} дн. (максимум {MAX_PLAN_DAYS})")
+
+    started = time.perf_counter()
+    groups = select_groups(group_key)
+    keys = [str(g["key"]) for g in groups]
+    weighted = duty_mode == "weighted"
+    duties = list_planning_duties()  # с весами каталога: нужны и для статистики
+    load_days = int(config.DUTY_FAIR_WINDOW_DAYS) if weighted else 30
+
+    names = {int(m["user_id"]): display_name(m) for g in groups for m in g["members"]}
+    stats = {uid: {"user_id": uid, "name": name, "duties": 0, "weight": 0,
+                   "office_days": 0, "weekend_duties": 0, "weekend_office": 0}
+             for uid, name in names.items()}
+
+    if groups:
+        duty_state = load_planner_state(keys, date_from, date_to, load_days=load_days,
+                                        with_history=(duty_mode != "rr"), user_ids=list(names))
+        loc_state = LocationState(office_days=office_days_before(keys, date_from),
+                                  cursors=get_location_cursors(keys))
+        holidays = holiday_flags(date_from, date_to)
+        weights = {int(d["id"]): duty_weight(d) for d in duties}
+
+        on_duty = on_duty_by_date(groups, date_from, date_to)
+        slotted = build_roster(groups, date_from, date_to, require_slot=True)
+        slots_by_group = {str(g["key"]): {s["pos"]: s for s in g.get("slots", [])} for g in groups}
+
+        for d in slotted.dates:
+            is_hol = holidays.get(d, d.weekday() >= 5)
+
+            # локации первыми: от них зависят обязанности с office_required
+            members_by_group: Dict[str, list] = {}
+            for info, m, slot in slotted.on_duty(d):
+                k = str(info["key"])
+                members_by_group.setdefault(k, []).append((int(m["user_id"]), slots_by_group[k][slot]))
+            day_locations: Dict[str, Dict[int, str]] = {}
+            for k, members in members_by_group.items():
+                for _, _, uid, loc in plan_group_day(loc_state, k, members, d, is_hol):
+                    day_locations.setdefault(k, {})[uid] = loc
+                    if loc == OFFICE and uid in stats:
+                        stats[uid]["office_days"] += 1
+                        if is_hol:
+                            stats[uid]["weekend_office"] += 1
+            duty_state.locations[d] = day_locations
+
+            if not duties:
+                continue
+            for duty_id, _, _, uid in plan_day(duty_state, on_duty.get(d, []), duties, d,
+                                               mode=duty_mode, load_days=load_days):
+                st = stats.setdefault(uid, {"user_id": uid, "name": str(uid), "duties": 0, "weight": 0,
+                                            "office_days": 0, "weekend_duties": 0, "weekend_office": 0})
+                st["duties"] += 1
+                st["weight"] += weights.get(duty_id, 0)
+                if is_hol:
+                    st["weekend_duties"] += 1
+
+    users = sorted(stats.values(), key=lambda s: (-s["weight"], -s["duties"], s["name"].lower()))
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "days": days,
+        "mode": duty_mode,
+        "elapsed_ms": (time.perf_counter() - started) * 1000.0,
+        "users": users,
+        "duties": _spread([u["duties"] for u in users]),
+        "weight": _spread([u["weight"] for u in users]),
+        "office": _spread([u["office_days"] for u in users]),
+        "weekend": _spread([u["weekend_duties"] + u["weekend_office"] for u in users]),
+    }
@@ -0,0 +1,238 @@
+# services/snapshot.py
+# -*- coding: utf-8 -*-
+"""
+Снимок данных бота и восстановление из него (перенос между окружениями,
+быстрая копия «на момент времени» без pg_dump всей базы).
+
+Формат файла (.stbsnap) — ZIP:
+  manifest.json           — версия формата, время, таблицы: колонки, строк, sha256;
+  <таблица>.copy          — данные в двоичном формате PostgreSQL COPY (deflate).
+Двоичный COPY компактнее CSV/JSON и не требует разбора в Python: и снимок,
+и восстановление идут потоком через copy_expert, сервер делает всю работу.
+
+Снимок читается в одной транзакции REPEATABLE READ — таблицы согласованы.
+Восстановление: сначала сверяются контрольные суммы и колонки, потом одной
+транзакцией TRUNCATE всех таблиц снимка → COPY FROM в порядке зависимостей →
+сдвиг последовательностей id. Любая ошибка — откат, база не меняется.
+
+CLI:
+    python -m services.snapshot snapshot  backup.stbsnap
+    python -m services.snapshot restore   backup.stbsnap
+    python -m services.snapshot verify    backup.stbsnap   # только контрольные суммы
+"""
+import hashlib
+import json
+import logging
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, List
+
+from database.connection import db_connection
+from database.schema import schema_caps
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+_CHUNK = 1024 * 1024
+
+# Порядок — родители раньше детей (для COPY при внешних ключах)
+SNAPSHOT_TABLES = (
+    "users",
+    "user_settings",
+    "user_roles",
+    "time_profiles",
+    "time_profile_slots",
+    "time_groups",
+    "time_group_members",
+    "group_time_link",
+    "user_custom_schedules",
+    "duty",
+    "duties",
+    "duty_assignments",
+    "location_assignments",
+    "user_absences",
+    "member_ranks",
+    "duty_exclusions",
+    "duty_rr_cursor",
+    "location_rr_cursor",
+    "ru_is_holiday",
+    "duty_load_counters",
+    "office_day_counters",
+    "admin_actions",
+)
+
+
+class _HashingWriter:
+    """Файл для copy_expert(TO STDOUT): пишет дальше и считает sha256/байты."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.sha.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def create_snapshot(path: str) -> Dict[str, Any]:
+    """Записать снимок всех имеющихся таблиц SNAPSHOT_TABLES в path. Возвращает манифест."""
+    schema_caps.refresh()
+    tables = [t for t in SNAPSHOT_TABLES if schema_caps.has_table(t)]
+    manifest: Dict[str, Any] = {
+        "format": FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "tables": [],
+    }
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf, \
+            db_connection.transaction() as conn, conn.cursor() as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        for table in tables:
+            cols = sorted(schema_caps.columns(table))
+            with zf.open(f"{table}.copy", "w", force_zip64=True) as member:
+                out = _HashingWriter(member)
+                cur.copy_expert(
+                    f"COPY {_ident(table)} ({', '.join(map(_ident, cols))}) TO STDOUT WITH (FORMAT binary)",
+                    out,
+                )
+            cur.execute(f"SELECT COUNT(*) FROM {_ident(table)}")
+            manifest["tables"].append({
+                "name": table,
+                "columns": cols,
+                "rows": int(cur.fetchone()[0]),
+                "bytes": out.size,
+                "sha256": out.sha.hexdigest(),
+            })
+        zf.writestr(MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=1))
+    logger.info("Снимок %s: %s таблиц, %s строк", path, len(tables),
+                sum(t["rows"] for t in manifest["tables"]))
+    return manifest
+
+
+def read_manifest(zf: zipfile.ZipFile) -> Dict[str, Any]:
+    try:
+        manifest = json.loads(zf.read(MANIFEST).decode("utf-8"))
+    except KeyError:
+        raise ValueError("это не снимок бота: нет manifest.json")
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"неподдерживаемая версия снимка: {manifest.get('format')}")
+    return manifest
+
+
+def verify_snapshot(zf: zipfile.ZipFile, manifest: Dict[str, Any]) -> None:
+    """Контрольные суммы всех таблиц и наличие колонок в текущей базе; ValueError при расхождении."""
+    schema_caps.refresh()
+    for t in manifest["tables"]:
+        name = t["name"]
+        if name not in SNAPSHOT_TABLES:
+            raise ValueError(f"{name}: таблица не из списка снимка")
+        sha = hashlib.sha256()
+        with zf.open(f"{name}.copy") as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b""):
+                sha.update(chunk)
+        if sha.hexdigest() != t["sha256"]:
+            raise ValueError(f"{name}: контрольная сумма не совпадает — файл повреждён")
+        if not schema_caps.has_table(name):
+            raise ValueError(f"{name}: таблицы нет в этой базе")
+        missing = set(t["columns"]) - schema_caps.columns(name)
+        if missing:
+            raise ValueError(f"{name}: нет колонок {', '.join(sorted(missing))}")
+
+
+def _reset_sequences(cur, tables: List[Dict[str, Any]]) -> None:
+    for t in tables:
+        if "id" not in t["columns"]:
+            continue
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (t["name"],))
+        seq = cur.fetchone()[0]
+        if seq:
+            cur.execute(
+                f"SELECT setval(%s, COALESCE((SELECT MAX(id) FROM {_ident(t['name'])}), 0) + 1, false)",
+                (seq,),
+            )
+
+
+def _invalidate_caches() -> None:
+    """После восстановления все кэши процесса устарели."""
+    from database.roster_cache import invalidate_roster
+    from database.access_cache import invalidate_access
+    from database.username_index import invalidate_username_index
+    from database.location_repository import bump_locations_version
+    from database.holiday_calendar import holiday_calendar
+
+    schema_caps.invalidate()
+    invalidate_roster()
+    invalidate_access()
+    invalidate_username_index()
+    bump_locations_version()
+    holiday_calendar.invalidate()
+
+
+def restore_snapshot(path: str) -> Dict[str, Any]:
+    """
+    Заменить данные таблиц снимка содержимым файла (одна транзакция).
+    Таблицы, которых нет в снимке, не трогаются. Возвращает манифест.
+    """
+    with zipfile.ZipFile(path, "r") as zf:
+        manifest = read_manifest(zf)
+        verify_snapshot(zf, manifest)
+        order = {name: i for i, name in enumerate(SNAPSHOT_TABLES)}
+        tables = sorted(manifest["tables"], key=lambda t: order[t["name"]])
+        if not tables:
+            return manifest
+
+        with db_connection.transaction() as conn, conn.cursor() as cur:
+            cur.execute("TRUNCATE " + ", ".join(_ident(t["name"]) for t in tables))
+            for t in tables:
+                with zf.open(f"{t['name']}.copy") as f:
+                    cur.copy_expert(
+                        f"COPY {_ident(t['name'])} ({', '.join(map(_ident, t['columns']))}) "
+                        f"FROM STDIN WITH (FORMAT binary)",
+                        f, size=_CHUNK,
+                    )
+                if cur.rowcount >= 0 and cur.rowcount != t["rows"]:
+                    raise ValueError(f"{t['name']}: загружено {cur.rowcount} строк вместо {t['rows']}")
+            _reset_sequences(cur, tables)
+
+    _invalidate_caches()
+    logger.warning("Восстановлено из снимка %s (%s): %s таблиц, %s строк", path,
+                   manifest.get("created_at"), len(tables), sum(t["rows"] for t in tables))
+    return manifest
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m services.snapshot",
+                                     description="Снимок/восстановление данных бота")
+    parser.add_argument("action", choices=("snapshot", "restore", "verify"))
+    parser.add_argument("path")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        if args.action == "snapshot":
+            manifest = create_snapshot(args.path)
+        elif args.action == "restore":
+            manifest = restore_snapshot(args.path)
+        else:
+            with zipfile.ZipFile(args.path, "r") as zf:
+                manifest = read_manifest(zf)
+                verify_snapshot(zf, manifest)
+        for t in manifest["tables"]:
+            print(f"{t['name']:<24} {t['rows']:>10} строк  {t['bytes']:>12} байт")
+    finally:
+        db_connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
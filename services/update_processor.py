@@ -0,0 +1,68 @@
+# services/update_processor.py
+# -*- coding: utf-8 -*-
+"""
+Параллельная обработка обновлений с порядком внутри чата.
+
+PTB с concurrent_updates=N запускает до N обработчиков одновременно, но
+тогда два сообщения одного чата могут обработаться в обратном порядке
+(например, /duty_import и следом файл). PerChatUpdateProcessor держит
+asyncio.Lock на чат: разные чаты идут параллельно (до max_concurrent_updates),
+один чат — строго по очереди. asyncio.Lock честный (FIFO), а задачи PTB
+создаёт в порядке получения обновлений, так что порядок сохраняется.
+
+Замок чата берётся ДО общего слота (семафора BaseUpdateProcessor): слот
+занимает только голова очереди чата. Иначе пачка обновлений одного чата
+заняла бы все слоты ожиданием своего замка и остановила остальные чаты.
+
+Начатые обновления при остановке дожидается сам Application.stop().
+"""
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def _chat_key(update: object) -> Optional[int]:
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiting: Dict[int, int] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._locks.clear()
+        self._waiting.clear()
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = _chat_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+        try:
+            async with lock:
+                # слот берёт super() — только когда подошла очередь этого чата
+                await super().process_update(update, coroutine)
+        finally:
+            self._waiting[key] -= 1
+            if not self._waiting[key]:
+                # в очереди чата никого — замок больше не нужен
+                del self._waiting[key]
+                self._locks.pop(key, None)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
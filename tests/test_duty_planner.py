@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+plan_day поверх собранного вручную PlannerState — те же правила, что у прежних
+auto_assign_for_date_rr (кольцо по отсортированному пулу) и auto_assign_for_date
+(реже назначавшийся, при равенстве — по имени).
+"""
+from datetime import date, timedelta
+
+from logic.duty_planner import PlannerState, next_in_ring, plan_day, rank_ok
+
+D = date(2025, 3, 10)
+G = "grp_a"
+
+
+def member(uid, first, rank=2):
+    return {"user_id": uid, "first_name": first, "last_name": "", "username": "", "rank": rank}
+
+
+def duty(duty_id, kind="specialist", min_rank=2):
+    return {"id": duty_id, "kind": kind, "min_rank": min_rank, "is_active": True}
+
+
+ANNA, BORIS, VERA = member(1, "Anna"), member(2, "Boris"), member(3, "Vera")
+
+
+# ---------- round-robin ----------
+
+def test_next_in_ring_wraps_around():
+    assert next_in_ring([1, 2, 3], 2) == 3
+    assert next_in_ring([1, 2, 3], 3) == 1
+
+
+def test_next_in_ring_starts_from_first_without_cursor_or_when_cursor_left():
+    assert next_in_ring([4, 7], None) == 4
+    assert next_in_ring([4, 7], 5) == 4
+
+
+def test_rr_wraps_and_moves_cursor():
+    state = PlannerState(cursors={(G, 10): 3})
+    out = plan_day(state, [(G, [VERA, ANNA, BORIS])], [duty(10)], D, mode="rr")
+    assert out == [(10, G, D, 1)]
+    assert state.cursors[(G, 10)] == 1
+    assert state.cursor_rows() == [(G, 10, 1)]
+
+
+def test_rr_cursor_user_left_pool_restarts_from_first():
+    # курсор на Борисе, но он в отпуске — пул [1, 3], начинаем с первого
+    state = PlannerState(cursors={(G, 10): 2}, absences={2: [(D, D)]})
+    out = plan_day(state, [(G, [ANNA, BORIS, VERA])], [duty(10)], D, mode="rr")
+    assert out == [(10, G, D, 1)]
+
+
+def test_rr_consecutive_days_walk_the_ring():
+    state = PlannerState()
+    picks = []
+    for i in range(4):
+        out = plan_day(state, [(G, [ANNA, BORIS, VERA])], [duty(10)], D + timedelta(days=i), mode="rr")
+        picks.append(out[0][3])
+    assert picks == [1, 2, 3, 1]
+
+
+# ---------- load ----------
+
+def test_load_prefers_least_loaded():
+    history = {(G, 10, 1): [D - timedelta(days=1)], (G, 10, 2): [D - timedelta(days=2)]}
+    state = PlannerState(history=history)
+    out = plan_day(state, [(G, [ANNA, BORIS, VERA])], [duty(10)], D, mode="load")
+    assert out == [(10, G, D, 3)]
+
+
+def test_load_tie_break_by_name_not_user_id():
+    zoe, adam = member(1, "Zoe"), member(9, "Adam")
+    state = PlannerState()
+    out = plan_day(state, [(G, [zoe, adam])], [duty(10)], D, mode="load")
+    assert out == [(10, G, D, 9)]
+
+
+def test_load_ignores_history_outside_window():
+    history = {(G, 10, 1): [D - timedelta(days=31)], (G, 10, 2): [D - timedelta(days=5)]}
+    state = PlannerState(history=history)
+    out = plan_day(state, [(G, [BORIS, ANNA])], [duty(10)], D, mode="load", load_days=30)
+    assert out == [(10, G, D, 1)]
+
+
+def test_load_records_assignment_for_next_day():
+    state = PlannerState()
+    first = plan_day(state, [(G, [ANNA, BORIS])], [duty(10)], D, mode="load")
+    second = plan_day(state, [(G, [ANNA, BORIS])], [duty(10)], D + timedelta(days=1), mode="load")
+    assert [first[0][3], second[0][3]] == [1, 2]
+
+
+# ---------- фильтры ----------
+
+def test_excluded_member_is_skipped():
+    state = PlannerState(exclusions={1: [(G, D, D)]})
+    out = plan_day(state, [(G, [ANNA, BORIS])], [duty(10)], D, mode="load")
+    assert out == [(10, G, D, 2)]
+
+
+def test_exclusion_without_group_applies_everywhere_and_other_group_does_not():
+    state = PlannerState(exclusions={1: [(None, D, D)], 2: [("other", D, D)]})
+    out = plan_day(state, [(G, [ANNA, BORIS])], [duty(10)], D, mode="load")
+    assert out == [(10, G, D, 2)]
+
+
+def test_exclusion_outside_dates_does_not_apply():
+    state = PlannerState(exclusions={1: [(G, D - timedelta(days=3), D - timedelta(days=1))]})
+    assert state.is_available(G, 1, D)
+
+
+def test_absent_member_is_skipped_and_nobody_left_means_no_assignment():
+    state = PlannerState(absences={1: [(D - timedelta(days=2), D + timedelta(days=2))]})
+    assert plan_day(state, [(G, [ANNA])], [duty(10)], D, mode="rr") == []
+    assert state.cursors == {}
+
+
+# ---------- ранги ----------
+
+def test_rank_ok_leader_duty_needs_rank_one():
+    leader = duty(1, kind="leader")
+    assert rank_ok(leader, 1)
+    assert not rank_ok(leader, 2)
+
+
+def test_rank_ok_specialist_uses_min_rank_with_default():
+    assert rank_ok(duty(1, min_rank=3), 3)
+    assert not rank_ok(duty(1, min_rank=None), 3)
+    assert rank_ok(duty(1, min_rank=None), 2)
+
+
+def test_leader_duty_goes_to_leader_from_member_ranks_override():
+    # в карточке Вера — junior, но member_ranks делает её лидером
+    state = PlannerState(ranks={(G, 3): 1})
+    out = plan_day(state, [(G, [ANNA, BORIS, member(3, "Vera", rank=3)])],
+                   [duty(5, kind="leader")], D, mode="load")
+    assert out == [(5, G, D, 3)]
+
+
+def test_leader_duty_skipped_without_leaders():
+    state = PlannerState()
+    assert plan_day(state, [(G, [ANNA, BORIS])], [duty(5, kind="leader")], D, mode="rr") == []
+
+
+def test_inactive_duty_is_skipped():
+    d = duty(10)
+    d["is_active"] = False
+    assert plan_day(PlannerState(), [(G, [ANNA])], [d], D) == []
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""slot_matrix/build_roster против поэлементной арифметики цикла Д1-Д2-Н1-Н2(-отдых)."""
+from datetime import date, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from logic.roster_engine import REST, build_roster, slot_matrix  # noqa: E402
+
+EPOCH = date(2025, 1, 1)
+
+
+def expected_slot(epoch, period, base_pos, day):
+    phase = (day - epoch).days % (8 if period == 8 else 4)
+    return {0: base_pos, 1: 1 - base_pos, 2: base_pos + 2, 3: 3 - base_pos}.get(phase, REST)
+
+
+@pytest.mark.parametrize("period", [4, 8])
+@pytest.mark.parametrize("base_pos", [0, 1])
+def test_slot_matrix_matches_scalar_cycle(period, base_pos):
+    start = EPOCH - timedelta(days=5)   # в том числе даты до эпохи
+    m = slot_matrix([EPOCH], [period], [base_pos], start, 20)
+    got = m[0].tolist()
+    want = [expected_slot(EPOCH, period, base_pos, start + timedelta(days=j)) for j in range(20)]
+    assert got == want
+
+
+def test_tz_offset_shifts_local_day():
+    plain = slot_matrix([EPOCH], [8], [0], EPOCH, 8)
+    east = slot_matrix([EPOCH], [8], [0], EPOCH, 8, tz_offset_hours=[12])
+    assert east[0].tolist() == np.roll(plain[0], -1).tolist()
+
+
+def test_build_roster_require_slot_drops_missing_profile_slots():
+    group = {"key": "g", "epoch": EPOCH, "period": 4, "slots": [{"pos": 0}],
+             "members": [{"user_id": 1, "base_pos": 0}]}
+    roster = build_roster([group], EPOCH, EPOCH + timedelta(days=3), require_slot=True)
+    assert roster.slots[0].tolist() == [0, REST, REST, REST]
+    assert [m["user_id"] for _, m, _ in roster.on_duty(EPOCH)] == [1]
+    assert roster.on_duty(EPOCH + timedelta(days=1)) == []
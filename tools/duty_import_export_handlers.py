@@ -4,6 +4,7 @@
 import os
 import csv
 import io
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Dict
 
@@ -18,6 +19,8 @@ from telegram.ext import (
     filters,
 )
 
+from services.db_executor import run_blocking
+
 # ===== Авторизация (админ) =====
 try:
     from utils.auth import require_admin
@@ -34,59 +37,132 @@ WAITING_FILE = 1
 BASE_COLS = ["key", "title", "weight", "office_required", "target_rank", "min_rank", "description"]
 
 # ===== Подключение к БД через общий коннектор =====
+@contextmanager
 def get_conn():
-    """Берём соединение из database.connection.db_connection.
+    """Берём соединение из пула database.connection.db_connection на время блока with.
     Если модуль недоступен — используем DATABASE_URL/DB_DSN как фоллбэк.
     """
     try:
         from database.connection import db_connection
-        conn = db_connection.get_connection()
-        if conn is None or getattr(conn, "closed", 1) != 0:
-            conn = db_connection.connect()
-        if not getattr(conn, "autocommit", False):
-            conn.autocommit = True
-        return conn
     except Exception as e:
         dsn = os.getenv("DATABASE_URL") or os.getenv("DB_DSN")
         if not dsn:
             raise RuntimeError("Нет подключения через database.connection и не задано DATABASE_URL/DB_DSN") from e
         conn = psycopg2.connect(dsn)
         conn.autocommit = True
-        return conn
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+    with db_connection.acquire() as conn:
+        yield conn
+
+@contextmanager
+def get_tx():
+    """Соединение в транзакции (commit в конце блока, rollback при ошибке)."""
+    try:
+        from database.connection import db_connection
+    except Exception as e:
+        dsn = os.getenv("DATABASE_URL") or os.getenv("DB_DSN")
+        if not dsn:
+            raise RuntimeError("Нет подключения через database.connection и не задано DATABASE_URL/DB_DSN") from e
+        conn = psycopg2.connect(dsn)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+        return
+    with db_connection.transaction() as conn:
+        yield conn
 
 # ===== Бизнес-логика импорта/экспорта =====
-def _coerce_int_or_none(v):
-    if v is None:
-        return None
-    s = str(v).strip()
+_TRUE = ("1", "true", "t", "yes", "y", "да", "истина")
+_FALSE = ("0", "false", "f", "no", "n", "нет", "ложь", "")
+
+STAGE_COLS = ["key", "title", "description", "weight", "office_required", "target_rank", "min_rank"]
+
+def _parse_int(v, field: str, lo=None, hi=None):
+    s = (v or "").strip()
     if s == "" or s.lower() in ("none", "nan"):
         return None
     try:
-        return int(float(s))
-    except Exception:
-        return None
+        n = int(float(s))
+    except ValueError:
+        raise ValueError(f"{field}: «{s}» — не число")
+    if (lo is not None and n < lo) or (hi is not None and n > hi):
+        raise ValueError(f"{field}: {n} вне диапазона {lo}..{hi}")
+    return n
 
-def _coerce_bool(v):
-    if v is None: return False
-    s = str(v).strip().lower()
-    return s in ("1", "true", "t", "yes", "y", "да", "истина")
-
-def _upsert_duty(cur, row: Dict) -> int:
-    weight = _coerce_int_or_none(row.get("weight")) or 10
-    office_required = _coerce_bool(row.get("office_required"))
-    target_rank = _coerce_int_or_none(row.get("target_rank"))
-    min_rank = _coerce_int_or_none(row.get("min_rank"))
-    description = (row.get("description") or "").strip()
+def _parse_bool(v, field: str) -> bool:
+    s = (v or "").strip().lower()
+    if s in _TRUE:
+        return True
+    if s in _FALSE:
+        return False
+    raise ValueError(f"{field}: «{s}» — ожидалось 1/0, yes/no, да/нет")
+
+def validate_row(row: Dict) -> list:
+    """Строка CSV → значения STAGE_COLS; ValueError с причиной, если строка плохая."""
     key = (row.get("key") or "").strip()
     title = (row.get("title") or "").strip()
-
     if not key or not title:
         raise ValueError("key/title не должны быть пустыми")
+    weight = _parse_int(row.get("weight"), "weight", 0)
+    return [
+        key,
+        title,
+        (row.get("description") or "").strip(),
+        10 if weight is None else weight,
+        _parse_bool(row.get("office_required"), "office_required"),
+        _parse_int(row.get("target_rank"), "target_rank", 1, 3),
+        _parse_int(row.get("min_rank"), "min_rank", 1, 3),
+    ]
+
+def parse_csv_stream(stream) -> tuple:
+    """
+    Потоково читаем CSV (текстовый поток) и сразу пишем годные строки в CSV-буфер для COPY.
+    → (буфер, число строк, ошибки ["строка N: причина"]). Повтор key — берётся последняя строка.
+    """
+    reader = csv.DictReader(stream)
+    fields = reader.fieldnames or []
+    if "key" not in fields or "title" not in fields:
+        raise ValueError("CSV должен содержать как минимум колонки: key,title")
+
+    valid: Dict[str, list] = {}
+    errors = []
+    for row in reader:
+        lineno = reader.line_num
+        try:
+            values = validate_row(row)
+        except ValueError as e:
+            errors.append(f"строка {lineno}: {e}")
+            continue
+        if values[0] in valid:
+            errors.append(f"строка {lineno}: повтор key «{values[0]}», берётся эта строка")
+        valid[values[0]] = values
 
-    cur.execute(
-        """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for values in valid.values():
+        # пустое поле в COPY csv — NULL
+        writer.writerow(["" if v is None else v for v in values])
+    buf.seek(0)
+    return buf, len(valid), errors
+
+_MERGE_SQL = """
+    WITH up AS (
         INSERT INTO duty (key, title, description, weight, office_required, target_rank, min_rank, is_active)
-        VALUES (%(key)s, %(title)s, %(description)s, %(weight)s, %(office_required)s, %(target_rank)s, %(min_rank)s, TRUE)
+        SELECT s.key, s.title, COALESCE(s.description, ''), s.weight, s.office_required, s.target_rank, s.min_rank, TRUE
+        FROM duty_import_stage s
+        LEFT JOIN duty d ON d.key = s.key
+        WHERE d.key IS NULL
+           OR (d.title, d.description, d.weight, d.office_required,
+               d.target_rank, d.min_rank, d.is_active)
+              IS DISTINCT FROM
+              (s.title, COALESCE(s.description, ''), s.weight, s.office_required,
+               COALESCE(s.target_rank, d.target_rank), COALESCE(s.min_rank, d.min_rank), TRUE)
         ON CONFLICT (key) DO UPDATE SET
           title = EXCLUDED.title,
           description = EXCLUDED.description,
@@ -95,46 +171,47 @@ def _upsert_duty(cur, row: Dict) -> int:
           target_rank = COALESCE(EXCLUDED.target_rank, duty.target_rank),
           min_rank = COALESCE(EXCLUDED.min_rank, duty.min_rank),
           is_active = TRUE
-        RETURNING id;
-        """,
-        {
-            "key": key,
-            "title": title,
-            "description": description,
-            "weight": weight,
-            "office_required": office_required,
-            "target_rank": target_rank,
-            "min_rank": min_rank,
-        },
+        RETURNING (xmax = 0) AS inserted
     )
-    duty_id = cur.fetchone()[0]
-    return duty_id
+    SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM up
+"""
 
-def import_csv_bytes(data: bytes) -> Dict[str,int]:
-    """Парсим CSV (только базовые колонки) и импортируем. Возвращаем статистику."""
-    reader = csv.DictReader(io.StringIO(data.decode("utf-8")))
-    if "key" not in reader.fieldnames or "title" not in reader.fieldnames:
-        raise ValueError("CSV должен содержать как минимум колонки: key,title")
+def import_csv_bytes(data: bytes) -> Dict:
+    """
+    Импорт каталога: потоковый разбор и проверка CSV → COPY во временную таблицу →
+    один INSERT … SELECT … ON CONFLICT в duty. Всё в одной транзакции.
+    Возвращает {"duties", "inserted", "updated", "unchanged", "errors"}.
+    """
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+    buf, total, errors = parse_csv_stream(stream)
+    res = {"duties": total, "inserted": 0, "updated": 0, "unchanged": 0, "errors": errors}
+    if not total:
+        return res
 
-    cnt_duties = 0
-    conn = get_conn()
-    with conn.cursor() as cur:
-        for row in reader:
-            base_row = {k: row.get(k) for k in BASE_COLS}
-            _upsert_duty(cur, base_row)
-            cnt_duties += 1
-        try:
-            if not getattr(conn, "autocommit", False):
-                conn.commit()
-        except Exception:
-            pass
-    return {"duties": cnt_duties}
+    with get_tx() as conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE duty_import_stage (
+                key             TEXT PRIMARY KEY,
+                title           TEXT NOT NULL,
+                description     TEXT,
+                weight          INTEGER NOT NULL,
+                office_required BOOLEAN NOT NULL,
+                target_rank     INTEGER,
+                min_rank        INTEGER
+            ) ON COMMIT DROP
+        """)
+        cur.copy_expert(
+            f"COPY duty_import_stage ({', '.join(STAGE_COLS)}) FROM STDIN WITH (FORMAT csv)", buf
+        )
+        cur.execute(_MERGE_SQL)
+        inserted, updated = cur.fetchone()
+    res.update(inserted=int(inserted), updated=int(updated), unchanged=total - int(inserted) - int(updated))
+    return res
 
 def export_to_csv_bytes() -> bytes:
     """Экспорт duty в CSV (только базовые колонки)."""
     header = BASE_COLS
-    conn = get_conn()
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+    with get_conn() as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
         cur.execute(
             """
             SELECT key, title, weight, office_required, target_rank, min_rank, description
@@ -184,12 +261,21 @@ async def duty_import_file(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     tgfile = await doc.get_file()
     file_bytes = await tgfile.download_as_bytearray()
     try:
-        stats = import_csv_bytes(bytes(file_bytes))
+        stats = await run_blocking(import_csv_bytes, bytes(file_bytes))
     except Exception as e:
         await update.message.reply_text(f"❌ Импорт не удался: {e}")
         return ConversationHandler.END
 
-    await update.message.reply_text(f"✅ Импорт завершён: {stats['duties']} обязанностей.")
+    lines = [
+        f"✅ Импорт завершён: {stats['duties']} обязанностей "
+        f"(новых {stats['inserted']}, обновлено {stats['updated']}, без изменений {stats['unchanged']})."
+    ]
+    if stats["errors"]:
+        lines.append(f"⚠️ Замечаний: {len(stats['errors'])}")
+        lines += [f"• {e}" for e in stats["errors"][:20]]
+        if len(stats["errors"]) > 20:
+            lines.append(f"… и ещё {len(stats['errors']) - 20}")
+    await update.message.reply_text("\n".join(lines))
     ctx.user_data["awaiting_duty_import"] = False
     return ConversationHandler.END
 
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Небольшой in-process кэш: TTL + вытеснение LRU + single-flight.
+
+    _cache = TTLCache("overview", maxsize=64, ttl=60)
+
+    # из потока (репозитории, run_blocking)
+    value = _cache.get_or_compute(key, lambda: build(...))
+
+    # из корутины: пока значение считается, остальные ждут тот же результат
+    value = await _cache.get_or_compute_async(key, lambda: run_blocking(build, ...))
+
+Ключ должен включать всё, от чего зависит значение (например, номера версий
+данных) — тогда устаревшие записи просто перестают запрашиваться и уходят по LRU/TTL.
+Все созданные кэши регистрируются и видны в all_caches() (для /admin_perf).
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+_MISSING = object()
+_registry: List["TTLCache"] = []
+_registry_lock = threading.Lock()
+
+
+class TTLCache:
+    def __init__(self, name: str, maxsize: int = 128, ttl: float = 60.0):
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, threading.Event] = {}
+        self._inflight_async: Dict[Hashable, asyncio.Future] = {}
+
+        # метрики
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0  # запросы, дождавшиеся чужого вычисления
+
+        with _registry_lock:
+            _registry.append(self)
+
+    # --- базовые операции ---
+    def _get_locked(self, key) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return _MISSING
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key, default=None) -> Any:
+        with self._lock:
+            value = self._get_locked(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None) -> Any:
+        """Как get(), но промах не считается: следом обычно идёт get_or_compute()."""
+        with self._lock:
+            value = self._get_locked(key)
+            if value is _MISSING:
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=_MISSING) -> None:
+        """Удалить одну запись или (без аргумента) весь кэш."""
+        with self._lock:
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    clear = invalidate
+
+    # --- single-flight ---
+    def get_or_compute(self, key, compute: Callable[[], Any]) -> Any:
+        """Синхронный вариант: конкурентные потоки с тем же ключом ждут одного вычисления."""
+        while True:
+            with self._lock:
+                value = self._get_locked(key)
+                if value is not _MISSING:
+                    self.hits += 1
+                    return value
+                event = self._inflight.get(key)
+                if event is None:
+                    self.misses += 1
+                    event = self._inflight[key] = threading.Event()
+                    owner = True
+                else:
+                    self.coalesced += 1
+                    owner = False
+            if not owner:
+                event.wait()
+                continue  # берём результат из кэша (или считаем сами, если владелец упал)
+            try:
+                value = compute()
+                self.set(key, value)
+                return value
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                event.set()
+
+    async def get_or_compute_async(self, key, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Асинхронный вариант: конкурентные корутины с тем же ключом ждут одну задачу."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                value = self._get_locked(key)
+                if value is not _MISSING:
+                    self.hits += 1
+                    return value
+                fut = self._inflight_async.get(key)
+                owner = fut is None
+                if owner:
+                    self.misses += 1
+                    fut = self._inflight_async[key] = loop.create_future()
+                else:
+                    self.coalesced += 1
+            if not owner:
+                value = await asyncio.shield(fut)
+                if value is _MISSING:
+                    continue  # владельца отменили — считаем сами (или ждём нового владельца)
+                return value
+            try:
+                value = await compute()
+            except asyncio.CancelledError:
+                # отмена касается только владельца: ожидающие не должны получить CancelledError
+                fut.set_result(_MISSING)
+                raise
+            except Exception as e:
+                fut.set_exception(e)
+                fut.exception()  # помечаем как полученное, если никто не ждал
+                raise
+            else:
+                self.set(key, value)
+                fut.set_result(value)
+                return value
+            finally:
+                with self._lock:
+                    self._inflight_async.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+def all_caches() -> List[TTLCache]:
+    with _registry_lock:
+        return list(_registry)
+
+
+def find_cache(name: str) -> Optional[TTLCache]:
+    return next((c for c in all_caches() if c.name == name), None)
@@ -4,35 +4,17 @@ import functools
 import logging
 from typing import Callable, Any, Awaitable
 
-from database.connection import db_connection
-from services.auth_manager import auth_manager  # единый источник прав
+from services.principal import get_principal  # роль/одобрение — из context, один запрос на апдейт
 
 logger = logging.getLogger(__name__)
 
-async def _is_user_approved(user_id: int) -> bool:
-    try:
-        conn = db_connection.get_connection()
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT 1 FROM information_schema.columns
-                WHERE table_schema='public' AND table_name='users' AND column_name='is_approved'
-                LIMIT 1
-            """)
-            if cur.fetchone() is None:
-                return True
-            cur.execute("SELECT is_approved FROM users WHERE user_id=%s LIMIT 1", (user_id,))
-            row = cur.fetchone()
-            return bool(row and row[0])
-    except Exception as e:
-        logger.error("approved check failed: %s", e)
-        return True
-
 def require_admin(func: Callable[..., Awaitable[Any]]):
     @functools.wraps(func)
     async def wrapper(update, context, *args, **kwargs):
         uid = update.effective_user.id if update and update.effective_user else None
         try:
-            if uid is None or not auth_manager.is_admin(uid):
+            principal = await get_principal(update, context) if uid is not None else None
+            if principal is None or not principal.is_admin:
                 await update.message.reply_text(
                     "❌ Недостаточно прав для выполнения этой команды.\nОбратитесь к администратору."
                 )
@@ -51,9 +33,10 @@ def require_approved(func: Callable[..., Awaitable[Any]]):
             if uid is None:
                 await update.message.reply_text("❌ Не удалось определить пользователя.")
                 return
-            if auth_manager.is_admin(uid):
+            principal = await get_principal(update, context)
+            if principal.is_admin:
                 return await func(update, context, *args, **kwargs)
-            if not await _is_user_approved(uid):
+            if not principal.is_approved:
                 await update.message.reply_text("⏳ Ваш аккаунт ещё не одобрен.")
                 return
             return await func(update, context, *args, **kwargs)